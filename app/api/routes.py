@@ -1,17 +1,26 @@
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Response
 from pydantic import BaseModel, Field
 from typing import List, Dict, Any, Optional
 import os
 import json
-from openai import OpenAI
 import logging
-import asyncio
 from fastapi.responses import StreamingResponse
 
 from app.services.mcp_service import MCPService, get_mcp_service
+from app.services.llm_client import LLMService, get_llm_service
+from app.services.tool_executor import ToolExecutor
+from app.services.agent_loop import AgentLoop
+from app.services.metrics import STREAM_TOKENS_PER_SECOND, ACTIVE_STREAMS, record_error
+from app.services.tracing import tracer, InMemoryExporter
+from app.services.logging_utils import SampledLogger
+from app.services.response_cache import response_cache, chat_cache_key
+from app.services.conversation_store import Conversation, conversation_store
+from app.services.context_window import context_window
 
 # 配置日志
 logger = logging.getLogger("app.api")
+# 每个请求都会执行的日志按采样率记录
+hot_logger = SampledLogger(logger)
 
 router = APIRouter()
 
@@ -25,6 +34,12 @@ class ChatRequest(BaseModel):
     mcp_config: Optional[Dict[str, Any]] = None
     model: str = "doubao-1-5-pro-32k-250115"
     stream: bool = False
+    # 设置后历史保存在服务端，messages只需包含本轮的新消息
+    conversation_id: Optional[str] = None
+    # 客户端已与该会话进行过对话；服务端没有该会话的记录时返回409，客户端随后带上history重试
+    continued: bool = False
+    # 客户端保存的历史，仅在收到409后重试时发送，用于恢复服务端的会话
+    history: Optional[List[Message]] = None
 
 class FunctionCall(BaseModel):
     name: str
@@ -39,13 +54,23 @@ class ChatResponse(BaseModel):
     usage: Dict[str, int] = Field(default_factory=dict)
 
 @router.post("/chat")
-async def chat(request: ChatRequest, mcp_service: MCPService = Depends(get_mcp_service)):
+async def chat(
+    request: ChatRequest,
+    response: Response,
+    mcp_service: MCPService = Depends(get_mcp_service),
+    llm_service: LLMService = Depends(get_llm_service),
+):
     """与大模型进行对话的接口"""
+    # 整轮对话的根span，流式响应时在数据流结束后才结束
+    root_span = tracer.start_span("chat", model=request.model, stream=request.stream, messages=len(request.messages))
+    trace_headers = {"X-Trace-Id": root_span.trace_id} if root_span is not None else {}
     try:
         # 获取API密钥
         api_key = os.environ.get("ARK_API_KEY")
         if not api_key and not request.messages:
             # 仅用于测试，如果没有API密钥且没有消息，返回模拟响应
+            if root_span is not None:
+                root_span.end()
             return {
                 "id": "test-response",
                 "object": "chat.completion",
@@ -64,15 +89,41 @@ async def chat(request: ChatRequest, mcp_service: MCPService = Depends(get_mcp_s
                 "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}
             }
         
-        # 获取OpenAI客户端 - 确保不传递额外参数
-        client = OpenAI(
-            base_url="https://ark.cn-beijing.volces.com/api/v3",
-            api_key=api_key,
-        )
+        # 获取应用共享的异步客户端
+        client = llm_service.get_client()
         
         # 创建消息列表
-        messages = [{"role": msg.role, "content": msg.content} for msg in request.messages]
-        logger.info(f"准备发送消息到模型，消息数量: {len(messages)}")
+        new_messages = [{"role": msg.role, "content": msg.content} for msg in request.messages]
+        conversation = None
+        if request.conversation_id:
+            # 服务端会话：在已保存的历史后追加本轮消息，本轮成功后再写回
+            conversation = await conversation_store.get(request.conversation_id)
+            trace_headers["X-Conversation-Id"] = conversation.id
+            if not conversation.messages and request.history:
+                new_messages = [{"role": msg.role, "content": msg.content} for msg in request.history] + new_messages
+            elif not conversation.messages and request.continued:
+                # 会话已过期、重启后未持久化或请求落到了其他工作进程，由客户端补发历史
+                raise HTTPException(status_code=409, detail=f"服务端没有会话 {conversation.id} 的记录，请附带历史重试")
+            working = Conversation(
+                conversation.id, conversation.messages + new_messages, conversation.summary, conversation.summarized_upto
+            )
+        else:
+            working = Conversation("", new_messages)
+        
+        # 按令牌预算裁剪上下文，服务端会话移出的历史合并为摘要
+        with tracer.activate(root_span):
+            messages = await context_window.prepare(working, client if conversation is not None else None, request.model)
+        prepared_length = len(messages)
+        hot_logger.debug("准备发送消息到模型，消息数量: %d（原始 %d）", len(messages), len(working.messages))
+        
+        async def save_turn(final_content: Optional[str]) -> None:
+            """保存本轮的新消息、工具调用记录和最终回复"""
+            if conversation is None:
+                return
+            conversation.summary = working.summary
+            conversation.summarized_upto = working.summarized_upto
+            turn = new_messages + messages[prepared_length:] + [{"role": "assistant", "content": final_content or ""}]
+            await conversation_store.append(conversation, turn)
         
         # 处理MCP配置
         tools = []
@@ -82,270 +133,115 @@ async def chat(request: ChatRequest, mcp_service: MCPService = Depends(get_mcp_s
                 logger.warning("MCP配置中缺少mcpServers字段，无法获取工具列表")
             else:
                 # 使用MCP服务解析配置
-                tools = await mcp_service.get_tools_from_config(request.mcp_config)
-                logger.info(f"获取到MCP工具数量: {len(tools)}")
+                with tracer.activate(root_span):
+                    tools = await mcp_service.get_tools_from_config(request.mcp_config)
+                hot_logger.debug("获取到MCP工具数量: %d", len(tools))
+        
+        # 多步智能体循环：模型与工具交替执行，直到得到最终回复或达到预算上限
+        agent = AgentLoop(client, ToolExecutor(mcp_service), request.model, tools, request.mcp_config)
         
         # 调用大模型
         if request.stream:
             # 流式响应 - 使用FastAPI的StreamingResponse
             async def generate_stream_content():
+                ACTIVE_STREAMS.inc()
                 try:
-                    # 创建流式请求
-                    stream = client.chat.completions.create(
-                        model=request.model,
-                        messages=messages,
-                        tools=tools if tools else None,
-                        stream=True
-                    )
-                    
-                    # 收集完整的响应用于可能的工具调用
-                    full_response = {"choices": [{"message": {"content": "", "tool_calls": []}}]}
-                    tool_call_chunks = {}
-                    
-                    # 收集所有流式数据以确保完整的工具调用参数
-                    all_chunks = []
-                    try:
-                        # 将所有块收集到列表中，以便我们可以完整处理工具调用
-                        for chunk in stream:
-                            all_chunks.append(chunk)
-                            # 将数据块发送到客户端
-                            yield f"data: {json.dumps(chunk.model_dump())}\n\n"
-                            await asyncio.sleep(0.01)  # 让出控制权，确保流式处理正常
-                    except Exception as e:
-                        logger.error(f"处理流式数据时出错: {str(e)}", exc_info=True)
-                        yield f"data: {json.dumps({'error': str(e)})}\n\n"
-                        yield "data: [DONE]\n\n"
-                        return
-                    
-                    # 整理工具调用数据
-                    has_tool_calls = False
-                    function_tools = {}  # 使用索引作为键存储工具调用信息
-                    
-                    for chunk in all_chunks:
-                        if chunk.choices and len(chunk.choices) > 0:
-                            delta = chunk.choices[0].delta
-                            
-                            # 处理内容
-                            if hasattr(delta, 'content') and delta.content:
-                                full_response["choices"][0]["message"]["content"] += delta.content
-                            
-                            # 处理工具调用
-                            if hasattr(delta, 'tool_calls') and delta.tool_calls:
-                                has_tool_calls = True
-                                for tc in delta.tool_calls:
-                                    # 记录每个工具调用块以便调试
-                                    logger.debug(f"工具调用块: {tc.model_dump()}")
-                                    
-                                    # 获取工具调用索引
-                                    idx = tc.index
-                                    
-                                    # 如果是新的工具调用索引，初始化
-                                    if idx not in function_tools:
-                                        function_tools[idx] = {"name": "", "arguments": ""}
-                                    
-                                    # 收集函数名称
-                                    if hasattr(tc.function, 'name') and tc.function.name is not None:
-                                        function_tools[idx]["name"] += tc.function.name
-                                    
-                                    # 收集函数参数
-                                    if hasattr(tc.function, 'arguments') and tc.function.arguments is not None:
-                                        function_tools[idx]["arguments"] += tc.function.arguments
-                    
-                    # 检查是否有工具调用，并确保参数是完整的
-                    if has_tool_calls and function_tools:
-                        # 记录所有收集到的工具调用
-                        logger.info(f"流式响应中检测到工具调用，数量: {len(function_tools)}")
-                        logger.info(f"收集到的所有工具调用: {function_tools}")
-                        
-                        # 取第一个工具调用
-                        first_idx = list(function_tools.keys())[0]
-                        function_call = function_tools[first_idx]
-                        logger.info(f"将要执行的工具调用: {function_call}")
-                        
-                        try:
-                            # 检查工具名称是否存在
-                            if not function_call.get("name"):
-                                error_msg = "工具调用缺少名称"
-                                logger.error(error_msg)
-                                yield f"data: {json.dumps({'tool_execution_error': True, 'error': error_msg})}\n\n"
-                                yield "data: [DONE]\n\n"
-                                return
-                            
-                            # 安全解析参数
-                            tool_arguments = {}
-                            arguments_str = function_call.get("arguments", "").strip()
-                            
-                            logger.info(f"原始参数字符串: '{arguments_str}'")
-                            
-                            # 尝试各种方式解析参数
-                            if arguments_str:
-                                try:
-                                    # 首先尝试作为JSON对象解析
-                                    if arguments_str.startswith("{") and arguments_str.endswith("}"):
-                                        tool_arguments = json.loads(arguments_str)
-                                    # 尝试作为单个数字或字符串参数
-                                    elif arguments_str.isdigit():
-                                        # 对于天气查询，假设单个数字可能是城市ID
-                                        tool_arguments = {"city_id": int(arguments_str)}
-                                    else:
-                                        # 对于天气查询，假设单个字符串可能是城市名
-                                        tool_arguments = {"city": arguments_str}
-                                    
-                                    logger.info(f"解析后的工具参数: {tool_arguments}")
-                                except json.JSONDecodeError as e:
-                                    logger.warning(f"JSON参数解析失败，尝试其他解析方式: {e}")
-                                    # 尝试将参数视为城市名
-                                    tool_arguments = {"city": arguments_str}
-                            
-                            # 使用解析后的参数执行工具
-                            logger.info(f"执行工具: {function_call['name']} 参数: {tool_arguments}")
-                            
-                            # 构建标准化的工具调用对象
-                            tool_call_id = f"call_{first_idx}"
-                            standard_tool_call = {
-                                "id": tool_call_id,
-                                "type": "function",
-                                "function": {
-                                    "name": function_call["name"],
-                                    "arguments": json.dumps(tool_arguments) if tool_arguments else "{}"
-                                }
-                            }
-                            
-                            # 执行工具调用
-                            tool_result = await mcp_service.execute_tool(
-                                request.mcp_config,
-                                function_call["name"],
-                                tool_arguments
-                            )
-                            
-                            # 将助手的工具调用添加到消息历史
-                            messages.append({
-                                "role": "assistant",
-                                "content": full_response["choices"][0]["message"]["content"],
-                                "tool_calls": [standard_tool_call]
-                            })
-                            
-                            # 添加工具响应
-                            messages.append({
-                                "role": "tool",
-                                "name": function_call["name"],
-                                "content": tool_result,
-                                "tool_call_id": tool_call_id
-                            })
-                            
-                            # 通知前端工具执行完成，包含工具调用参数和结果
-                            yield f"data: {json.dumps({
-                                'tool_execution_complete': True, 
-                                'tool_name': function_call['name'],
-                                'tool_arguments': tool_arguments,
-                                'tool_result': tool_result
-                            })}\n\n"
-                            
-                            logger.info("工具执行成功，继续流式响应...")
-                            
-                            # 使用更新后的消息再次调用模型获取最终回复
-                            try:
-                                final_stream = client.chat.completions.create(
-                                    model=request.model,
-                                    messages=messages,
-                                    tools=tools if tools else None,
-                                    stream=True
-                                )
-                                
-                                # 继续流式发送最终响应
-                                for chunk in final_stream:
-                                    yield f"data: {json.dumps(chunk.model_dump())}\n\n"
-                                    await asyncio.sleep(0.01)  # 让出控制权，确保流式处理正常
-                            except Exception as e:
-                                logger.error(f"生成最终响应时出错: {str(e)}", exc_info=True)
-                                yield f"data: {json.dumps({'error': f'生成最终响应时出错: {str(e)}'})}\n\n"
-                        
-                        except Exception as e:
-                            logger.error(f"流式响应中执行工具时出错: {str(e)}", exc_info=True)
-                            # 通知前端工具执行错误
-                            yield f"data: {json.dumps({'tool_execution_error': True, 'error': str(e)})}\n\n"
-                    
-                    yield "data: [DONE]\n\n"
-                
+                    with tracer.activate(root_span):
+                        async for event in agent.stream(messages):
+                            yield event
+                    if agent.model_seconds > 0 and agent.output_tokens:
+                        STREAM_TOKENS_PER_SECOND.observe(agent.output_tokens / agent.model_seconds, model=request.model)
+                    await save_turn(agent.final_content)
                 except Exception as e:
+                    record_error("stream", e)
+                    if root_span is not None:
+                        root_span.record_error(e)
                     logger.error(f"生成流式响应时出错: {str(e)}", exc_info=True)
                     yield f"data: {json.dumps({'error': str(e)})}\n\n"
-                    yield "data: [DONE]\n\n"
+                finally:
+                    ACTIVE_STREAMS.dec()
+                    if root_span is not None:
+                        root_span.end()
+                yield "data: [DONE]\n\n"
             
             return StreamingResponse(
                 generate_stream_content(),
-                media_type="text/event-stream"
+                media_type="text/event-stream",
+                headers=trace_headers,
             )
         else:
             # 非流式响应
-            completion = client.chat.completions.create(
-                model=request.model,
-                messages=messages,
-                tools=tools if tools else None,
-                stream=False
-            )
-            logger.info(f"completion: {completion}")
-            logger.info(f"completion.choices: {completion.choices}")
-            logger.info(f"completion.choices[0].message: {completion.choices[0].message}")
-            logger.info(f"completion.choices[0].message.tool_calls: {completion.choices[0].message.tool_calls}")
-            # 检查是否有工具调用
-            if completion.choices and hasattr(completion.choices[0].message, 'tool_calls') and completion.choices[0].message.tool_calls:
-                function_call = completion.choices[0].message.tool_calls[0].function
-                logger.info(f"检测到函数调用: {function_call.name}")
-                
-                # 使用MCP服务执行工具调用
-                tool_result = await mcp_service.execute_tool(
-                    request.mcp_config,
-                    function_call.name, 
-                    json.loads(function_call.arguments)
-                )
-                
-                # 先添加助手的工具调用消息
-                tool_call_id = f"call_{function_call.name}"
-                messages.append({
-                    "role": "assistant",
-                    "content": None,
-                    "tool_calls": [
-                        {
-                            "id": tool_call_id,
-                            "type": "function",
-                            "function": {
-                                "name": function_call.name,
-                                "arguments": function_call.arguments
-                            }
-                        }
-                    ]
-                })
+            async def run_agent():
+                with tracer.activate(root_span):
+                    completion = await agent.run(messages)
                 
-                # 然后添加工具执行结果消息
-                messages.append({
-                    "role": "tool",  # 确保使用API支持的role值
-                    "name": function_call.name,
-                    "content": tool_result,
-                    "tool_call_id": tool_call_id  # 添加必要的tool_call_id参数
-                })
-                
-                logger.info(f"函数执行完成，结果长度: {len(tool_result)}")
-                logger.info(f"messages: {messages}")
-                # 再次调用大模型，将工具结果传递给它
-                completion = client.chat.completions.create(
-                    model=request.model,
-                    messages=messages,
-                    tools=tools if tools else None,
-                    stream=False
-                )
+                # 将响应转换为字典并返回
+                try:
+                    result = completion.model_dump()
+                except AttributeError:
+                    # 旧版本API可能没有model_dump方法
+                    result = completion.dict() if hasattr(completion, 'dict') else completion
+                if isinstance(result, dict):
+                    # 附带每一步的耗时统计
+                    result["agent_steps"] = agent.step_report()
+                return result
             
-            # 将响应转换为字典并返回
-            try:
-                return completion.model_dump()
-            except AttributeError:
-                # 旧版本API可能没有model_dump方法
-                return completion.dict() if hasattr(completion, 'dict') else completion
+            if response_cache.enabled_for(request.model):
+                # 相同的模型、消息和工具集直接返回缓存的响应，并发的相同请求只调用一次模型
+                cache_key = chat_cache_key(request.model, messages, tools)
+                result, cache_status = await response_cache.get_or_compute(cache_key, request.model, run_agent)
+                response.headers["X-Cache"] = cache_status.upper()
+                if root_span is not None:
+                    root_span.set_attribute("cache", cache_status)
+            else:
+                result = await run_agent()
+            await save_turn(_final_content(result))
+            if root_span is not None:
+                root_span.end()
+            response.headers.update(trace_headers)
+            return result
     
+    except HTTPException:
+        if root_span is not None:
+            root_span.end()
+        raise
     except Exception as e:
+        record_error("chat", e)
+        if root_span is not None:
+            root_span.end(error=e)
         logger.error(f"调用大模型时出错: {str(e)}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"调用大模型时出错: {str(e)}")
 
+def _final_content(result: Any) -> Optional[str]:
+    """非流式响应中最终回复的文本"""
+    try:
+        return result["choices"][0]["message"]["content"]
+    except (KeyError, IndexError, TypeError):
+        return None
+
+@router.delete("/conversations/{conversation_id}")
+async def delete_conversation(conversation_id: str):
+    """删除服务端保存的会话历史"""
+    await conversation_store.delete(conversation_id)
+    return {"deleted": conversation_id}
+
+@router.get("/mcp/stats")
+async def mcp_stats(mcp_service: MCPService = Depends(get_mcp_service)):
+    """MCP会话池、工具定义缓存命中情况与最近一次工具发现的耗时"""
+    return mcp_service.get_stats()
+
+@router.get("/llm/stats")
+async def llm_stats(llm_service: LLMService = Depends(get_llm_service)):
+    """各模型提供方的首个数据块延迟、完成耗时和错误率的移动平均（仅在配置了多个提供方时）"""
+    return {"providers": llm_service.stats()}
+
+@router.get("/traces")
+async def recent_traces(limit: int = 20):
+    """最近的对话追踪（仅在 TRACE_EXPORTER=memory 时可用），每个span带有相对开始时间，可按瀑布图查看"""
+    if not isinstance(tracer.exporter, InMemoryExporter):
+        return {"enabled": False, "detail": "未启用内存追踪导出器，请设置 TRACE_EXPORTER=memory", "traces": []}
+    return {"enabled": True, "traces": tracer.exporter.traces(limit)}
+
 @router.get("/health")
 async def health_check():
     """健康检查接口"""
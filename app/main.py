@@ -1,23 +1,30 @@
 from fastapi import FastAPI, Request, Response
-from fastapi.responses import HTMLResponse, JSONResponse
+from fastapi.responses import HTMLResponse, JSONResponse, PlainTextResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from fastapi.middleware.cors import CORSMiddleware
 import uvicorn
 import os
+import json
 import logging
+import time
 import traceback
+from contextlib import asynccontextmanager
 from starlette.middleware.base import BaseHTTPMiddleware
 from starlette.responses import StreamingResponse
 
 from app.api.routes import router as api_router
+from app.services.mcp_service import get_mcp_service
+from app.services.llm_client import get_llm_service
+from app.services.metrics import REGISTRY
+from app.services.conversation_store import conversation_store
+from app.services.logging_utils import SampledLogger, setup_logging, stop_logging
+from app.services.tracing import tracer
 
-# 配置日志记录
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
-)
+# 配置日志记录：日志经队列交给后台线程写出，级别、格式和采样率由环境变量控制
+setup_logging()
 logger = logging.getLogger("app")
+request_logger = SampledLogger(logger)
 
 # 异常处理中间件
 class ExceptionMiddleware(BaseHTTPMiddleware):
@@ -33,7 +40,35 @@ class ExceptionMiddleware(BaseHTTPMiddleware):
                 content={"detail": f"服务器内部错误: {str(e)}"}
             )
 
-app = FastAPI(title="FastMCP 大模型应用")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """应用生命周期：启动时准备共享的MCP会话池和大模型客户端，退出时释放连接"""
+    mcp_service = get_mcp_service()
+    await mcp_service.start()
+    llm_service = get_llm_service()
+    await llm_service.start()
+    
+    # 可选：预热登记表中记录的服务器
+    await mcp_service.warm_up_registered()
+    
+    # 可选：根据MCP_WARMUP_CONFIG指定的配置文件预热会话
+    warmup_path = os.environ.get("MCP_WARMUP_CONFIG")
+    if warmup_path:
+        try:
+            with open(warmup_path, "r", encoding="utf-8") as f:
+                await mcp_service.warm_up(json.load(f))
+        except Exception as e:
+            logger.error(f"预热MCP会话失败: {str(e)}")
+    
+    yield
+    
+    await llm_service.close()
+    await mcp_service.close()
+    conversation_store.close()
+    tracer.set_exporter(None)
+    stop_logging()
+
+app = FastAPI(title="FastMCP 大模型应用", lifespan=lifespan)
 
 # 添加中间件
 app.add_middleware(ExceptionMiddleware)
@@ -66,6 +101,11 @@ async def health():
     """健康检查端点"""
     return {"status": "ok"}
 
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Prometheus格式的运行指标"""
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
 @app.exception_handler(404)
 async def not_found_exception_handler(request: Request, exc):
     return JSONResponse(
@@ -83,11 +123,14 @@ async def server_error_exception_handler(request: Request, exc):
 
 @app.middleware("http")
 async def log_requests(request: Request, call_next):
-    """记录所有请求的中间件"""
-    logger.info(f"请求路径: {request.method} {request.url.path}")
+    """按采样率记录请求的中间件，每个请求一行日志"""
+    start = time.perf_counter()
     try:
         response = await call_next(request)
-        logger.info(f"响应状态: {response.status_code}")
+        request_logger.info(
+            "%s %s -> %d (%.1fms)", request.method, request.url.path, response.status_code,
+            (time.perf_counter() - start) * 1000,
+        )
         return response
     except Exception as e:
         logger.error(f"处理请求时出错: {str(e)}")
@@ -0,0 +1,313 @@
+from openai import AsyncOpenAI
+from typing import Dict, Any, List, Optional, AsyncIterator
+import json
+import os
+import time
+import logging
+
+from app.services.metrics import (
+    LLM_TTFT_SECONDS,
+    LLM_COMPLETION_SECONDS,
+    TOOL_CALLS_DISPATCHED_TOTAL,
+    TOOL_EARLY_SAVED_SECONDS,
+)
+from app.services.tracing import tracer
+from app.services.logging_utils import SampledLogger
+from app.services.stream_assembler import StreamAssembler
+from app.services.tool_executor import ToolExecutor, ToolDispatcher, build_tool_messages
+
+# 配置日志
+logger = logging.getLogger("app.services.agent")
+# 每个请求都会执行的日志按采样率记录
+hot_logger = SampledLogger(logger)
+
+# 多步工具调用的预算，可通过环境变量调整；步数指工具调用的轮数，令牌预算为0表示不限制
+AGENT_MAX_STEPS = int(os.environ.get("AGENT_MAX_STEPS", "5"))
+AGENT_MAX_TOKENS = int(os.environ.get("AGENT_MAX_TOKENS", "0"))
+AGENT_MAX_SECONDS = float(os.environ.get("AGENT_MAX_SECONDS", "120"))
+# 流式请求是否要求模型在最后一个数据块中返回令牌用量
+AGENT_STREAM_USAGE = os.environ.get("AGENT_STREAM_USAGE", "1") == "1"
+# 流式请求中参数已完整的工具调用是否在模型输出结束前开始执行
+AGENT_EARLY_TOOL_DISPATCH = os.environ.get("AGENT_EARLY_TOOL_DISPATCH", "1") == "1"
+
+
+def sse_event(data: Any) -> str:
+    """将数据编码为SSE事件"""
+    return f"data: {json.dumps(data)}\n\n"
+
+
+class StepTiming:
+    """单步的耗时统计"""
+
+    def __init__(self, step: int):
+        self.step = step
+        self.started = time.perf_counter()
+        self.first_token_ms: Optional[float] = None
+        self.model_ms = 0.0
+        self.tool_ms = 0.0
+        self.tool_calls = 0
+        # 模型输出结束前已开始执行的工具调用数，以及因此节省的耗时
+        self.early_tool_calls = 0
+        self.saved_ms = 0.0
+        self.tokens = 0
+        self.output_tokens = 0
+
+    def mark_first_token(self) -> None:
+        if self.first_token_ms is None:
+            self.first_token_ms = (time.perf_counter() - self.started) * 1000
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "step": self.step,
+            "ttft_ms": round(self.first_token_ms, 1) if self.first_token_ms is not None else None,
+            "model_ms": round(self.model_ms, 1),
+            "tool_ms": round(self.tool_ms, 1),
+            "tool_calls": self.tool_calls,
+            "early_tool_calls": self.early_tool_calls,
+            "saved_ms": round(self.saved_ms, 1),
+            "tokens": self.tokens,
+        }
+
+
+class AgentLoop:
+    """
+    有界的多步智能体循环
+
+    反复调用模型并执行其请求的工具，直到模型给出最终回复，
+    或达到步数、令牌数、耗时上限。达到上限后的最后一步不再提供工具，
+    由模型根据已有结果直接回答。
+    """
+
+    def __init__(
+        self,
+        client: AsyncOpenAI,
+        tool_executor: ToolExecutor,
+        model: str,
+        tools: Optional[List[Dict[str, Any]]],
+        mcp_config: Optional[Dict[str, Any]],
+        max_steps: int = AGENT_MAX_STEPS,
+        max_tokens: int = AGENT_MAX_TOKENS,
+        max_seconds: float = AGENT_MAX_SECONDS,
+    ):
+        self.client = client
+        self.tool_executor = tool_executor
+        self.model = model
+        self.tools = tools or None
+        self.mcp_config = mcp_config
+        self.max_steps = max(1, max_steps)
+        self.max_tokens = max_tokens
+        self.max_seconds = max_seconds
+        self.steps: List[StepTiming] = []
+        # 最后一步模型回复的文本内容
+        self.final_content: Optional[str] = None
+        self._started = time.perf_counter()
+
+    @property
+    def total_tokens(self) -> int:
+        return sum(step.tokens for step in self.steps)
+
+    @property
+    def output_tokens(self) -> int:
+        return sum(step.output_tokens for step in self.steps)
+
+    @property
+    def model_seconds(self) -> float:
+        return sum(step.model_ms for step in self.steps) / 1000
+
+    def _limit_reason(self) -> Optional[str]:
+        """返回已触发的上限，未触发时返回None"""
+        # 当前步已计入self.steps，超过工具调用轮数上限的一步只用于生成最终回复
+        if len(self.steps) > self.max_steps:
+            return "max_steps"
+        if self.max_tokens and self.total_tokens >= self.max_tokens:
+            return "max_tokens"
+        if time.perf_counter() - self._started >= self.max_seconds:
+            return "max_seconds"
+        return None
+
+    def _tools_for_next_step(self) -> Optional[List[Dict[str, Any]]]:
+        reason = self._limit_reason()
+        if reason and self.tools:
+            logger.warning(f"智能体循环达到上限 {reason}，最后一步不再提供工具")
+            return None
+        return self.tools
+
+    async def stream(self, messages: List[Dict[str, Any]]) -> AsyncIterator[str]:
+        """
+        以SSE事件流的形式运行循环
+
+        模型数据块原样转发；参数已完整的工具调用在模型输出结束前即开始执行，
+        每步工具执行后推送工具事件和该步的耗时统计。
+
+        Args:
+            messages: 消息历史，循环中会追加助手和工具消息
+
+        Yields:
+            SSE事件字符串
+        """
+        while True:
+            timing = StepTiming(len(self.steps) + 1)
+            self.steps.append(timing)
+            tools = self._tools_for_next_step()
+
+            with tracer.span("agent.step", step=timing.step):
+                extra = {"stream_options": {"include_usage": True}} if AGENT_STREAM_USAGE else {}
+                with tracer.span("llm.completion", model=self.model, stream=True) as llm_span:
+                    stream = await self.client.chat.completions.create(
+                        model=self.model,
+                        messages=messages,
+                        tools=tools,
+                        stream=True,
+                        **extra
+                    )
+
+                    # 边接收边组装内容和工具调用，数据块转发后即释放
+                    assembler = StreamAssembler()
+                    dispatcher = ToolDispatcher(self.tool_executor, self.mcp_config)
+                    early_dispatch = AGENT_EARLY_TOOL_DISPATCH and tools is not None
+                    try:
+                        async for chunk in stream:
+                            timing.mark_first_token()
+                            assembler.feed(chunk)
+                            if early_dispatch:
+                                for call in assembler.pop_ready_tool_calls():
+                                    dispatcher.dispatch(call)
+                            yield f"data: {chunk.model_dump_json()}\n\n"
+                    except BaseException:
+                        # 流中断或客户端断开时，不再需要提前执行的工具结果
+                        dispatcher.cancel()
+                        raise
+                    timing.model_ms = (time.perf_counter() - timing.started) * 1000
+                    if assembler.usage is not None:
+                        timing.tokens = assembler.usage.total_tokens or 0
+                    timing.output_tokens = (
+                        assembler.usage.completion_tokens if assembler.usage is not None and assembler.usage.completion_tokens
+                        else assembler.delta_chunks
+                    )
+                    if llm_span is not None:
+                        llm_span.set_attribute("ttft_ms", timing.first_token_ms)
+                        llm_span.set_attribute("tokens", timing.tokens)
+                if timing.first_token_ms is not None:
+                    LLM_TTFT_SECONDS.observe(timing.first_token_ms / 1000, model=self.model)
+                LLM_COMPLETION_SECONDS.observe(timing.model_ms / 1000, model=self.model, stream="true")
+
+                # 没有工具调用时即为最终回复
+                if not assembler.has_tool_calls or tools is None:
+                    dispatcher.cancel()
+                    self.final_content = assembler.content
+                    yield sse_event({"agent_step_complete": True, **timing.to_dict()})
+                    break
+
+                function_tools = assembler.tool_calls()
+                hot_logger.debug("第 %d 步检测到工具调用，数量: %d", timing.step, len(function_tools))
+                timing.tool_calls = len(function_tools)
+
+                # 等待提前执行的工具调用，并发执行其余调用
+                tool_start = time.perf_counter()
+                with tracer.span("tools.execute", count=len(function_tools), early=dispatcher.dispatched):
+                    results, timing.early_tool_calls = await dispatcher.collect(function_tools)
+                timing.tool_ms = (time.perf_counter() - tool_start) * 1000
+                self._record_early_dispatch(timing, results, tool_start)
+
+                # 将助手的工具调用和工具响应按顺序添加到消息历史
+                messages.extend(build_tool_messages(assembler.content, results))
+
+                # 通知前端每个工具的执行结果，包含工具调用参数和结果
+                for result in results:
+                    yield sse_event({**result.to_event(), "step": timing.step})
+                yield sse_event({"agent_step_complete": True, **timing.to_dict()})
+
+        self._log_summary()
+
+    async def run(self, messages: List[Dict[str, Any]]) -> Any:
+        """
+        以非流式方式运行循环
+
+        Args:
+            messages: 消息历史，循环中会追加助手和工具消息
+
+        Returns:
+            最后一次模型调用的ChatCompletion对象
+        """
+        while True:
+            timing = StepTiming(len(self.steps) + 1)
+            self.steps.append(timing)
+            tools = self._tools_for_next_step()
+
+            with tracer.span("agent.step", step=timing.step):
+                with tracer.span("llm.completion", model=self.model, stream=False) as llm_span:
+                    completion = await self.client.chat.completions.create(
+                        model=self.model,
+                        messages=messages,
+                        tools=tools,
+                        stream=False
+                    )
+                    timing.model_ms = (time.perf_counter() - timing.started) * 1000
+                    timing.first_token_ms = timing.model_ms
+                    if completion.usage is not None:
+                        timing.tokens = completion.usage.total_tokens or 0
+                        timing.output_tokens = completion.usage.completion_tokens or 0
+                    if llm_span is not None:
+                        llm_span.set_attribute("tokens", timing.tokens)
+                LLM_COMPLETION_SECONDS.observe(timing.model_ms / 1000, model=self.model, stream="false")
+
+                message = completion.choices[0].message if completion.choices else None
+                if message is None or not message.tool_calls or tools is None:
+                    self.final_content = message.content if message is not None else None
+                    break
+
+                tool_calls = [
+                    {"id": tc.id or f"call_{idx}", "name": tc.function.name, "arguments": tc.function.arguments}
+                    for idx, tc in enumerate(message.tool_calls)
+                ]
+                hot_logger.debug("第 %d 步检测到工具调用，数量: %d", timing.step, len(tool_calls))
+                timing.tool_calls = len(tool_calls)
+
+                # 使用MCP服务并发执行全部工具调用
+                tool_start = time.perf_counter()
+                with tracer.span("tools.execute", count=len(tool_calls)):
+                    results = await self.tool_executor.execute_all(self.mcp_config, tool_calls)
+                timing.tool_ms = (time.perf_counter() - tool_start) * 1000
+
+                # 按顺序添加助手的工具调用消息和工具执行结果消息
+                messages.extend(build_tool_messages(message.content, results))
+
+        self._log_summary()
+        return completion
+
+    def _record_early_dispatch(self, timing: StepTiming, results: List[Any], stream_end: float) -> None:
+        """
+        统计提前执行节省的耗时
+
+        节省的耗时按模型输出结束前有工具在执行的总时长计算（各调用执行区间的并集），
+        这部分工具耗时被模型输出掩盖，不再出现在步骤的等待时间中。
+        """
+        TOOL_CALLS_DISPATCHED_TOTAL.inc(timing.early_tool_calls, mode="early")
+        TOOL_CALLS_DISPATCHED_TOTAL.inc(timing.tool_calls - timing.early_tool_calls, mode="after_stream")
+        if not timing.early_tool_calls:
+            return
+        intervals = sorted(
+            (result.started_at, min(result.finished_at, stream_end))
+            for result in results
+            if result.started_at is not None and result.started_at < stream_end
+        )
+        saved = 0.0
+        covered_until = None
+        for start, end in intervals:
+            if covered_until is not None:
+                start = max(start, covered_until)
+            if end > start:
+                saved += end - start
+            covered_until = end if covered_until is None else max(covered_until, end)
+        timing.saved_ms = saved * 1000
+        TOOL_EARLY_SAVED_SECONDS.observe(saved, model=self.model)
+
+    def step_report(self) -> List[Dict[str, Any]]:
+        """返回每一步的耗时统计"""
+        return [step.to_dict() for step in self.steps]
+
+    def _log_summary(self) -> None:
+        if not hot_logger.sampled():
+            return
+        total_ms = (time.perf_counter() - self._started) * 1000
+        logger.info("智能体循环结束，共 %d 步，总耗时 %.1fms，各步耗时: %s", len(self.steps), total_ms, self.step_report())
@@ -0,0 +1,135 @@
+from typing import Dict, Any
+import os
+import random
+import time
+import logging
+
+from app.services.metrics import MCP_CIRCUIT_OPEN_TOTAL
+
+# 配置日志
+logger = logging.getLogger("app.services.mcp.breaker")
+
+# 熔断参数，可通过环境变量调整
+BREAKER_FAILURE_THRESHOLD = int(os.environ.get("MCP_BREAKER_FAILURES", "3"))
+BREAKER_BASE_BACKOFF = float(os.environ.get("MCP_BREAKER_BACKOFF", "5"))
+BREAKER_MAX_BACKOFF = float(os.environ.get("MCP_BREAKER_MAX_BACKOFF", "300"))
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(Exception):
+    """服务器处于熔断状态，请求未发出"""
+
+
+class CircuitBreaker:
+    """
+    单个服务器端点的熔断器
+
+    连续失败达到阈值后进入open状态，期间的请求直接拒绝；等待退避时间后进入half_open，
+    只放行一个探测请求：成功则恢复closed，失败则退避时间加倍后重新open。
+    """
+
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: int = BREAKER_FAILURE_THRESHOLD,
+        base_backoff: float = BREAKER_BASE_BACKOFF,
+        max_backoff: float = BREAKER_MAX_BACKOFF,
+    ):
+        self.name = name
+        self.failure_threshold = max(1, failure_threshold)
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.state = CLOSED
+        self.failures = 0
+        self.backoff = base_backoff
+        self.opened_at = 0.0
+        self.retry_at = 0.0
+        self._probing = False
+
+    def available(self) -> bool:
+        """是否可以向该端点发送请求（不占用探测名额）"""
+        if self.state == CLOSED:
+            return True
+        if self.state == OPEN:
+            return time.monotonic() >= self.retry_at
+        return not self._probing
+
+    def allow(self) -> bool:
+        """
+        申请发送一个请求
+
+        open状态到达重试时间后转为half_open，并把本次请求作为探测请求。
+        """
+        if self.state == CLOSED:
+            return True
+        if self.state == OPEN:
+            if time.monotonic() < self.retry_at:
+                return False
+            self.state = HALF_OPEN
+            self._probing = False
+        if self._probing:
+            return False
+        self._probing = True
+        return True
+
+    def release(self) -> None:
+        """探测请求被取消时释放探测名额，不改变状态"""
+        self._probing = False
+
+    def record_success(self) -> None:
+        if self.state != CLOSED:
+            logger.info(f"MCP服务器 {self.name} 已恢复，熔断关闭")
+        self.state = CLOSED
+        self.failures = 0
+        self.backoff = self.base_backoff
+        self._probing = False
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        if self.state == HALF_OPEN:
+            # 探测失败，退避时间加倍
+            self.backoff = min(self.backoff * 2, self.max_backoff)
+            self._open()
+        elif self.state == CLOSED and self.failures >= self.failure_threshold:
+            self._open()
+
+    def _open(self) -> None:
+        self.state = OPEN
+        self._probing = False
+        self.opened_at = time.monotonic()
+        # 加入抖动，避免多个工作进程同时探测
+        self.retry_at = self.opened_at + self.backoff * random.uniform(0.8, 1.2)
+        MCP_CIRCUIT_OPEN_TOTAL.inc(server=self.name)
+        logger.warning(f"MCP服务器 {self.name} 连续失败 {self.failures} 次，熔断 {self.backoff:.0f}s")
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "state": self.state,
+            "failures": self.failures,
+            "backoff": self.backoff,
+            "retry_in": round(max(0.0, self.retry_at - time.monotonic()), 1) if self.state == OPEN else 0.0,
+        }
+
+
+class BreakerRegistry:
+    """按端点（规范化后的服务器配置）管理熔断器"""
+
+    def __init__(self):
+        self._breakers: Dict[str, CircuitBreaker] = {}
+
+    def get(self, key: str, name: str) -> CircuitBreaker:
+        breaker = self._breakers.get(key)
+        if breaker is None:
+            breaker = self._breakers[key] = CircuitBreaker(name)
+        return breaker
+
+    def stats(self) -> Dict[str, Any]:
+        """非closed状态的熔断器"""
+        return {
+            breaker.name: breaker.snapshot()
+            for breaker in self._breakers.values()
+            if breaker.state != CLOSED or breaker.failures
+        }
@@ -0,0 +1,71 @@
+from typing import Dict, Any, Optional
+import asyncio
+import json
+import os
+import logging
+
+from app.services.disk_cache import atomic_write_json
+
+# 配置日志
+logger = logging.getLogger("app.services.mcp.registry")
+
+# 设置后启用服务器配置登记，文件中的服务器会在应用启动时预热
+CONFIG_REGISTRY_PATH = os.environ.get("MCP_CONFIG_REGISTRY_PATH")
+
+
+class ServerConfigRegistry:
+    """
+    可选的服务器配置登记表
+
+    记录使用过的服务器配置，供应用重启后预热会话。
+    配置中的env与headers按原样保存（预热需要与请求中完全相同的配置），
+    因此文件以仅所有者可读写（0600）的权限写入。
+    文件读写均在线程池中执行，配置未变化时不会写盘。
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._servers: Optional[Dict[str, Dict[str, Any]]] = None
+        self._lock = asyncio.Lock()
+
+    async def load(self) -> Dict[str, Dict[str, Any]]:
+        """
+        读取登记的服务器配置
+
+        Returns:
+            mcpServers格式的服务器配置字典
+        """
+        async with self._lock:
+            if self._servers is None:
+                self._servers = await self._run_io(self._read)
+            return dict(self._servers)
+
+    async def register(self, server_name: str, server_config: Dict[str, Any]) -> None:
+        """登记服务器配置，与已有记录相同时不做任何I/O"""
+        servers = await self.load()
+        if servers.get(server_name) == server_config:
+            return
+        async with self._lock:
+            self._servers[server_name] = server_config
+            snapshot = dict(self._servers)
+        await self._run_io(self._write, snapshot)
+        logger.info(f"已登记服务器配置: {server_name}")
+
+    def _read(self) -> Dict[str, Dict[str, Any]]:
+        if not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                return json.load(f).get("mcpServers", {})
+        except Exception as e:
+            logger.warning(f"读取服务器配置登记表 {self.path} 失败: {str(e)}")
+            return {}
+
+    def _write(self, servers: Dict[str, Dict[str, Any]]) -> None:
+        try:
+            atomic_write_json(self.path, {"mcpServers": servers}, mode=0o600, indent=2)
+        except Exception as e:
+            logger.warning(f"写入服务器配置登记表 {self.path} 失败: {str(e)}")
+
+    async def _run_io(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(None, func, *args)
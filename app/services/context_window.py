@@ -0,0 +1,229 @@
+from openai import AsyncOpenAI
+from typing import Dict, Any, List, Optional, Tuple
+import json
+import os
+import logging
+
+from app.services.conversation_store import Conversation
+from app.services.metrics import record_error
+from app.services.tracing import tracer
+
+# 配置日志
+logger = logging.getLogger("app.services.context")
+
+# 发送给模型的上下文预算，可通过环境变量调整
+CONTEXT_MAX_TOKENS = int(os.environ.get("CONTEXT_MAX_TOKENS", "8000"))
+# 最近多少轮对话（从一条用户消息到下一条用户消息之前）原样保留
+CONTEXT_KEEP_TURNS = int(os.environ.get("CONTEXT_KEEP_TURNS", "4"))
+# 较早轮次中每条工具结果保留的字符数
+CONTEXT_TOOL_RESULT_CHARS = int(os.environ.get("CONTEXT_TOOL_RESULT_CHARS", "800"))
+# 移出上下文的历史是否由模型压缩为摘要；关闭时直接丢弃
+CONTEXT_SUMMARY_ENABLED = os.environ.get("CONTEXT_SUMMARY_ENABLED", "1") == "1"
+CONTEXT_SUMMARY_MAX_TOKENS = int(os.environ.get("CONTEXT_SUMMARY_MAX_TOKENS", "400"))
+
+SUMMARY_PROMPT = (
+    "你负责压缩对话历史。请把已有摘要和新的对话记录合并为一份简洁的摘要，"
+    "保留用户的目标、偏好、已确认的事实、工具查询得到的关键数据和尚未解决的问题，省略寒暄和重复内容。"
+    "只输出摘要本身。"
+)
+
+# 每条消息的固定开销（角色、分隔符等）
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+def _message_text(message: Dict[str, Any]) -> str:
+    content = message.get("content")
+    text = content if isinstance(content, str) else json.dumps(content, ensure_ascii=False) if content else ""
+    for tool_call in message.get("tool_calls") or []:
+        function = tool_call.get("function", {})
+        text += function.get("name", "") + function.get("arguments", "")
+    return text
+
+
+def estimate_text_tokens(text: str) -> int:
+    """
+    粗略估算文本的令牌数
+
+    英文等ASCII文本约4个字符一个令牌，中文等非ASCII字符约一个字符一个令牌。
+    """
+    ascii_chars = len(text.encode("ascii", "ignore"))
+    return ascii_chars // 4 + (len(text) - ascii_chars)
+
+
+def estimate_tokens(message: Dict[str, Any]) -> int:
+    """粗略估算消息的令牌数"""
+    return estimate_text_tokens(_message_text(message)) + MESSAGE_OVERHEAD_TOKENS
+
+
+def compact_tool_result(message: Dict[str, Any], max_chars: int) -> Dict[str, Any]:
+    """截断过长的工具结果，其他消息原样返回"""
+    content = message.get("content")
+    if message.get("role") != "tool" or not isinstance(content, str) or len(content) <= max_chars:
+        return message
+    return {**message, "content": f"{content[:max_chars]}\n...[已省略 {len(content) - max_chars} 字符]"}
+
+
+def split_turns(messages: List[Dict[str, Any]], start: int = 0) -> List[Tuple[int, int]]:
+    """
+    按用户消息将消息划分为轮次
+
+    助手的工具调用消息和对应的工具结果总在同一轮中，按轮次裁剪不会拆散它们。
+
+    Returns:
+        每一轮的 (起始下标, 结束下标)，下标相对于整个messages
+    """
+    turns: List[Tuple[int, int]] = []
+    turn_start = start
+    for idx in range(start + 1, len(messages)):
+        if messages[idx].get("role") == "user":
+            turns.append((turn_start, idx))
+            turn_start = idx
+    if turn_start < len(messages):
+        turns.append((turn_start, len(messages)))
+    return turns
+
+
+class ContextWindow:
+    """
+    发送给模型前的上下文裁剪策略
+
+    1. 开头的系统消息始终保留；
+    2. 最近 keep_turns 轮原样保留，更早轮次中的工具结果截断；
+    3. 仍超出预算时，从最早的轮次开始移出上下文，移出的内容由模型合并进会话摘要；
+    4. 只剩最近几轮仍超出预算时，依次截断其中的工具结果、移出较早的轮次，最后一轮始终保留。
+    """
+
+    def __init__(
+        self,
+        max_tokens: int = CONTEXT_MAX_TOKENS,
+        keep_turns: int = CONTEXT_KEEP_TURNS,
+        tool_result_chars: int = CONTEXT_TOOL_RESULT_CHARS,
+        summary_enabled: bool = CONTEXT_SUMMARY_ENABLED,
+    ):
+        self.max_tokens = max_tokens
+        self.keep_turns = max(1, keep_turns)
+        self.tool_result_chars = tool_result_chars
+        self.summary_enabled = summary_enabled
+
+    async def prepare(
+        self,
+        conversation: Conversation,
+        client: Optional[AsyncOpenAI] = None,
+        model: Optional[str] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        生成本次发送给模型的消息列表
+
+        移出上下文的轮次会推进conversation.summarized_upto，下次不再重复处理；
+        传入client和model且开启摘要时，移出的内容合并进conversation.summary。
+
+        Args:
+            conversation: 会话，messages中最后一轮为本次的新消息
+            client: 用于生成摘要的模型客户端
+            model: 用于生成摘要的模型
+
+        Returns:
+            新的消息列表，不修改conversation.messages
+        """
+        messages = conversation.messages
+        pinned_end = 0
+        while pinned_end < len(messages) and messages[pinned_end].get("role") == "system":
+            pinned_end += 1
+        pinned = messages[:pinned_end]
+
+        bounds = split_turns(messages, max(pinned_end, conversation.summarized_upto))
+        turns = [messages[start:end] for start, end in bounds]
+        # 较早轮次的工具结果先截断
+        for turn in turns[:-self.keep_turns]:
+            turn[:] = [compact_tool_result(message, self.tool_result_chars) for message in turn]
+
+        fixed_tokens = sum(estimate_tokens(message) for message in pinned) + self._summary_tokens(conversation)
+        turn_tokens = [sum(estimate_tokens(message) for message in turn) for turn in turns]
+        total = fixed_tokens + sum(turn_tokens)
+
+        evicted: List[Dict[str, Any]] = []
+        while total > self.max_tokens and len(turns) > 1:
+            if len(turns) <= self.keep_turns:
+                # 只剩最近几轮时，先截断其中的工具结果
+                compacted = self._compact_turns(turns[:-1])
+                if compacted:
+                    turn_tokens[:-1] = [sum(estimate_tokens(message) for message in turn) for turn in turns[:-1]]
+                    total = fixed_tokens + sum(turn_tokens)
+                    continue
+            start, end = bounds.pop(0)
+            evicted.extend(messages[start:end])
+            turns.pop(0)
+            total -= turn_tokens.pop(0)
+
+        if evicted:
+            # 下次从第一个保留的轮次开始处理
+            conversation.summarized_upto = bounds[0][0]
+            if self.summary_enabled and client is not None and model:
+                await self._summarize(conversation, evicted, client, model)
+
+        result = list(pinned)
+        if conversation.summary:
+            result.append(self._summary_message(conversation.summary))
+        for turn in turns:
+            result.extend(turn)
+        return result
+
+    def _compact_turns(self, turns: List[List[Dict[str, Any]]]) -> bool:
+        """截断这些轮次中的工具结果，有变化时返回True"""
+        changed = False
+        for turn in turns:
+            for idx, message in enumerate(turn):
+                compacted = compact_tool_result(message, self.tool_result_chars)
+                if compacted is not message:
+                    turn[idx] = compacted
+                    changed = True
+        return changed
+
+    def _summary_tokens(self, conversation: Conversation) -> int:
+        if not conversation.summary:
+            return 0
+        return estimate_tokens(self._summary_message(conversation.summary))
+
+    @staticmethod
+    def _summary_message(summary: str) -> Dict[str, Any]:
+        return {"role": "system", "content": f"以下是此前对话的摘要：\n{summary}"}
+
+    async def _summarize(
+        self,
+        conversation: Conversation,
+        evicted: List[Dict[str, Any]],
+        client: AsyncOpenAI,
+        model: str,
+    ) -> None:
+        """将移出上下文的消息合并进会话摘要，失败时保留原摘要"""
+        transcript = "\n".join(self._render(message) for message in evicted)
+        prompt = f"已有摘要：\n{conversation.summary or '（无）'}\n\n新的对话记录：\n{transcript}"
+        try:
+            with tracer.span("context.summarize", model=model, messages=len(evicted)):
+                completion = await client.chat.completions.create(
+                    model=model,
+                    messages=[{"role": "system", "content": SUMMARY_PROMPT}, {"role": "user", "content": prompt}],
+                    max_tokens=CONTEXT_SUMMARY_MAX_TOKENS,
+                    stream=False,
+                )
+            summary = completion.choices[0].message.content if completion.choices else None
+            if summary:
+                conversation.summary = summary.strip()
+        except Exception as e:
+            record_error("context_summary", e)
+            logger.warning(f"会话 {conversation.id} 生成摘要失败，移出的 {len(evicted)} 条消息将被丢弃: {str(e)}")
+
+    def _render(self, message: Dict[str, Any]) -> str:
+        role = message.get("role")
+        if role == "tool":
+            content = compact_tool_result(message, self.tool_result_chars)["content"]
+            return f"工具结果: {content}"
+        line = f"{role}: {message.get('content') or ''}"
+        for tool_call in message.get("tool_calls") or []:
+            function = tool_call.get("function", {})
+            line += f"\n{role} 调用工具 {function.get('name')}({function.get('arguments')})"
+        return line
+
+
+# 应用共享的上下文策略
+context_window = ContextWindow()
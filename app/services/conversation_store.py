@@ -0,0 +1,192 @@
+from typing import Dict, Any, List, Optional
+from collections import OrderedDict
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+import logging
+
+# 配置日志
+logger = logging.getLogger("app.services.conversations")
+
+# 会话存储参数，可通过环境变量调整
+CONVERSATION_MAX_ACTIVE = int(os.environ.get("CONVERSATION_MAX_ACTIVE", "1000"))
+CONVERSATION_TTL = float(os.environ.get("CONVERSATION_TTL", "86400"))
+# 设置后会话同时写入该SQLite文件，应用重启后以及多个工作进程之间均可继续对话
+CONVERSATION_DB_PATH = os.environ.get("CONVERSATION_DB_PATH")
+
+
+class Conversation:
+    """
+    一个会话的完整消息历史
+
+    messages保存原始消息（含工具调用和工具结果），发送给模型前由上下文策略裁剪；
+    summary是messages[:summarized_upto]的摘要，后续轮次只需对新移出窗口的消息增量摘要。
+    """
+
+    def __init__(
+        self,
+        conversation_id: str,
+        messages: Optional[List[Dict[str, Any]]] = None,
+        summary: Optional[str] = None,
+        summarized_upto: int = 0,
+        updated_at: Optional[float] = None,
+    ):
+        self.id = conversation_id
+        self.messages = messages or []
+        self.summary = summary
+        self.summarized_upto = summarized_upto
+        self.updated_at = time.time() if updated_at is None else updated_at
+
+    def expired(self, ttl: float) -> bool:
+        return time.time() - self.updated_at > ttl
+
+
+class _SQLiteBackend:
+    """会话的SQLite持久化，消息只追加写入，不重写整个历史"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS conversations ("
+                "id TEXT PRIMARY KEY, summary TEXT, summarized_upto INTEGER NOT NULL DEFAULT 0, updated_at REAL NOT NULL)"
+            )
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS conversation_messages ("
+                "conversation_id TEXT NOT NULL, seq INTEGER NOT NULL, message TEXT NOT NULL, "
+                "PRIMARY KEY (conversation_id, seq))"
+            )
+            self._conn.commit()
+
+    def load(self, conversation_id: str) -> Optional[Conversation]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT summary, summarized_upto, updated_at FROM conversations WHERE id = ?", (conversation_id,)
+            ).fetchone()
+            if row is None:
+                return None
+            rows = self._conn.execute(
+                "SELECT message FROM conversation_messages WHERE conversation_id = ? ORDER BY seq", (conversation_id,)
+            ).fetchall()
+        return Conversation(conversation_id, [json.loads(message) for (message,) in rows], row[0], row[1], row[2])
+
+    def append(self, conversation: Conversation, messages: List[Dict[str, Any]]) -> None:
+        """
+        在已保存的消息之后追加messages，并写入会话的摘要状态
+
+        序号在写事务内按MAX(seq)+1分配，多个工作进程同时追加同一会话时互不覆盖。
+        """
+        encoded = [json.dumps(message, ensure_ascii=False) for message in messages]
+        # 连接的上下文管理器在出错时回滚，避免共享连接停留在未结束的事务中
+        with self._lock, self._conn:
+            self._conn.execute("BEGIN IMMEDIATE")
+            (start,) = self._conn.execute(
+                "SELECT COALESCE(MAX(seq), -1) + 1 FROM conversation_messages WHERE conversation_id = ?",
+                (conversation.id,),
+            ).fetchone()
+            self._conn.execute(
+                "INSERT INTO conversations (id, summary, summarized_upto, updated_at) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(id) DO UPDATE SET summary = excluded.summary, "
+                "summarized_upto = excluded.summarized_upto, updated_at = excluded.updated_at",
+                (conversation.id, conversation.summary, conversation.summarized_upto, conversation.updated_at),
+            )
+            self._conn.executemany(
+                "INSERT INTO conversation_messages (conversation_id, seq, message) VALUES (?, ?, ?)",
+                [(conversation.id, seq, message) for seq, message in enumerate(encoded, start)],
+            )
+
+    def delete(self, conversation_id: str) -> None:
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM conversation_messages WHERE conversation_id = ?", (conversation_id,))
+            self._conn.execute("DELETE FROM conversations WHERE id = ?", (conversation_id,))
+
+    def prune(self, before: float) -> int:
+        """删除最后更新时间早于before的会话"""
+        with self._lock, self._conn:
+            ids = [row[0] for row in self._conn.execute("SELECT id FROM conversations WHERE updated_at < ?", (before,))]
+            for conversation_id in ids:
+                self._conn.execute("DELETE FROM conversation_messages WHERE conversation_id = ?", (conversation_id,))
+            self._conn.execute("DELETE FROM conversations WHERE updated_at < ?", (before,))
+        return len(ids)
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class ConversationStore:
+    """
+    按会话ID保存消息历史
+
+    未配置SQLite文件时，内存中按LRU保留最近活跃的会话；配置后以磁盘为准，
+    每轮都从磁盘重新加载，其他工作进程追加的消息也能读到。超过TTL未更新的会话视为不存在，
+    读取时一并删除。
+    """
+
+    def __init__(
+        self,
+        max_active: int = CONVERSATION_MAX_ACTIVE,
+        ttl: float = CONVERSATION_TTL,
+        db_path: Optional[str] = CONVERSATION_DB_PATH,
+    ):
+        self.max_active = max_active
+        self.ttl = ttl
+        self._conversations: "OrderedDict[str, Conversation]" = OrderedDict()
+        self._backend = _SQLiteBackend(db_path) if db_path else None
+        self._writes = 0
+
+    async def get(self, conversation_id: str) -> Conversation:
+        """读取会话，不存在或已过期时返回新的空会话"""
+        if self._backend is not None:
+            conversation = await asyncio.to_thread(self._backend.load, conversation_id)
+        else:
+            conversation = self._conversations.get(conversation_id)
+        if conversation is not None and conversation.expired(self.ttl):
+            await self.delete(conversation_id)
+            conversation = None
+        if conversation is None:
+            conversation = Conversation(conversation_id)
+        if self._backend is None:
+            self._remember(conversation)
+        return conversation
+
+    async def append(self, conversation: Conversation, messages: List[Dict[str, Any]]) -> None:
+        """追加消息并保存会话（包括摘要状态的变化）"""
+        conversation.messages.extend(messages)
+        conversation.updated_at = time.time()
+        if self._backend is None:
+            self._remember(conversation)
+        else:
+            await asyncio.to_thread(self._backend.append, conversation, messages)
+            self._writes += 1
+            # 定期清理磁盘上过期的会话
+            if self._writes % 500 == 0:
+                removed = await asyncio.to_thread(self._backend.prune, time.time() - self.ttl)
+                if removed:
+                    logger.info(f"已清理 {removed} 个过期会话")
+
+    async def delete(self, conversation_id: str) -> None:
+        self._conversations.pop(conversation_id, None)
+        if self._backend is not None:
+            await asyncio.to_thread(self._backend.delete, conversation_id)
+
+    def close(self) -> None:
+        if self._backend is not None:
+            self._backend.close()
+            self._backend = None
+
+    def _remember(self, conversation: Conversation) -> None:
+        self._conversations[conversation.id] = conversation
+        self._conversations.move_to_end(conversation.id)
+        while len(self._conversations) > self.max_active:
+            self._conversations.popitem(last=False)
+
+
+# 应用共享的会话存储
+conversation_store = ConversationStore()
@@ -0,0 +1,141 @@
+from typing import Any, Optional
+from collections import OrderedDict
+import asyncio
+import json
+import os
+import time
+import uuid
+import logging
+
+# 配置日志
+logger = logging.getLogger("app.services.disk_cache")
+
+
+def atomic_write_json(path: str, data: Any, mode: int = 0o666, **dump_kwargs: Any) -> None:
+    """
+    将data以JSON格式写入path
+
+    先写入同目录下的临时文件再原子替换，并发读取（包括其他工作进程）不会读到写了一半的文件。
+    mode为新文件的权限（仍受umask限制），临时文件创建时即使用该权限。
+    写入失败时删除临时文件并抛出异常，由调用方决定如何记录。
+    """
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    try:
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, mode)
+        with open(fd, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, **dump_kwargs)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+class CacheEntry:
+    """缓存中的单条记录，ttl为None时由调用方在读取时给出TTL"""
+
+    def __init__(self, value: Any, ttl: Optional[float] = None, stored_at: Optional[float] = None):
+        self.value = value
+        self.ttl = ttl
+        # 使用墙钟时间，磁盘缓存在重启后也能正确判断是否过期
+        self.stored_at = time.time() if stored_at is None else stored_at
+
+    def expired(self, ttl: Optional[float] = None) -> bool:
+        ttl = self.ttl if ttl is None else ttl
+        return ttl is not None and time.time() - self.stored_at > ttl
+
+
+class DiskBackedLRU:
+    """
+    按LRU淘汰的内存缓存，配置了目录时每条记录同时写入一个JSON文件
+
+    内存未命中时从磁盘加载，应用重启后以及同一台机器上的多个工作进程之间均可复用。
+    磁盘读写在线程池中执行，不阻塞事件循环。自带TTL的记录在磁盘上过期后被删除，
+    其余的过期判断由调用方完成。
+    """
+
+    def __init__(self, max_entries: int, cache_dir: Optional[str] = None):
+        self.max_entries = max_entries
+        self.cache_dir = cache_dir
+        self._entries: "OrderedDict[str, CacheEntry]" = OrderedDict()
+        self.disk_hits = 0
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def peek(self, key: str) -> Optional[CacheEntry]:
+        """只查内存，不改变LRU顺序"""
+        return self._entries.get(key)
+
+    async def get(self, key: str) -> Optional[CacheEntry]:
+        """读取记录，内存未命中时从磁盘加载"""
+        entry = self._entries.get(key)
+        if entry is None and self.cache_dir:
+            entry = await self._run_io(self._read_disk, key)
+            if entry is not None:
+                self.disk_hits += 1
+        if entry is not None:
+            self._remember(key, entry)
+        return entry
+
+    async def put(self, key: str, entry: CacheEntry) -> None:
+        self._remember(key, entry)
+        if self.cache_dir:
+            await self._run_io(self._write_disk, key, entry)
+
+    def pop(self, key: str) -> None:
+        """从内存中移除"""
+        self._entries.pop(key, None)
+
+    async def remove_from_disk(self, key: str) -> None:
+        if self.cache_dir:
+            await self._run_io(self._remove_disk, key)
+
+    def _remember(self, key: str, entry: CacheEntry) -> None:
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _disk_path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def _read_disk(self, key: str) -> Optional[CacheEntry]:
+        path = self._disk_path(key)
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            entry = CacheEntry(data["value"], data.get("ttl"), data["stored_at"])
+        except Exception as e:
+            logger.warning(f"读取磁盘缓存 {path} 失败: {str(e)}")
+            return None
+        if entry.ttl is not None and entry.expired():
+            self._remove_disk(key)
+            return None
+        return entry
+
+    def _write_disk(self, key: str, entry: CacheEntry) -> None:
+        path = self._disk_path(key)
+        try:
+            atomic_write_json(path, {"stored_at": entry.stored_at, "ttl": entry.ttl, "value": entry.value}, default=str)
+        except Exception as e:
+            logger.warning(f"写入磁盘缓存 {path} 失败: {str(e)}")
+
+    def _remove_disk(self, key: str) -> None:
+        path = self._disk_path(key)
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.error(f"删除磁盘缓存 {path} 时出错: {str(e)}")
+
+    @staticmethod
+    async def _run_io(func, *args):
+        return await asyncio.get_running_loop().run_in_executor(None, func, *args)
@@ -0,0 +1,110 @@
+from openai import AsyncOpenAI
+from typing import Dict, Any, Optional, Union
+import os
+import logging
+import httpx
+
+from app.services.llm_router import LLMRouter, LLM_PROVIDERS_CONFIG, build_router, load_provider_config
+
+# 配置日志
+logger = logging.getLogger("app.services.llm")
+
+# 大模型接口地址与HTTP连接池参数，可通过环境变量调整
+LLM_BASE_URL = os.environ.get("LLM_BASE_URL", "https://ark.cn-beijing.volces.com/api/v3")
+LLM_MAX_CONNECTIONS = int(os.environ.get("LLM_MAX_CONNECTIONS", "500"))
+LLM_MAX_KEEPALIVE_CONNECTIONS = int(os.environ.get("LLM_MAX_KEEPALIVE_CONNECTIONS", "100"))
+LLM_KEEPALIVE_EXPIRY = float(os.environ.get("LLM_KEEPALIVE_EXPIRY", "60"))
+LLM_CONNECT_TIMEOUT = float(os.environ.get("LLM_CONNECT_TIMEOUT", "10"))
+LLM_READ_TIMEOUT = float(os.environ.get("LLM_READ_TIMEOUT", "120"))
+LLM_MAX_RETRIES = int(os.environ.get("LLM_MAX_RETRIES", "2"))
+
+
+class LLMService:
+    """
+    应用级共享的异步大模型客户端
+
+    所有请求复用同一个带keep-alive连接池的HTTP客户端，
+    模型调用不会阻塞事件循环。设置了LLM_PROVIDERS_CONFIG时返回多提供方路由，
+    接口与AsyncOpenAI相同。
+    """
+
+    def __init__(self, base_url: str = LLM_BASE_URL, providers_config: Optional[str] = LLM_PROVIDERS_CONFIG):
+        self.base_url = base_url
+        self.providers_config = providers_config
+        self._client: Optional[Union[AsyncOpenAI, LLMRouter]] = None
+
+    async def start(self) -> None:
+        """创建连接池；未设置API密钥时推迟到首次调用"""
+        if os.environ.get("ARK_API_KEY") or self.providers_config:
+            self.get_client()
+
+    async def close(self) -> None:
+        """关闭HTTP连接池"""
+        if self._client is not None:
+            await self._client.close()
+            self._client = None
+            logger.info("大模型客户端连接池已关闭")
+
+    def get_client(self) -> Union[AsyncOpenAI, LLMRouter]:
+        """
+        获取共享的异步OpenAI客户端（或接口相同的多提供方路由）
+
+        Returns:
+            AsyncOpenAI客户端或LLMRouter
+
+        Raises:
+            ValueError: 未设置API密钥
+        """
+        if self._client is not None:
+            return self._client
+
+        if self.providers_config:
+            # 路由在提供方之间切换，单个提供方内不再重试
+            self._client = build_router(
+                load_provider_config(self.providers_config),
+                lambda base_url, api_key: self._create_client(base_url, api_key, max_retries=0),
+            )
+            return self._client
+
+        api_key = os.environ.get("ARK_API_KEY")
+        if not api_key:
+            raise ValueError("未设置API密钥，请设置ARK_API_KEY环境变量")
+        self._client = self._create_client(self.base_url, api_key, LLM_MAX_RETRIES)
+        return self._client
+
+    def stats(self) -> Dict[str, Any]:
+        """各提供方的延迟与错误率，未使用多提供方路由时为空"""
+        if isinstance(self._client, LLMRouter):
+            return self._client.stats()
+        return {}
+
+    @staticmethod
+    def _create_client(base_url: str, api_key: str, max_retries: int) -> AsyncOpenAI:
+        http_client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=LLM_MAX_CONNECTIONS,
+                max_keepalive_connections=LLM_MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=LLM_KEEPALIVE_EXPIRY,
+            ),
+            timeout=httpx.Timeout(LLM_READ_TIMEOUT, connect=LLM_CONNECT_TIMEOUT),
+        )
+        client = AsyncOpenAI(
+            base_url=base_url,
+            api_key=api_key,
+            http_client=http_client,
+            max_retries=max_retries,
+        )
+        logger.info(f"已创建大模型客户端连接池: {base_url}，最大连接数 {LLM_MAX_CONNECTIONS}")
+        return client
+
+
+# 全局共享的大模型服务实例
+_llm_service: Optional[LLMService] = None
+
+# 依赖注入函数
+def get_llm_service():
+    """FastAPI依赖注入，获取LLMService实例"""
+    global _llm_service
+    if _llm_service is None:
+        _llm_service = LLMService()
+    return _llm_service
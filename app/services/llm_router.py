@@ -0,0 +1,370 @@
+from openai import AsyncOpenAI
+from typing import Dict, Any, List, Optional, Callable, Awaitable, Set, Tuple
+import asyncio
+import json
+import os
+import random
+import time
+import logging
+
+import openai
+
+from app.services.metrics import LLM_PROVIDER_REQUESTS_TOTAL, LLM_PROVIDER_TTFT_SECONDS, LLM_HEDGED_REQUESTS_TOTAL
+
+# 配置日志
+logger = logging.getLogger("app.services.llm.router")
+
+# 多提供方配置文件（JSON），未设置时只使用LLM_BASE_URL一个提供方
+LLM_PROVIDERS_CONFIG = os.environ.get("LLM_PROVIDERS_CONFIG")
+# 流式请求等待首个数据块的超时（秒），超时后切换到下一个提供方
+LLM_TTFT_TIMEOUT = float(os.environ.get("LLM_TTFT_TIMEOUT", "30"))
+# 流式请求超过该时间（秒）仍未收到首个数据块时，向下一个提供方再发一次请求；0表示不对冲
+LLM_HEDGE_DELAY = float(os.environ.get("LLM_HEDGE_DELAY", "0"))
+# 按概率随机选择提供方，使延迟较高的提供方也能持续更新统计
+LLM_ROUTE_EXPLORE = float(os.environ.get("LLM_ROUTE_EXPLORE", "0.05"))
+# 请求失败后暂停使用该提供方的时间（秒），连续失败时加倍
+LLM_PROVIDER_COOLDOWN = float(os.environ.get("LLM_PROVIDER_COOLDOWN", "5"))
+LLM_PROVIDER_MAX_COOLDOWN = float(os.environ.get("LLM_PROVIDER_MAX_COOLDOWN", "120"))
+
+# 延迟与错误率的指数移动平均系数
+EWMA_ALPHA = 0.2
+# 错误率对路由评分的放大系数
+ERROR_PENALTY = 4.0
+# 未声明能力时的默认值
+DEFAULT_CAPABILITIES = {"tools": True, "stream": True, "stream_usage": True}
+
+
+class NoProviderError(Exception):
+    """没有可以处理该模型或所需能力的提供方"""
+
+
+def is_retryable(error: BaseException) -> bool:
+    """超时、连接失败、5xx和429可以换一个提供方重试，其他错误（如参数错误）直接返回"""
+    if isinstance(error, (openai.APIConnectionError, asyncio.TimeoutError)):
+        return True
+    if isinstance(error, openai.APIStatusError):
+        return error.status_code >= 500 or error.status_code == 429
+    return False
+
+
+class LLMProvider:
+    """
+    一个OpenAI兼容的模型提供方
+
+    models把请求中的模型名映射到提供方的模型名及其能力，"*" 表示接受任意模型名并原样转发。
+    """
+
+    def __init__(self, name: str, client: AsyncOpenAI, models: Dict[str, Dict[str, Any]], timeout: Optional[float] = None):
+        self.name = name
+        self.client = client
+        self.models = models
+        self.timeout = timeout
+        # 流式首个数据块延迟和非流式完成耗时的移动平均（秒），None表示尚无样本
+        self.ttft_ewma: Optional[float] = None
+        self.completion_ewma: Optional[float] = None
+        self.error_ewma = 0.0
+        self.failures = 0
+        self.cooldown_until = 0.0
+        self.requests = 0
+
+    def model_spec(self, model: str) -> Optional[Dict[str, Any]]:
+        """提供方对该模型的映射与能力，不提供该模型时返回None"""
+        spec = self.models.get(model)
+        if isinstance(spec, str):
+            spec = {"name": spec}
+        if spec is None and "*" in self.models:
+            spec = {**self.models["*"], "name": model}
+        if spec is None:
+            return None
+        return {**DEFAULT_CAPABILITIES, "name": model, **spec}
+
+    def available(self) -> bool:
+        return time.monotonic() >= self.cooldown_until
+
+    def score(self, stream: bool) -> float:
+        """路由评分，越小越优先；没有延迟样本的提供方优先尝试"""
+        latency = self.ttft_ewma if stream else self.completion_ewma
+        if latency is None:
+            return 0.0
+        return latency * (1 + ERROR_PENALTY * self.error_ewma)
+
+    def record_latency(self, latency: float, stream: bool) -> None:
+        """
+        更新延迟的移动平均
+
+        对冲中落败被取消的请求也会记录已等待的时间（实际延迟只会更长），
+        避免慢速提供方因为一直没有完成的样本而始终被优先选择。
+        """
+        if stream:
+            self.ttft_ewma = latency if self.ttft_ewma is None else self.ttft_ewma + EWMA_ALPHA * (latency - self.ttft_ewma)
+        else:
+            self.completion_ewma = (
+                latency if self.completion_ewma is None else self.completion_ewma + EWMA_ALPHA * (latency - self.completion_ewma)
+            )
+
+    def record_success(self, latency: float, stream: bool) -> None:
+        self.record_latency(latency, stream)
+        if stream:
+            LLM_PROVIDER_TTFT_SECONDS.observe(latency, provider=self.name)
+        self.error_ewma -= EWMA_ALPHA * self.error_ewma
+        self.failures = 0
+        self.cooldown_until = 0.0
+        LLM_PROVIDER_REQUESTS_TOTAL.inc(provider=self.name, result="ok")
+
+    def record_failure(self, error: BaseException) -> None:
+        LLM_PROVIDER_REQUESTS_TOTAL.inc(provider=self.name, result="error")
+        # 参数错误等不可重试的4xx由请求本身导致，不影响提供方的错误率和暂停时间
+        if not is_retryable(error):
+            return
+        self.error_ewma += EWMA_ALPHA * (1 - self.error_ewma)
+        self.failures += 1
+        cooldown = min(LLM_PROVIDER_COOLDOWN * 2 ** (self.failures - 1), LLM_PROVIDER_MAX_COOLDOWN)
+        self.cooldown_until = time.monotonic() + cooldown
+        logger.warning(f"模型提供方 {self.name} 请求失败，暂停使用 {cooldown:.0f}s: {type(error).__name__}: {str(error)}")
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "requests": self.requests,
+            "ttft_ms": round(self.ttft_ewma * 1000, 1) if self.ttft_ewma is not None else None,
+            "completion_ms": round(self.completion_ewma * 1000, 1) if self.completion_ewma is not None else None,
+            "error_rate": round(self.error_ewma, 3),
+            "cooling_down": not self.available(),
+        }
+
+
+class _RoutedStream:
+    """已收到首个数据块的流式响应，迭代时先返回该数据块"""
+
+    def __init__(self, provider: LLMProvider, stream: Any, iterator: Any, first_chunk: Any):
+        self.provider = provider
+        self._stream = stream
+        self._iterator = iterator
+        self._first_chunk = first_chunk
+
+    async def __aiter__(self):
+        if self._first_chunk is None:
+            return
+        yield self._first_chunk
+        async for chunk in self._iterator:
+            yield chunk
+
+    async def close(self) -> None:
+        await self._stream.close()
+
+
+class _Completions:
+    def __init__(self, router: "LLMRouter"):
+        self.create = router.create
+
+
+class _Chat:
+    def __init__(self, router: "LLMRouter"):
+        self.completions = _Completions(router)
+
+
+class LLMRouter:
+    """
+    多提供方的模型路由
+
+    对外提供与AsyncOpenAI相同的 chat.completions.create 接口。每次请求在支持该模型及所需能力
+    （工具调用、流式）的提供方中，按延迟和错误率的移动平均选择最优者；超时、连接失败和5xx时
+    切换到下一个提供方。流式请求可以在首个数据块迟迟未到时对冲：同时向下一个提供方发出请求，
+    采用先返回首个数据块的一方。
+    """
+
+    def __init__(
+        self,
+        providers: List[LLMProvider],
+        ttft_timeout: float = LLM_TTFT_TIMEOUT,
+        hedge_delay: float = LLM_HEDGE_DELAY,
+        explore: float = LLM_ROUTE_EXPLORE,
+    ):
+        self.providers = providers
+        self.ttft_timeout = ttft_timeout
+        self.hedge_delay = hedge_delay
+        self.explore = explore
+        self.chat = _Chat(self)
+        self._closing: Set[asyncio.Task] = set()
+
+    async def close(self) -> None:
+        for provider in self.providers:
+            await provider.client.close()
+
+    def candidates(self, model: str, stream: bool, tools: bool) -> List[Tuple[LLMProvider, Dict[str, Any]]]:
+        """
+        按优先顺序返回可以处理该请求的提供方
+
+        暂停使用中的提供方排在最后，全部暂停时仍会尝试；随机探索只在未暂停的提供方中进行。
+        """
+        matched = []
+        for provider in self.providers:
+            spec = provider.model_spec(model)
+            if spec is None or (tools and not spec["tools"]) or (stream and not spec["stream"]):
+                continue
+            matched.append((provider, spec))
+        if not matched:
+            raise NoProviderError(f"没有可以处理模型 {model} 的提供方（需要{'工具调用、' if tools else ''}{'流式' if stream else '非流式'}）")
+        matched.sort(key=lambda item: (not item[0].available(), item[0].score(stream)))
+        healthy = sum(1 for provider, _ in matched if provider.available())
+        if healthy > 1 and random.random() < self.explore:
+            matched.insert(0, matched.pop(random.randrange(1, healthy)))
+        return matched
+
+    async def create(self, **kwargs: Any) -> Any:
+        """与AsyncOpenAI的chat.completions.create参数相同，model为请求中的模型名"""
+        stream = bool(kwargs.get("stream"))
+        candidates = self.candidates(kwargs["model"], stream, bool(kwargs.get("tools")))
+        if stream:
+            return await self._race(candidates, kwargs, self._open_stream, self.hedge_delay)
+        return await self._race(candidates, kwargs, self._complete, 0.0)
+
+    async def _race(
+        self,
+        candidates: List[Tuple[LLMProvider, Dict[str, Any]]],
+        kwargs: Dict[str, Any],
+        opener: Callable[[LLMProvider, Dict[str, Any]], Awaitable[Any]],
+        hedge_delay: float,
+    ) -> Any:
+        """
+        依次尝试提供方
+
+        失败可重试时立即换下一个；设置了hedge_delay时，当前请求超过该时间未完成也会发出下一个请求，
+        先成功的一方胜出，其余请求取消；其余请求中同时或稍后成功建立的流在后台关闭，释放连接。
+        """
+        remaining = list(candidates)
+        pending: Dict[asyncio.Task, LLMProvider] = {}
+        last_error: Optional[BaseException] = None
+        hedged = False
+
+        def launch() -> None:
+            provider, spec = remaining.pop(0)
+            provider.requests += 1
+            pending[asyncio.ensure_future(opener(provider, self._provider_kwargs(kwargs, spec)))] = provider
+
+        launch()
+        try:
+            while pending:
+                timeout = hedge_delay if hedge_delay > 0 and remaining else None
+                done, _ = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    logger.info(f"模型提供方 {', '.join(p.name for p in pending.values())} 超过 {hedge_delay}s 未响应，发出对冲请求")
+                    hedged = True
+                    launch()
+                    continue
+                for task in done:
+                    provider = pending.pop(task)
+                    error = task.exception()
+                    if error is None:
+                        if hedged:
+                            LLM_HEDGED_REQUESTS_TOTAL.inc(winner=provider.name)
+                        return task.result()
+                    if not is_retryable(error):
+                        raise error
+                    last_error = error
+                    if remaining:
+                        logger.warning(f"模型提供方 {provider.name} 请求失败，切换到 {remaining[0][0].name}")
+                        launch()
+            raise last_error
+        finally:
+            for task in pending:
+                task.cancel()
+                task.add_done_callback(self._discard)
+
+    def _discard(self, task: asyncio.Future) -> None:
+        """关闭落败请求已经建立的流"""
+        if task.cancelled() or task.exception() is not None:
+            return
+        result = task.result()
+        if isinstance(result, _RoutedStream):
+            closing = asyncio.ensure_future(result.close())
+            self._closing.add(closing)
+            closing.add_done_callback(self._closing.discard)
+
+    @staticmethod
+    def _provider_kwargs(kwargs: Dict[str, Any], spec: Dict[str, Any]) -> Dict[str, Any]:
+        """替换为提供方的模型名，去掉提供方不支持的参数"""
+        provider_kwargs = {**kwargs, "model": spec["name"]}
+        if not spec["stream_usage"]:
+            provider_kwargs.pop("stream_options", None)
+        return provider_kwargs
+
+    async def _open_stream(self, provider: LLMProvider, kwargs: Dict[str, Any]) -> _RoutedStream:
+        """发出流式请求并等待首个数据块，超时计为失败；对冲中落败被取消的请求不计为失败"""
+        start = time.perf_counter()
+        try:
+            routed = await asyncio.wait_for(self._first_chunk(provider, kwargs), provider.timeout or self.ttft_timeout)
+        except asyncio.CancelledError:
+            provider.record_latency(time.perf_counter() - start, stream=True)
+            raise
+        except Exception as e:
+            provider.record_failure(e)
+            raise
+        provider.record_success(time.perf_counter() - start, stream=True)
+        return routed
+
+    @staticmethod
+    async def _first_chunk(provider: LLMProvider, kwargs: Dict[str, Any]) -> _RoutedStream:
+        stream = await provider.client.chat.completions.create(**kwargs)
+        iterator = stream.__aiter__()
+        try:
+            first_chunk = await iterator.__anext__()
+        except StopAsyncIteration:
+            first_chunk = None
+        except BaseException:
+            # 超时、取消或出错时释放连接
+            await stream.close()
+            raise
+        return _RoutedStream(provider, stream, iterator, first_chunk)
+
+    async def _complete(self, provider: LLMProvider, kwargs: Dict[str, Any]) -> Any:
+        start = time.perf_counter()
+        if provider.timeout:
+            kwargs = {**kwargs, "timeout": provider.timeout}
+        try:
+            completion = await provider.client.chat.completions.create(**kwargs)
+        except Exception as e:
+            provider.record_failure(e)
+            raise
+        provider.record_success(time.perf_counter() - start, stream=False)
+        return completion
+
+    def stats(self) -> Dict[str, Any]:
+        return {provider.name: provider.snapshot() for provider in self.providers}
+
+
+def load_provider_config(path: str) -> List[Dict[str, Any]]:
+    """
+    读取提供方配置，格式为
+    {"providers": [{"name": "ark", "base_url": "...", "api_key_env": "ARK_API_KEY",
+                    "models": {"doubao-pro": {"name": "ep-xxx", "tools": true}}, "timeout": 20}]}
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f).get("providers") or []
+
+
+def build_router(provider_configs: List[Dict[str, Any]], client_factory: Callable[[str, str], AsyncOpenAI]) -> LLMRouter:
+    """
+    根据配置创建路由
+
+    Args:
+        provider_configs: 提供方配置列表
+        client_factory: 根据 (base_url, api_key) 创建客户端的函数
+
+    Raises:
+        ValueError: 没有任何提供方设置了API密钥
+    """
+    providers = []
+    for idx, config in enumerate(provider_configs):
+        name = config.get("name") or f"provider{idx}"
+        api_key = config.get("api_key") or os.environ.get(config.get("api_key_env", "ARK_API_KEY"))
+        if not api_key:
+            logger.warning(f"模型提供方 {name} 未设置API密钥，已跳过")
+            continue
+        models = config.get("models") or {"*": {}}
+        if isinstance(models, list):
+            models = {model: {} for model in models}
+        providers.append(LLMProvider(name, client_factory(config["base_url"], api_key), models, config.get("timeout")))
+    if not providers:
+        raise ValueError("未设置API密钥，请为模型提供方设置ARK_API_KEY或配置中的api_key_env环境变量")
+    logger.info(f"已加载 {len(providers)} 个模型提供方: {', '.join(provider.name for provider in providers)}")
+    return LLMRouter(providers)
@@ -0,0 +1,151 @@
+from typing import Any, Optional
+from logging.handlers import QueueHandler, QueueListener
+import atexit
+import copy
+import hashlib
+import json
+import logging
+import os
+import queue
+import random
+import sys
+
+# 日志级别与格式：text为普通文本，json为每行一个JSON对象，便于日志系统解析
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.environ.get("LOG_FORMAT", "text").lower()
+# 热路径（每个请求、每次工具调用）上INFO/DEBUG日志的采样率，1表示全部记录
+LOG_SAMPLE_RATE = float(os.environ.get("LOG_SAMPLE_RATE", "1"))
+# 日志中单个参数、结果等载荷的最大字符数，超出部分截断并附带摘要
+LOG_MAX_PAYLOAD_CHARS = int(os.environ.get("LOG_MAX_PAYLOAD_CHARS", "200"))
+
+TEXT_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+
+# LogRecord的标准属性，其余属性视为通过extra传入的结构化字段
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+_listener: Optional[QueueListener] = None
+_EXC_FORMATTER = logging.Formatter()
+
+
+class Payload:
+    """
+    日志中的大载荷
+
+    只有日志真正输出时才序列化；超过长度上限时截断，并附带总长度和SHA-1摘要，
+    便于在不输出全文的情况下比较两次请求的内容是否相同。
+    """
+
+    __slots__ = ("value", "limit")
+
+    def __init__(self, value: Any, limit: int = LOG_MAX_PAYLOAD_CHARS):
+        self.value = value
+        self.limit = limit
+
+    def __str__(self) -> str:
+        value = self.value
+        text = value if isinstance(value, str) else json.dumps(value, ensure_ascii=False, default=str)
+        if len(text) <= self.limit:
+            return text
+        digest = hashlib.sha1(text.encode("utf-8")).hexdigest()[:12]
+        return f"{text[:self.limit]}...(len={len(text)}, sha1={digest})"
+
+    __repr__ = __str__
+
+
+class SampledLogger:
+    """
+    按采样率记录INFO/DEBUG日志的包装器
+
+    在创建日志记录之前决定是否采样，未采样的日志不产生任何格式化开销。
+    WARNING及以上级别的日志应直接使用原始logger，不做采样。
+    """
+
+    def __init__(self, logger: logging.Logger, rate: Optional[float] = None):
+        self.logger = logger
+        self.rate = LOG_SAMPLE_RATE if rate is None else rate
+
+    def sampled(self, level: int = logging.INFO) -> bool:
+        """本次是否记录，日志参数计算代价较大时可先调用此方法判断"""
+        if not self.logger.isEnabledFor(level):
+            return False
+        return self.rate >= 1 or random.random() < self.rate
+
+    def debug(self, msg: str, *args: Any, **kwargs: Any) -> None:
+        if self.sampled(logging.DEBUG):
+            self.logger.debug(msg, *args, stacklevel=2, **kwargs)
+
+    def info(self, msg: str, *args: Any, **kwargs: Any) -> None:
+        if self.sampled(logging.INFO):
+            self.logger.info(msg, *args, stacklevel=2, **kwargs)
+
+
+class JsonFormatter(logging.Formatter):
+    """每条日志输出为一行JSON，extra传入的字段作为顶层键"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        data = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS and not key.startswith("_"):
+                data[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            data["exception"] = record.exc_text
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
+class _DeferredQueueHandler(QueueHandler):
+    """
+    不做格式化的队列处理器
+
+    标准QueueHandler.prepare会在调用线程中格式化消息并清除异常信息，
+    这里只复制日志记录，消息由后台线程格式化；异常堆栈在调用线程中转为文本缓存到exc_text，
+    避免队列中的记录长期持有栈帧，格式化器仍可将其作为异常输出。
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        if record.exc_info:
+            if not record.exc_text:
+                record.exc_text = _EXC_FORMATTER.formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def setup_logging() -> None:
+    """
+    配置根日志器
+
+    应用线程只把日志记录放入内存队列，消息格式化和写出由后台线程完成，
+    日志I/O不会阻塞事件循环。日志参数在写出时才格式化，不应在记录后修改。重复调用无效。
+    """
+    global _listener
+    if _listener is not None:
+        return
+
+    handler = logging.StreamHandler(sys.stderr)
+    handler.setFormatter(JsonFormatter() if LOG_FORMAT == "json" else logging.Formatter(TEXT_FORMAT))
+
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    root = logging.getLogger()
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+    root.addHandler(_DeferredQueueHandler(log_queue))
+    root.setLevel(LOG_LEVEL)
+
+    _listener = QueueListener(log_queue, handler, respect_handler_level=True)
+    _listener.start()
+    atexit.register(stop_logging)
+
+
+def stop_logging() -> None:
+    """停止后台日志线程，写出队列中剩余的日志"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
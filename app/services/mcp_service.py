@@ -1,19 +1,129 @@
 from fastmcp import Client
 from typing import Dict, Any, List, Optional, Tuple, Union
-import json
 import os
-import tempfile
+import time
+import asyncio
 import logging
+from collections import OrderedDict
 from fastapi import Depends
+import mcp.types
 from fastmcp.client import SSETransport, StdioTransport, StreamableHttpTransport
 from fastmcp.client.transports import StdioTransport, SSETransport, StreamableHttpTransport, ClientTransport
+from fastmcp.exceptions import ToolError
+
+from app.services.session_pool import MCPSessionPool, normalize_server_config
+from app.services.tool_router import ToolRouter
+from app.services.tool_cache import ToolSchemaCache
+from app.services.config_registry import ServerConfigRegistry, CONFIG_REGISTRY_PATH
+from app.services.metrics import MCP_LIST_TOOLS_SECONDS, MCP_CALL_TOOL_SECONDS, MCP_HEDGED_CALLS_TOTAL, record_error
+from app.services.circuit_breaker import BreakerRegistry, CircuitBreaker, CircuitOpenError
+from app.services.tracing import tracer, trace_meta, traced_http_client_factory
+from app.services.logging_utils import Payload, SampledLogger
+from app.services.result_shaper import render_tool_content
 
 # 配置日志
 logger = logging.getLogger("app.services.mcp")
+# 每次请求、每次工具调用都会执行的日志按采样率记录
+hot_logger = SampledLogger(logger)
+
+# 工具发现的单服务器超时和整体预算（秒）
+DISCOVERY_SERVER_TIMEOUT = float(os.environ.get("MCP_DISCOVERY_SERVER_TIMEOUT", "5"))
+DISCOVERY_BUDGET = float(os.environ.get("MCP_DISCOVERY_BUDGET", "8"))
+# 缓存的传输对象数量上限
+TRANSPORT_CACHE_SIZE = int(os.environ.get("MCP_TRANSPORT_CACHE_SIZE", "256"))
+# 单次请求（获取工具列表、调用工具）的超时（秒），超时计为端点失败
+CALL_TIMEOUT = float(os.environ.get("MCP_CALL_TIMEOUT", "30"))
+# 对冲请求：首个请求超过该时间（秒）仍未返回时，向下一个副本发出相同请求
+HEDGE_DELAY = float(os.environ.get("MCP_HEDGE_DELAY", "0.3"))
+
+
+def server_endpoints(server_name: str, server_config: Dict[str, Any]) -> List[Tuple[str, Dict[str, Any]]]:
+    """
+    服务器的全部端点
+
+    第一个为主配置，其后为replicas中的副本；副本未设置的字段沿用主配置。
+
+    Returns:
+        (端点名称, 端点配置) 列表
+    """
+    endpoints = [(server_name, server_config)]
+    base = {key: value for key, value in server_config.items() if key != "replicas"}
+    for idx, replica in enumerate(server_config.get("replicas") or [], 1):
+        endpoints.append((f"{server_name}[{idx}]", {**base, **replica}))
+    return endpoints
+
 
 class MCPService:
     """用于处理外部MCP服务器连接和工具调用的服务"""
     
+    def __init__(self):
+        # 跨请求共享的长连接会话池
+        self.pool = MCPSessionPool(self._open_transport, notification_handler=self._handle_notification)
+        # 工具名到所属服务器的路由索引
+        self.router = ToolRouter()
+        # 转换后的工具定义缓存，过期记录在服务器超时时作为后备
+        self.tool_cache = ToolSchemaCache()
+        # 正在进行的工具查询，避免对同一服务器重复查询
+        self._discovery_tasks: Dict[str, asyncio.Task] = {}
+        # 最近一次工具发现中各服务器的状态与耗时
+        self.last_discovery_report: Dict[str, Dict[str, Any]] = {}
+        # 按规范化配置缓存的传输对象
+        self._transports: "OrderedDict[str, ClientTransport]" = OrderedDict()
+        # 可选的服务器配置登记表，仅在设置MCP_CONFIG_REGISTRY_PATH时启用
+        self.config_registry = ServerConfigRegistry(CONFIG_REGISTRY_PATH) if CONFIG_REGISTRY_PATH else None
+        # 每个服务器端点的熔断器
+        self.breakers = BreakerRegistry()
+    
+    async def start(self):
+        """启动会话池的后台维护任务"""
+        await self.pool.start()
+    
+    async def close(self):
+        """取消未完成的工具查询并关闭所有池化的会话"""
+        for task in list(self._discovery_tasks.values()):
+            task.cancel()
+        await self.pool.close()
+    
+    async def warm_up(self, config: Dict[str, Any]) -> Dict[str, bool]:
+        """
+        预先连接配置中的所有服务器
+        
+        Args:
+            config: MCP配置信息，必须包含mcpServers字段
+        
+        Returns:
+            每个服务器是否预热成功
+        """
+        if "mcpServers" not in config:
+            logger.error("配置中缺少mcpServers字段")
+            return {}
+        return await self.pool.warm_up(config["mcpServers"])
+    
+    async def warm_up_registered(self) -> Dict[str, bool]:
+        """预热登记表中记录的服务器，未启用登记表时不做任何事"""
+        if self.config_registry is None:
+            return {}
+        servers = await self.config_registry.load()
+        if not servers:
+            return {}
+        return await self.pool.warm_up(servers)
+    
+    async def _handle_notification(self, key: str, server_name: str, notification: Any) -> None:
+        """处理服务器推送的通知，工具列表变化时使路由索引失效"""
+        if isinstance(notification, mcp.types.ToolListChangedNotification):
+            logger.info(f"服务器 {server_name} 的工具列表已变化")
+            self.router.invalidate(key)
+            await self.tool_cache.invalidate(key)
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """返回会话池、工具缓存与最近一次工具发现的状态"""
+        return {
+            "pool": self.pool.stats(),
+            "tool_cache": self.tool_cache.stats(),
+            "last_discovery": self.last_discovery_report,
+            "circuit_breakers": self.breakers.stats(),
+        }
+    
     async def get_tools_from_config(self, config: Dict[str, Any]) -> List[Dict[str, Any]]:
         """
         从MCP配置中获取工具列表，转换为大模型可用的格式
@@ -31,7 +141,8 @@ class MCPService:
                 return []
                 
             # 获取外部MCP服务器工具
-            return await self._get_tools_from_external_servers(config)
+            with tracer.span("mcp.get_tools", servers=len(config["mcpServers"])):
+                return await self._get_tools_from_external_servers(config)
         except Exception as e:
             logger.error(f"获取MCP工具时出错: {str(e)}", exc_info=True)
             return []
@@ -53,22 +164,16 @@ class MCPService:
                 url = server_config["url"]
                 headers = server_config.get("headers", {})
                 
-                logger.info(f"创建传输对象，类型: {transport_type}, URL: {url}")
+                logger.debug("创建传输对象，类型: %s, URL: %s", transport_type, url)
                 
                 if transport_type == "streamable-http":
                     # 使用Streamable HTTP传输
                     # 确保URL格式正确，不需要额外添加参数
                     # 注意: StreamableHttpTransport和SSETransport需要不同的URL格式
-                    logger.info(f"创建Streamable HTTP传输: URL={url}")
-                    transport = StreamableHttpTransport(url=url, headers=headers)
-                    logger.info(f"Streamable HTTP传输创建成功")
-                    return transport
+                    return StreamableHttpTransport(url=url, headers=headers, httpx_client_factory=traced_http_client_factory)
                 else:
                     # 默认使用SSE传输
-                    logger.info(f"创建SSE传输: URL={url}")
-                    transport = SSETransport(url=url, headers=headers)
-                    logger.info(f"SSE传输创建成功")
-                    return transport
+                    return SSETransport(url=url, headers=headers, httpx_client_factory=traced_http_client_factory)
             elif "command" in server_config:
                 # 命令行服务器
                 command = server_config["command"]
@@ -79,7 +184,7 @@ class MCPService:
                 if "env" in server_config:
                     env.update(server_config["env"])
                 
-                logger.info(f"创建Stdio传输，命令: {command}")
+                logger.debug("创建Stdio传输，命令: %s", command)
                 return StdioTransport(command=command, args=args, env=env)
             else:
                 logger.error("无效的服务器配置: 缺少url或command字段")
@@ -88,75 +193,181 @@ class MCPService:
             logger.error(f"创建MCP传输对象时出错: {str(e)}", exc_info=True)
             return None
     
-    async def _create_temp_config_and_transport(self, server_name: str, server_config: Dict[str, Any]) -> Tuple[Optional[ClientTransport], Optional[str]]:
+    async def _open_transport(self, server_name: str, server_config: Dict[str, Any]) -> Optional[ClientTransport]:
+        """
+        会话池建立新连接时调用的传输工厂
+        
+        HTTP传输对象只是连接参数的载体，按规范化后的配置缓存复用；
+        stdio传输各自持有一个子进程，因此每个会话单独创建。
+        整个过程不涉及磁盘I/O。
+        """
+        if "command" in server_config:
+            transport = self._create_transport(server_config)
+        else:
+            transport = self._memoized_transport(server_config)
+        
+        # 显式启用登记表时记录配置，供重启后预热
+        if transport is not None and self.config_registry is not None:
+            await self.config_registry.register(server_name, server_config)
+        return transport
+    
+    def _memoized_transport(self, server_config: Dict[str, Any]) -> Optional[ClientTransport]:
+        """按规范化后的配置返回缓存的传输对象"""
+        key = normalize_server_config(server_config)
+        transport = self._transports.get(key)
+        if transport is None:
+            transport = self._create_transport(server_config)
+            if transport is None:
+                return None
+            self._transports[key] = transport
+            while len(self._transports) > TRANSPORT_CACHE_SIZE:
+                self._transports.popitem(last=False)
+        else:
+            self._transports.move_to_end(key)
+        return transport
+    
+    async def _get_tools_from_external_servers(self, config: Dict[str, Any]) -> List[Dict[str, Any]]:
         """
-        创建临时配置文件和MCP传输对象
+        从外部MCP服务器配置获取工具列表
+        
+        工具定义缓存命中的服务器直接跳过发现，其余服务器并发查询，
+        每个服务器有单独的超时，整体受发现预算约束。
+        未能按时返回的服务器使用最近一次成功获取的工具列表，没有则跳过。
+        """
+        servers = config.get("mcpServers", {})
+        deadline = asyncio.get_running_loop().time() + DISCOVERY_BUDGET
+        
+        names = list(servers.keys())
+        results = await asyncio.gather(
+            *(self._get_server_tools(name, servers[name], deadline) for name in names)
+        )
+        
+        all_tools = []
+        owners: Dict[str, List[str]] = {}
+        report: Dict[str, Dict[str, Any]] = {}
+        for server_name, (tools, status, elapsed_ms) in zip(names, results):
+            report[server_name] = {"status": status, "elapsed_ms": round(elapsed_ms, 1), "tools": len(tools or [])}
+            if not tools:
+                continue
+            
+            # 同名工具只保留配置中靠前的服务器提供的定义
+            for tool in tools:
+                name = tool["function"]["name"]
+                owners.setdefault(name, []).append(server_name)
+                if len(owners[name]) == 1:
+                    all_tools.append(tool)
+        
+        for tool_name, server_names in owners.items():
+            if len(server_names) > 1:
+                logger.warning(f"工具名冲突: {tool_name} 同时由服务器 {server_names} 提供，将使用 {server_names[0]}")
+        
+        self.last_discovery_report = report
+        hot_logger.info("工具发现完成，共 %d 个工具，各服务器耗时: %s", len(all_tools), Payload(report))
+        return all_tools
+    
+    async def _get_server_tools(self, server_name: str, server_config: Dict[str, Any], deadline: float) -> Tuple[Optional[List[Dict[str, Any]]], str, float]:
+        """优先从缓存读取服务器的工具定义，未命中时再进行发现"""
+        with tracer.span("mcp.server_tools", server=server_name) as span:
+            start = time.perf_counter()
+            if not self._available_endpoints(server_name, server_config):
+                # 全部端点熔断中，不提供该服务器的工具，避免模型调用后再失败
+                if span is not None:
+                    span.set_attribute("status", "unhealthy")
+                return None, "unhealthy", 0.0
+            cached = await self.tool_cache.get(server_config)
+            if cached is None:
+                result = await self._discover_with_deadline(server_name, server_config, deadline)
+            else:
+                # 缓存可能来自磁盘，路由索引中没有记录时根据缓存补全
+                if not self.router.is_fresh(server_config):
+                    self.router.update(server_name, server_config, [tool["function"]["name"] for tool in cached])
+                result = (cached, "cached", (time.perf_counter() - start) * 1000)
+            if span is not None:
+                span.set_attribute("status", result[1])
+            return result
+    
+    async def _discover_with_deadline(self, server_name: str, server_config: Dict[str, Any], deadline: float) -> Tuple[Optional[List[Dict[str, Any]]], str, float]:
+        """
+        在截止时间内获取单个服务器的工具列表
         
         Args:
             server_name: 服务器名称
             server_config: 服务器配置
-            
+            deadline: 整体发现预算的截止时间（事件循环时间）
+        
         Returns:
-            包含传输对象和临时文件路径的元组 (transport, temp_file_path)
+            (工具列表, 状态, 耗时毫秒) 元组，状态为 ok / stale / timeout / error
         """
-        # 创建临时配置文件
-        temp_file_path = None
+        start = time.perf_counter()
+        timeout = max(0.0, min(DISCOVERY_SERVER_TIMEOUT, deadline - asyncio.get_running_loop().time()))
+        last_known = await self.tool_cache.get(server_config, allow_stale=True)
+        
+        # 使用shield，超时后查询仍在后台继续，完成时会刷新最近一次的工具列表
+        task = self._discovery_task(server_name, server_config)
         try:
-            with tempfile.NamedTemporaryFile(mode='w', suffix='.json', delete=False) as temp_file:
-                temp_file_path = temp_file.name
-                json.dump({server_name: server_config}, temp_file)
-            
-            # 创建传输对象
-            transport = self._create_transport(server_config)
-            return transport, temp_file_path
-            
+            tools = await asyncio.wait_for(asyncio.shield(task), timeout=timeout)
+            status = "ok"
+        except asyncio.TimeoutError:
+            logger.warning(f"服务器 {server_name} 未能在 {timeout:.1f}s 内返回工具列表")
+            tools = last_known
+            status = "stale" if last_known is not None else "timeout"
+        except CircuitOpenError as e:
+            logger.warning(str(e))
+            tools = None
+            status = "unhealthy"
         except Exception as e:
-            # 如果创建过程中出现错误，尝试清理临时文件
-            if temp_file_path and os.path.exists(temp_file_path):
-                try:
-                    os.unlink(temp_file_path)
-                except:
-                    pass
-            logger.error(f"创建临时配置和传输对象时出错: {str(e)}", exc_info=True)
-            return None, temp_file_path
-            
-    async def _get_tools_from_external_servers(self, config: Dict[str, Any]) -> List[Dict[str, Any]]:
-        """从外部MCP服务器配置获取工具列表"""
-        all_tools = []
-        servers = config.get("mcpServers", {})
+            logger.error(f"从服务器 {server_name} 获取工具时出错: {str(e)}", exc_info=True)
+            tools = last_known
+            status = "stale" if last_known is not None else "error"
         
-        for server_name, server_config in servers.items():
-            temp_file_path = None
+        return tools, status, (time.perf_counter() - start) * 1000
+    
+    def _discovery_task(self, server_name: str, server_config: Dict[str, Any]) -> asyncio.Task:
+        """获取服务器的工具查询任务，同一服务器正在进行的查询会被复用"""
+        key = normalize_server_config(server_config)
+        task = self._discovery_tasks.get(key)
+        if task is None or task.done():
+            task = asyncio.create_task(self._list_server_tools(server_name, server_config))
+            self._discovery_tasks[key] = task
+            task.add_done_callback(lambda t, key=key: self._on_discovery_done(key, t))
+        return task
+    
+    def _on_discovery_done(self, key: str, task: asyncio.Task) -> None:
+        if self._discovery_tasks.get(key) is task:
+            del self._discovery_tasks[key]
+        # 读取异常，避免后台任务失败时产生未处理异常的警告
+        if not task.cancelled():
+            task.exception()
+    
+    async def _list_server_tools(self, server_name: str, server_config: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """获取单个服务器的工具列表，记录到路由索引并写入缓存；主端点不可用时依次尝试副本"""
+        endpoints = self._available_endpoints(server_name, server_config) or server_endpoints(server_name, server_config)[:1]
+        last_error: Optional[Exception] = None
+        for label, endpoint in endpoints:
             try:
-                logger.info(f"尝试连接外部MCP服务器: {server_name}")
-                
-                # 创建传输对象和临时配置
-                transport, temp_file_path = await self._create_temp_config_and_transport(server_name, server_config)
-                
-                if transport:
-                    # 仅在需要时创建客户端
-                    async with Client(transport) as client:
-                        # 获取工具列表
-                        tools = await client.list_tools()
-                        
-                        # 转换工具格式
-                        server_tools = self._convert_tools_to_openai_format(tools)
-                        all_tools.extend(server_tools)
-                        
-                        logger.info(f"从服务器 {server_name} 获取到 {len(server_tools)} 个工具")
-            
+                tools = await self._guarded(label, endpoint, lambda: self._list_endpoint_tools(label, endpoint))
+                break
             except Exception as e:
-                logger.error(f"从服务器 {server_name} 获取工具时出错: {str(e)}", exc_info=True)
-            
-            finally:
-                # 清理临时文件
-                if temp_file_path and os.path.exists(temp_file_path):
-                    try:
-                        os.unlink(temp_file_path)
-                    except Exception as e:
-                        logger.error(f"清理临时文件时出错: {str(e)}")
+                last_error = e
+        else:
+            raise last_error
+        self.router.update(server_name, server_config, [tool.name for tool in tools])
         
-        return all_tools
+        # 转换工具格式
+        openai_tools = self._convert_tools_to_openai_format(tools)
+        await self.tool_cache.put(server_config, openai_tools)
+        logger.info(f"从服务器 {server_name} 获取到 {len(openai_tools)} 个工具")
+        return openai_tools
+    
+    async def _list_endpoint_tools(self, label: str, endpoint: Dict[str, Any]) -> List[mcp.types.Tool]:
+        # 从会话池借用已初始化的客户端
+        async with self.pool.session(label, endpoint) as client:
+            try:
+                with tracer.span("mcp.list_tools", server=label), MCP_LIST_TOOLS_SECONDS.time(server=label):
+                    return await _list_tools(client)
+            except Exception as e:
+                record_error("mcp_list_tools", e)
+                raise
     
     def _convert_tools_to_openai_format(self, mcp_tools) -> List[Dict[str, Any]]:
         """将MCP工具转换为OpenAI格式"""
@@ -202,49 +413,188 @@ class MCPService:
         """在外部服务器上执行工具"""
         servers = config.get("mcpServers", {})
         
-        # 遍历所有服务器，尝试找到并执行工具
-        for server_name, server_config in servers.items():
-            temp_file_path = None
-            try:
-                logger.info(f"尝试在服务器 {server_name} 上执行工具 {tool_name}, 参数: {arguments}")
-                
-                # 创建传输对象和临时配置
-                transport, temp_file_path = await self._create_temp_config_and_transport(server_name, server_config)
-                
-                if transport:
-                    # 仅在需要时创建客户端
-                    client = Client(transport)
-                    async with client:
-                        # 检查工具是否可用
-                        tools = await client.list_tools()
-                        tool_exists = any(tool.name == tool_name for tool in tools)
-                        
-                        if tool_exists:
-                            # 调用工具
-                            result = await client.call_tool(tool_name, arguments)
-                            
-                            # 处理和格式化结果
-                            if result:
-                                if hasattr(result[0], 'text'):
-                                    return result[0].text
-                                else:
-                                    return json.dumps(result)
-                            return "工具执行完成，但没有返回结果"
+        # 通过路由索引直接定位提供该工具的服务器
+        server_name = self.router.resolve(servers, tool_name)
+        if server_name is None:
+            # 索引缺失或已过期时，只刷新相应服务器的工具列表
+            await self._refresh_routes(servers)
+            server_name = self.router.resolve(servers, tool_name)
+        if server_name is None:
+            return f"未找到工具 {tool_name} 或执行失败"
+        
+        server_config = servers[server_name]
+        endpoints = self._available_endpoints(server_name, server_config)
+        if not endpoints:
+            return f"工具 {tool_name} 暂不可用: 服务器 {server_name} 连续出错，已暂停调用"
+        
+        try:
+            hot_logger.debug("在服务器 %s 上执行工具 %s, 参数: %s", server_name, tool_name, Payload(arguments))
             
-            except Exception as e:
-                logger.error(f"在服务器 {server_name} 上执行工具时出错: {str(e)}", exc_info=True)
+            hedge = server_config.get("hedge") or {}
+            if len(endpoints) > 1 and tool_name in (hedge.get("tools") or []):
+                delay = float(hedge.get("delayMs", HEDGE_DELAY * 1000)) / 1000
+                result = await self._hedged_call(server_name, endpoints, tool_name, arguments, delay)
+            else:
+                label, endpoint = endpoints[0]
+                result = await self._guarded(label, endpoint, lambda: self._call_endpoint_tool(label, endpoint, tool_name, arguments))
             
-            finally:
-                # 清理临时文件
-                if temp_file_path and os.path.exists(temp_file_path):
-                    try:
-                        os.unlink(temp_file_path)
-                    except Exception as e:
-                        logger.error(f"清理临时文件时出错: {str(e)}")
+            # 合并全部内容项
+            if result:
+                return render_tool_content(result)
+            return "工具执行完成，但没有返回结果"
+        
+        except Exception as e:
+            record_error("mcp_call_tool", e)
+            logger.error(f"在服务器 {server_name} 上执行工具时出错: {str(e)}", exc_info=True)
         
         return f"未找到工具 {tool_name} 或执行失败"
+    
+    async def _call_endpoint_tool(self, label: str, endpoint: Dict[str, Any], tool_name: str, arguments: Dict[str, Any]) -> List[Any]:
+        # 从会话池借用已初始化的客户端
+        async with self.pool.session(label, endpoint) as client:
+            with tracer.span("mcp.call_tool", server=label, tool=tool_name), \
+                    MCP_CALL_TOOL_SECONDS.time(server=label, tool=tool_name):
+                return await _call_tool(client, tool_name, arguments)
+    
+    async def _hedged_call(
+        self,
+        server_name: str,
+        endpoints: List[Tuple[str, Dict[str, Any]]],
+        tool_name: str,
+        arguments: Dict[str, Any],
+        delay: float,
+    ) -> List[Any]:
+        """
+        对冲调用：先向第一个端点发出请求，超过delay仍未返回（或已失败）时再向下一个端点发出，
+        采用最先成功的结果并取消其余请求。只应对幂等工具启用。
+        """
+        pending: Dict[asyncio.Task, str] = {}
+        remaining = list(endpoints)
+        last_error: Optional[BaseException] = None
+        try:
+            while remaining or pending:
+                if remaining:
+                    label, endpoint = remaining.pop(0)
+                    task = asyncio.create_task(
+                        self._guarded(label, endpoint, lambda: self._call_endpoint_tool(label, endpoint, tool_name, arguments))
+                    )
+                    pending[task] = label
+                done, _ = await asyncio.wait(
+                    pending, timeout=delay if remaining else None, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    label = pending.pop(task)
+                    error = task.exception()
+                    if error is None:
+                        MCP_HEDGED_CALLS_TOTAL.inc(server=server_name, winner=label)
+                        return task.result()
+                    if isinstance(error, ToolError):
+                        # 工具本身报错，换一个副本也不会有不同的结果
+                        raise error
+                    last_error = error
+            raise last_error
+        finally:
+            for task in pending:
+                task.cancel()
+    
+    def _breaker(self, label: str, endpoint: Dict[str, Any]) -> CircuitBreaker:
+        return self.breakers.get(normalize_server_config(endpoint), label)
+    
+    def _available_endpoints(self, server_name: str, server_config: Dict[str, Any]) -> List[Tuple[str, Dict[str, Any]]]:
+        """未处于熔断状态的端点，主端点在前"""
+        return [
+            (label, endpoint)
+            for label, endpoint in server_endpoints(server_name, server_config)
+            if self._breaker(label, endpoint).available()
+        ]
+    
+    async def _guarded(self, label: str, endpoint: Dict[str, Any], operation, timeout: float = CALL_TIMEOUT):
+        """
+        通过熔断器执行对端点的请求
+
+        连接失败、超过timeout秒未返回等异常计为失败；工具返回的错误（ToolError）说明服务器正常，计为成功。
+        """
+        breaker = self._breaker(label, endpoint)
+        if not breaker.allow():
+            raise CircuitOpenError(f"MCP服务器 {label} 处于熔断状态，跳过请求")
+        try:
+            result = await asyncio.wait_for(operation(), timeout=timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"MCP服务器 {label} 未能在 {timeout}s 内响应")
+            breaker.record_failure()
+            raise
+        except ToolError:
+            breaker.record_success()
+            raise
+        except asyncio.CancelledError:
+            breaker.release()
+            raise
+        except Exception:
+            breaker.record_failure()
+            raise
+        breaker.record_success()
+        return result
+    
+    def tool_result_policy(self, config: Optional[Dict[str, Any]], tool_name: str) -> Optional[Dict[str, Any]]:
+        """
+        服务器配置中为某个工具设置的结果整理方式
+
+        在服务器配置的toolResults中按工具名设置，例如
+        {"get_alerts": {"maxTokens": 1000, "root": "features", "fields": ["properties.event"]}}
+        """
+        servers = (config or {}).get("mcpServers") or {}
+        server_name = self.router.resolve(servers, tool_name)
+        if server_name is None:
+            return None
+        return (servers[server_name].get("toolResults") or {}).get(tool_name)
+    
+    async def _refresh_routes(self, servers: Dict[str, Any]) -> None:
+        """并发重新获取索引缺失或过期的服务器的工具列表"""
+        deadline = asyncio.get_running_loop().time() + DISCOVERY_BUDGET
+        with tracer.span("mcp.refresh_routes"):
+            await asyncio.gather(
+                *(self._discover_with_deadline(name, servers[name], deadline) for name in self.router.stale_servers(servers))
+            )
+
+
+async def _list_tools(client: Client) -> List[mcp.types.Tool]:
+    """获取工具列表，开启追踪时在请求的_meta中附带追踪上下文"""
+    meta = trace_meta()
+    if meta is None:
+        return await client.list_tools()
+    result = await client.session.send_request(
+        mcp.types.ClientRequest(mcp.types.ListToolsRequest(
+            method="tools/list",
+            params=mcp.types.PaginatedRequestParams(_meta=meta),
+        )),
+        mcp.types.ListToolsResult,
+    )
+    return result.tools
+
+
+async def _call_tool(client: Client, tool_name: str, arguments: Dict[str, Any]) -> List[Any]:
+    """调用工具，开启追踪时在请求的_meta中附带追踪上下文，行为与Client.call_tool一致"""
+    meta = trace_meta()
+    if meta is None:
+        return await client.call_tool(tool_name, arguments)
+    result = await client.session.send_request(
+        mcp.types.ClientRequest(mcp.types.CallToolRequest(
+            method="tools/call",
+            params=mcp.types.CallToolRequestParams(name=tool_name, arguments=arguments or {}, _meta=meta),
+        )),
+        mcp.types.CallToolResult,
+    )
+    if result.isError:
+        raise ToolError(result.content[0].text if result.content and hasattr(result.content[0], "text") else "工具执行出错")
+    return result.content
+
+# 全局共享的服务实例，会话池随之在请求之间复用
+_mcp_service: Optional[MCPService] = None
 
 # 依赖注入函数
 def get_mcp_service():
     """FastAPI依赖注入，获取MCPService实例"""
-    return MCPService() 
\ No newline at end of file
+    global _mcp_service
+    if _mcp_service is None:
+        _mcp_service = MCPService()
+    return _mcp_service
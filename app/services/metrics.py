@@ -0,0 +1,278 @@
+from typing import Dict, Any, List, Optional, Sequence, Tuple
+import math
+import os
+import time
+from contextlib import contextmanager
+
+# 默认的耗时分桶（秒），覆盖从毫秒级的工具调用到分钟级的模型回复
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+# 生成速度分桶（令牌/秒）
+TOKEN_RATE_BUCKETS = (1, 5, 10, 20, 40, 60, 80, 100, 150, 200, 400)
+# 每个指标的每个标签最多记录的不同取值数，服务器名、工具名和模型名来自客户端，
+# 超出后新的取值统一记为OVERFLOW_LABEL_VALUE，避免时间序列数量无限增长
+METRICS_MAX_LABEL_VALUES = int(os.environ.get("METRICS_MAX_LABEL_VALUES", "100"))
+OVERFLOW_LABEL_VALUE = "other"
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra is not None:
+        pairs.append(f'{extra[0]}="{extra[1]}"')
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class Metric:
+    """带标签的指标基类，按标签值分别记录"""
+
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        # 每个标签已记录的取值
+        self._seen: List[set] = [set() for _ in self.labelnames]
+
+    def _key(self, labels: Dict[str, Any], record: bool = True) -> Tuple[str, ...]:
+        """
+        标签值组成的键，超出取值上限的新值替换为OVERFLOW_LABEL_VALUE
+
+        record为False时只查询，不把新值计入上限
+        """
+        key = []
+        for seen, name in zip(self._seen, self.labelnames):
+            value = str(labels.get(name, ""))
+            if value not in seen:
+                if len(seen) >= METRICS_MAX_LABEL_VALUES:
+                    value = OVERFLOW_LABEL_VALUE
+                elif record:
+                    seen.add(value)
+            key.append(value)
+        return tuple(key)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self._samples())
+        return lines
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(Metric):
+    """只增不减的计数器"""
+
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels: Any) -> None:
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels: Any) -> float:
+        return self._values.get(self._key(labels, record=False), 0)
+
+    def _samples(self) -> List[str]:
+        return [
+            f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+            for key, value in sorted(self._values.items())
+        ]
+
+
+class Gauge(Metric):
+    """可增可减的当前值"""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def set(self, value: float, **labels: Any) -> None:
+        self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1, **labels: Any) -> None:
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels: Any) -> None:
+        self.inc(-amount, **labels)
+
+    def value(self, **labels: Any) -> float:
+        return self._values.get(self._key(labels, record=False), 0)
+
+    def _samples(self) -> List[str]:
+        if not self._values and not self.labelnames:
+            return [f"{self.name} 0"]
+        return [
+            f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+            for key, value in sorted(self._values.items())
+        ]
+
+
+class Histogram(Metric):
+    """按分桶统计观测值的直方图"""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        # 每组标签值对应 [各分桶计数, 总和, 总数]
+        self._values: Dict[Tuple[str, ...], List[Any]] = {}
+
+    def observe(self, value: float, **labels: Any) -> None:
+        key = self._key(labels)
+        entry = self._values.get(key)
+        if entry is None:
+            entry = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+        for idx, bound in enumerate(self.buckets):
+            if value <= bound:
+                entry[0][idx] += 1
+                break
+        entry[1] += value
+        entry[2] += 1
+
+    @contextmanager
+    def time(self, **labels: Any):
+        """记录代码块的耗时（秒），代码块抛出异常时同样记录"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def count(self, **labels: Any) -> int:
+        entry = self._values.get(self._key(labels, record=False))
+        return entry[2] if entry else 0
+
+    def _samples(self) -> List[str]:
+        lines = []
+        for key, (counts, total, count) in sorted(self._values.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                labels = _format_labels(self.labelnames, key, ("le", _format_value(bound)))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class MetricsRegistry:
+    """
+    进程内的指标注册表
+
+    以Prometheus文本格式输出全部指标。指标只在当前进程内统计：同一端口下有多个工作进程时，
+    每次抓取由哪个进程响应不确定，计数器会在不同进程的值之间跳变，因此 /metrics 要求
+    每个端口只运行一个工作进程；需要多进程时，应以多个单进程实例分别监听不同端口并分别抓取。
+    """
+
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> Metric:
+        if metric.name in self._metrics:
+            raise ValueError(f"指标 {metric.name} 已注册")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+# 大模型
+LLM_TTFT_SECONDS = REGISTRY.histogram(
+    "llm_time_to_first_token_seconds", "Time from request to the first streamed chunk of a model call", ["model"]
+)
+LLM_COMPLETION_SECONDS = REGISTRY.histogram(
+    "llm_completion_seconds", "Total duration of a model call", ["model", "stream"]
+)
+
+LLM_PROVIDER_REQUESTS_TOTAL = REGISTRY.counter(
+    "llm_provider_requests_total", "Requests sent to each model provider by result", ["provider", "result"]
+)
+LLM_PROVIDER_TTFT_SECONDS = REGISTRY.histogram(
+    "llm_provider_ttft_seconds", "Time to first streamed chunk per model provider", ["provider"]
+)
+LLM_HEDGED_REQUESTS_TOTAL = REGISTRY.counter(
+    "llm_hedged_requests_total", "Hedged streaming requests by the provider that answered first", ["winner"]
+)
+
+# MCP
+MCP_CONNECT_SECONDS = REGISTRY.histogram(
+    "mcp_connect_seconds", "Time to establish an MCP session", ["server"]
+)
+MCP_LIST_TOOLS_SECONDS = REGISTRY.histogram(
+    "mcp_list_tools_seconds", "Duration of MCP list_tools calls", ["server"]
+)
+MCP_CALL_TOOL_SECONDS = REGISTRY.histogram(
+    "mcp_call_tool_seconds", "Duration of MCP call_tool calls", ["server", "tool"]
+)
+
+MCP_CIRCUIT_OPEN_TOTAL = REGISTRY.counter(
+    "mcp_circuit_open_total", "Times an MCP endpoint circuit breaker opened", ["server"]
+)
+MCP_HEDGED_CALLS_TOTAL = REGISTRY.counter(
+    "mcp_hedged_calls_total", "Hedged MCP tool calls by the endpoint that answered first", ["server", "winner"]
+)
+
+# 工具提前执行
+TOOL_CALLS_DISPATCHED_TOTAL = REGISTRY.counter(
+    "agent_tool_calls_dispatched_total", "Tool calls by when they started: during the model stream or after it", ["mode"]
+)
+TOOL_EARLY_SAVED_SECONDS = REGISTRY.histogram(
+    "agent_tool_early_saved_seconds", "Tool latency hidden behind model generation by early dispatch, per step", ["model"]
+)
+
+# SSE流
+STREAM_TOKENS_PER_SECOND = REGISTRY.histogram(
+    "chat_stream_tokens_per_second", "Output tokens per second of model generation in one SSE stream", ["model"],
+    buckets=TOKEN_RATE_BUCKETS,
+)
+ACTIVE_STREAMS = REGISTRY.gauge(
+    "chat_active_streams", "Number of SSE chat streams currently open"
+)
+
+# 对话响应缓存
+CHAT_CACHE_REQUESTS_TOTAL = REGISTRY.counter(
+    "chat_cache_requests_total", "Non-streaming chat requests by response cache result", ["result"]
+)
+
+# 错误
+ERRORS_TOTAL = REGISTRY.counter(
+    "app_errors_total", "Errors by source and exception type", ["source", "type"]
+)
+
+
+def record_error(source: str, error: BaseException) -> None:
+    """按来源和异常类型记录一次错误"""
+    ERRORS_TOTAL.inc(source=source, type=type(error).__name__)
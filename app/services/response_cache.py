@@ -0,0 +1,150 @@
+from typing import Dict, Any, List, Optional, Callable, Awaitable, Tuple
+import asyncio
+import hashlib
+import json
+import os
+import logging
+
+from app.services.metrics import CHAT_CACHE_REQUESTS_TOTAL
+from app.services.disk_cache import CacheEntry, DiskBackedLRU
+
+# 配置日志
+logger = logging.getLogger("app.services.response_cache")
+
+# 非流式对话响应缓存，默认关闭
+CHAT_CACHE_ENABLED = os.environ.get("CHAT_CACHE_ENABLED", "0").lower() in ("1", "true", "yes")
+CHAT_CACHE_TTL = float(os.environ.get("CHAT_CACHE_TTL", "300"))
+# 按模型覆盖TTL，格式为 "model-a=600,model-b=0"，TTL为0表示不缓存该模型
+CHAT_CACHE_MODEL_TTLS = os.environ.get("CHAT_CACHE_MODEL_TTLS", "")
+CHAT_CACHE_MAX_ENTRIES = int(os.environ.get("CHAT_CACHE_MAX_ENTRIES", "1024"))
+# 设置后启用磁盘缓存，重启后以及同一台机器上的多个工作进程之间均可复用
+CHAT_CACHE_DIR = os.environ.get("CHAT_CACHE_DIR")
+
+
+def parse_model_ttls(spec: str) -> Dict[str, float]:
+    """解析按模型设置的TTL"""
+    ttls = {}
+    for item in spec.split(","):
+        if not item.strip():
+            continue
+        model, sep, ttl = item.rpartition("=")
+        if not sep or not model.strip():
+            logger.warning(f"忽略无效的模型TTL配置: {item}")
+            continue
+        try:
+            ttls[model.strip()] = float(ttl)
+        except ValueError:
+            logger.warning(f"忽略无效的模型TTL配置: {item}")
+    return ttls
+
+
+def chat_cache_key(model: str, messages: List[Dict[str, Any]], tools: List[Dict[str, Any]]) -> str:
+    """
+    计算对话请求的规范哈希
+
+    字段顺序和工具定义的先后顺序不影响结果，模型、消息或可用工具有任何变化都会得到不同的键。
+    """
+    canonical = json.dumps(
+        {
+            "model": model,
+            "messages": messages,
+            "tools": sorted(tools, key=lambda tool: tool.get("function", {}).get("name", "")),
+        },
+        sort_keys=True,
+        ensure_ascii=False,
+        separators=(",", ":"),
+    )
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """
+    非流式对话响应缓存
+
+    内存层按LRU淘汰，配置了缓存目录时同时写入磁盘。相同请求并发到达时只有第一个请求调用模型，
+    其余请求等待并共享它的结果（single-flight）。调用失败的结果不会被缓存。
+    """
+
+    def __init__(
+        self,
+        enabled: bool = CHAT_CACHE_ENABLED,
+        ttl: float = CHAT_CACHE_TTL,
+        model_ttls: Optional[Dict[str, float]] = None,
+        max_entries: int = CHAT_CACHE_MAX_ENTRIES,
+        cache_dir: Optional[str] = CHAT_CACHE_DIR,
+    ):
+        self.enabled = enabled
+        self.ttl = ttl
+        self.model_ttls = parse_model_ttls(CHAT_CACHE_MODEL_TTLS) if model_ttls is None else model_ttls
+        self._store = DiskBackedLRU(max_entries, cache_dir if enabled else None)
+        self._inflight: Dict[str, asyncio.Task] = {}
+
+    def ttl_for(self, model: str) -> float:
+        return self.model_ttls.get(model, self.ttl)
+
+    def enabled_for(self, model: str) -> bool:
+        """该模型的请求是否使用缓存"""
+        return self.enabled and self.ttl_for(model) > 0
+
+    async def get_or_compute(
+        self,
+        key: str,
+        model: str,
+        compute: Callable[[], Awaitable[Dict[str, Any]]],
+    ) -> Tuple[Dict[str, Any], str]:
+        """
+        读取缓存的响应，未命中时调用compute生成并写入缓存
+
+        Args:
+            key: chat_cache_key生成的请求哈希
+            model: 模型名称，用于确定TTL
+            compute: 生成响应的协程函数
+
+        Returns:
+            (响应, 命中情况)，命中情况为 hit、miss 或 coalesced（共享了进行中的相同请求）
+        """
+        response = await self._get(key)
+        if response is not None:
+            CHAT_CACHE_REQUESTS_TOTAL.inc(result="hit")
+            return response, "hit"
+
+        task = self._inflight.get(key)
+        if task is not None:
+            CHAT_CACHE_REQUESTS_TOTAL.inc(result="coalesced")
+            return await asyncio.shield(task), "coalesced"
+
+        CHAT_CACHE_REQUESTS_TOTAL.inc(result="miss")
+        # 使用独立任务生成响应，发起请求的客户端断开时，等待同一结果的其他请求不受影响
+        task = asyncio.ensure_future(self._compute_and_store(key, model, compute))
+        self._inflight[key] = task
+        task.add_done_callback(lambda done: self._finish(key, done))
+        return await asyncio.shield(task), "miss"
+
+    def _finish(self, key: str, task: asyncio.Task) -> None:
+        self._inflight.pop(key, None)
+        # 所有等待方都已断开时也要取出异常，避免"exception was never retrieved"警告
+        if not task.cancelled():
+            task.exception()
+
+    async def _compute_and_store(
+        self,
+        key: str,
+        model: str,
+        compute: Callable[[], Awaitable[Dict[str, Any]]],
+    ) -> Dict[str, Any]:
+        response = await compute()
+        await self._store.put(key, CacheEntry(response, self.ttl_for(model)))
+        return response
+
+    async def _get(self, key: str) -> Optional[Dict[str, Any]]:
+        entry = await self._store.get(key)
+        if entry is None:
+            return None
+        if entry.expired():
+            self._store.pop(key)
+            return None
+        return entry.value
+
+
+# 应用共享的响应缓存
+response_cache = ResponseCache()
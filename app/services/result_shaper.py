@@ -0,0 +1,205 @@
+from typing import Dict, Any, List, Optional
+import json
+import os
+import logging
+
+import mcp.types
+
+from app.services.context_window import estimate_text_tokens
+
+# 配置日志
+logger = logging.getLogger("app.services.tools.shaper")
+
+# 发送给模型的单个工具结果上限，可通过环境变量调整
+TOOL_RESULT_MAX_TOKENS = int(os.environ.get("TOOL_RESULT_MAX_TOKENS", "2000"))
+TOOL_RESULT_MAX_BYTES = int(os.environ.get("TOOL_RESULT_MAX_BYTES", "32768"))
+# 按工具覆盖令牌上限，格式为 "get_alerts=1000,fetch=4000"
+TOOL_RESULT_TOKEN_LIMITS = os.environ.get("TOOL_RESULT_TOKEN_LIMITS", "")
+# 超过该大小的结果不尝试按JSON解析，直接按文本截断
+JSON_PARSE_MAX_BYTES = 8 * 1024 * 1024
+
+# JSON逐级收缩时使用的（字符串长度, 数组元素数）上限
+_JSON_SHRINK_STEPS = [(2000, 50), (500, 20), (200, 10), (80, 5), (40, 3), (20, 1)]
+
+
+def parse_token_limits(spec: str) -> Dict[str, int]:
+    """解析按工具设置的令牌上限"""
+    limits = {}
+    for item in spec.split(","):
+        name, sep, value = item.strip().rpartition("=")
+        if not sep or not name:
+            continue
+        try:
+            limits[name] = int(value)
+        except ValueError:
+            logger.warning(f"忽略无效的工具结果上限配置: {item}")
+    return limits
+
+
+def render_tool_content(items: List[Any]) -> str:
+    """
+    将工具返回的全部内容项转为文本
+
+    文本和文本资源原样拼接；图片、音频和二进制资源只保留类型和大小的说明，不把base64数据交给模型。
+    多个内容项中含有JSON文本时输出为一个JSON数组（JSON项解析后放入，其余项作为字符串），
+    保证结果整理时仍能按JSON提取字段和收缩。
+    """
+    parts = []
+    for item in items:
+        if isinstance(item, mcp.types.TextContent):
+            parts.append(item.text)
+        elif isinstance(item, (mcp.types.ImageContent, mcp.types.AudioContent)):
+            kind = "图片" if isinstance(item, mcp.types.ImageContent) else "音频"
+            parts.append(f"[{kind} {item.mimeType}，约 {len(item.data) * 3 // 4} 字节]")
+        elif isinstance(item, mcp.types.EmbeddedResource):
+            resource = item.resource
+            if isinstance(resource, mcp.types.TextResourceContents):
+                parts.append(resource.text)
+            else:
+                parts.append(f"[资源 {resource.uri} {resource.mimeType or ''}]".rstrip())
+        elif hasattr(item, "model_dump_json"):
+            parts.append(item.model_dump_json())
+        else:
+            parts.append(str(item))
+    if len(parts) > 1:
+        parsed = [_parse_json(part) for part in parts]
+        if any(value is not None for value in parsed):
+            return _dumps([part if value is None else value for part, value in zip(parts, parsed)])
+    return "\n\n".join(parts)
+
+
+def _parse_json(text: str) -> Any:
+    """解析JSON对象或数组，不是JSON或过大时返回None"""
+    stripped = text.strip()
+    if not stripped or stripped[0] not in "{[" or len(stripped) > JSON_PARSE_MAX_BYTES:
+        return None
+    try:
+        return json.loads(stripped)
+    except ValueError:
+        return None
+
+
+_MISSING = object()
+
+
+def _lookup(value: Any, path: str) -> Any:
+    """按点号分隔的路径取值，路径不存在时返回_MISSING"""
+    for key in path.split("."):
+        if not isinstance(value, dict) or key not in value:
+            return _MISSING
+        value = value[key]
+    return value
+
+
+def extract_fields(value: Any, paths: List[str], root: Optional[str] = None) -> Any:
+    """
+    只保留指定字段
+
+    字段路径用点号表示嵌套，如 "properties.event"；root指向结果中的数组（如 "features"）时，
+    只返回该数组，并对每个元素分别提取。结果本身是数组时同样按元素提取，
+    元素中含有root时（如多个内容项合并成的数组）对每个元素分别应用root。
+    一个字段都没有命中时返回原值。
+    """
+    if root:
+        nested = _lookup(value, root)
+        if nested is not _MISSING:
+            value, root = nested, None
+    if isinstance(value, list):
+        return [extract_fields(item, paths, root) for item in value]
+    if not isinstance(value, dict):
+        return value
+    picked = {}
+    for path in paths:
+        found = _lookup(value, path)
+        if found is not _MISSING:
+            picked[path] = found
+    return picked or value
+
+
+def _shrink(value: Any, max_string: int, max_items: int, depth: int = 0) -> Any:
+    """截断过长的字符串和数组，嵌套过深的部分以占位符代替"""
+    if isinstance(value, str):
+        return value if len(value) <= max_string else f"{value[:max_string]}...(共{len(value)}字符)"
+    if depth >= 8 and isinstance(value, (dict, list)):
+        return "{...}" if isinstance(value, dict) else "[...]"
+    if isinstance(value, list):
+        shrunk = [_shrink(item, max_string, max_items, depth + 1) for item in value[:max_items]]
+        if len(value) > max_items:
+            shrunk.append(f"...(省略 {len(value) - max_items} 项，共 {len(value)} 项)")
+        return shrunk
+    if isinstance(value, dict):
+        return {key: _shrink(item, max_string, max_items, depth + 1) for key, item in value.items()}
+    return value
+
+
+def _dumps(value: Any) -> str:
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":"))
+
+
+def truncate_text(text: str, max_tokens: int, max_bytes: int) -> str:
+    """保留开头和结尾，省略中间部分"""
+    tokens = estimate_text_tokens(text)
+    size = len(text.encode("utf-8"))
+    if tokens <= max_tokens and size <= max_bytes:
+        return text
+    # 按令牌和字节两个上限中更严格的一个换算出可保留的字符数
+    ratio = min(max_tokens / max(tokens, 1), max_bytes / max(size, 1))
+    keep = max(int(len(text) * ratio) - 40, 0)
+    head = keep * 4 // 5
+    tail = keep - head
+    return f"{text[:head]}\n...[省略 {len(text) - keep} 字符]...\n{text[len(text) - tail:] if tail else ''}"
+
+
+class ResultShaper:
+    """
+    将工具结果整理为适合再次发送给模型的大小
+
+    JSON结果先按配置只保留相关字段，再以紧凑格式输出，仍然超出上限时逐级截断长字符串和长数组；
+    其他文本保留开头和结尾。上限可以按工具设置。
+    """
+
+    def __init__(
+        self,
+        max_tokens: int = TOOL_RESULT_MAX_TOKENS,
+        max_bytes: int = TOOL_RESULT_MAX_BYTES,
+        token_limits: Optional[Dict[str, int]] = None,
+    ):
+        self.max_tokens = max_tokens
+        self.max_bytes = max_bytes
+        self.token_limits = parse_token_limits(TOOL_RESULT_TOKEN_LIMITS) if token_limits is None else token_limits
+
+    def shape(self, tool_name: str, text: str, policy: Optional[Dict[str, Any]] = None) -> str:
+        """
+        Args:
+            tool_name: 工具名称
+            text: 工具返回的完整文本
+            policy: 服务器配置中该工具的结果设置，可包含 maxTokens、fields 和 root
+
+        Returns:
+            发送给模型的文本
+        """
+        policy = policy or {}
+        max_tokens = int(policy.get("maxTokens") or self.token_limits.get(tool_name, self.max_tokens))
+        fields = policy.get("fields")
+        if not fields and self._fits(text, max_tokens):
+            return text
+
+        data = _parse_json(text)
+        if data is None:
+            return truncate_text(text, max_tokens, self.max_bytes)
+
+        if fields:
+            data = extract_fields(data, fields, policy.get("root"))
+        shaped = _dumps(data)
+        for max_string, max_items in _JSON_SHRINK_STEPS:
+            if self._fits(shaped, max_tokens):
+                return shaped
+            shaped = _dumps(_shrink(data, max_string, max_items))
+        return truncate_text(shaped, max_tokens, self.max_bytes)
+
+    def _fits(self, text: str, max_tokens: int) -> bool:
+        return len(text.encode("utf-8")) <= self.max_bytes and estimate_text_tokens(text) <= max_tokens
+
+
+# 应用共享的结果整理器
+result_shaper = ResultShaper()
@@ -0,0 +1,476 @@
+from fastmcp import Client
+from fastmcp.client.transports import ClientTransport
+from typing import Dict, Any, List, Optional, Set, Callable, Awaitable, AsyncIterator
+from contextlib import asynccontextmanager
+import asyncio
+import hashlib
+import json
+import os
+import time
+import uuid
+import logging
+import mcp.types
+
+from app.services.metrics import MCP_CONNECT_SECONDS, record_error
+from app.services.tracing import tracer
+from app.services.stdio_pool import PoolPolicy, tag_transport, find_marked_rss_mb
+from app.services.circuit_breaker import CircuitBreaker, BREAKER_MAX_BACKOFF
+
+# 配置日志
+logger = logging.getLogger("app.services.mcp.pool")
+
+# 连接池参数，可通过环境变量调整
+POOL_IDLE_TIMEOUT = float(os.environ.get("MCP_POOL_IDLE_TIMEOUT", "300"))
+POOL_HEALTH_CHECK_INTERVAL = float(os.environ.get("MCP_POOL_HEALTH_CHECK_INTERVAL", "30"))
+POOL_MAX_CONCURRENCY = int(os.environ.get("MCP_POOL_MAX_CONCURRENCY", "8"))
+POOL_CONNECT_TIMEOUT = float(os.environ.get("MCP_POOL_CONNECT_TIMEOUT", "30"))
+POOL_PING_TIMEOUT = float(os.environ.get("MCP_POOL_PING_TIMEOUT", "5"))
+
+TransportFactory = Callable[[str, Dict[str, Any]], Awaitable[Optional[ClientTransport]]]
+NotificationHandler = Callable[[str, str, Any], Awaitable[None]]
+
+
+# 只在本应用内使用、不影响服务器连接的配置项，不计入会话键
+CLIENT_SIDE_KEYS = ("toolResults", "replicas", "hedge")
+
+
+def normalize_server_config(server_config: Dict[str, Any]) -> str:
+    """
+    将服务器配置规范化为稳定的字符串键
+
+    字段顺序、传输类型的大小写以及缺省的传输类型不会影响生成的键，
+    因此前端每次发送的相同配置都会命中同一个会话。
+
+    Args:
+        server_config: 服务器配置字典
+
+    Returns:
+        规范化后的配置键
+    """
+    normalized = {key: value for key, value in server_config.items() if key not in CLIENT_SIDE_KEYS}
+    if "url" in normalized:
+        normalized["transport_type"] = str(normalized.get("transport_type", "sse")).lower()
+    return json.dumps(normalized, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+
+
+class PooledSession:
+    """池中的单个MCP会话"""
+
+    def __init__(
+        self,
+        key: str,
+        server_name: str,
+        transport: ClientTransport,
+        max_concurrency: int,
+        message_handler: Optional[Callable[[Any], Awaitable[None]]] = None,
+    ):
+        self.key = key
+        self.server_name = server_name
+        self.transport = transport
+        self.message_handler = message_handler
+        self.client: Optional[Client] = None
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        self.in_flight = 0
+        self.calls = 0
+        # 标记为退役的会话不再借出，当前调用结束后关闭
+        self.retiring = False
+        # stdio进程的环境变量标记，用于统计内存占用
+        self.marker: Optional[str] = None
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+
+    async def start(self, timeout: float) -> None:
+        """
+        建立连接并等待MCP握手完成
+
+        fastmcp的Client由其内部任务持有连接，连接失败时 __aenter__ 也会正常返回，
+        因此需要再检查连接状态。
+        """
+        client = Client(self.transport, message_handler=self.message_handler)
+        try:
+            await asyncio.wait_for(client.__aenter__(), timeout=timeout)
+        except asyncio.TimeoutError:
+            self.client = client
+            await self.close()
+            raise TimeoutError(f"连接MCP服务器 {self.server_name} 超时 ({timeout}s)")
+        self.client = client
+        if not self.is_alive:
+            error = _session_error(client)
+            await self.close()
+            raise ConnectionError(f"连接MCP服务器 {self.server_name} 失败: {error or '会话已断开'}")
+
+    @property
+    def is_alive(self) -> bool:
+        if self.client is None or not self.client.is_connected():
+            return False
+        # 服务器断开或进程退出后，Client内部持有连接的任务会结束
+        session_task = getattr(self.client, "_session_task", None)
+        return session_task is None or not session_task.done()
+
+    @property
+    def is_available(self) -> bool:
+        return self.is_alive and not self.retiring
+
+    def idle_for(self) -> float:
+        return time.monotonic() - self.last_used
+
+    async def ping(self, timeout: float = POOL_PING_TIMEOUT) -> bool:
+        """健康检查，会话不可用时返回False"""
+        if not self.is_alive:
+            return False
+        try:
+            await asyncio.wait_for(self.client.ping(), timeout=timeout)
+            return True
+        except Exception as e:
+            logger.warning(f"MCP会话 {self.server_name} 健康检查失败: {str(e)}")
+            return False
+
+    async def close(self) -> None:
+        """断开连接并关闭传输"""
+        # 连接失败的会话在关闭时会再次抛出连接错误，已在start中报告，不再重复告警
+        log = logger.warning if self.is_alive else logger.debug
+        client, self.client = self.client, None
+        if client is not None:
+            try:
+                await asyncio.wait_for(client.__aexit__(None, None, None), timeout=POOL_PING_TIMEOUT)
+            except Exception as e:
+                log(f"关闭MCP会话 {self.server_name} 时出错: {str(e)}")
+        # 保持子进程存活的传输（如stdio）需要显式关闭
+        close = getattr(self.transport, "close", None)
+        if close is not None:
+            try:
+                await close()
+            except Exception as e:
+                log(f"关闭MCP会话 {self.server_name} 的传输时出错: {str(e)}")
+
+
+def _session_error(client: Client) -> Optional[BaseException]:
+    """Client内部连接任务的异常（连接失败时）"""
+    session_task = getattr(client, "_session_task", None)
+    if session_task is None or not session_task.done() or session_task.cancelled():
+        return None
+    return session_task.exception()
+
+
+class SessionGroup:
+    """同一服务器配置下的一组会话"""
+
+    def __init__(self, key: str, server_name: str, server_config: Dict[str, Any], respawn_backoff: float):
+        self.key = key
+        self.server_name = server_name
+        self.server_config = server_config
+        self.policy = PoolPolicy.for_server(server_config)
+        # 维护任务补齐会话前的退避：启动失败或会话很快失效时暂停重启，连续失败时间隔加倍
+        self.respawn = CircuitBreaker(f"{server_name}:respawn", failure_threshold=1, base_backoff=respawn_backoff, max_backoff=BREAKER_MAX_BACKOFF)
+        self.sessions: List[PooledSession] = []
+        self.spawning = 0
+        self.last_used = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    def available(self) -> List[PooledSession]:
+        return [pooled for pooled in self.sessions if pooled.is_available]
+
+    def idle_for(self) -> float:
+        return time.monotonic() - self.last_used
+
+
+class MCPSessionPool:
+    """
+    长连接MCP会话池
+
+    按规范化后的服务器配置复用已初始化的会话，跨请求共享。
+    支持预热、定期健康检查、空闲淘汰以及每个会话的并发上限。
+    stdio服务器按PoolPolicy维护一组预启动的进程：繁忙时扩容，
+    崩溃后自动补齐，调用次数或内存占用超限后替换。
+    服务器推送的通知会连同会话键一起转发给 notification_handler。
+    """
+
+    def __init__(
+        self,
+        transport_factory: TransportFactory,
+        notification_handler: Optional[NotificationHandler] = None,
+        idle_timeout: float = POOL_IDLE_TIMEOUT,
+        health_check_interval: float = POOL_HEALTH_CHECK_INTERVAL,
+        max_concurrency: int = POOL_MAX_CONCURRENCY,
+        connect_timeout: float = POOL_CONNECT_TIMEOUT,
+    ):
+        self._transport_factory = transport_factory
+        self._notification_handler = notification_handler
+        self.idle_timeout = idle_timeout
+        self.health_check_interval = health_check_interval
+        self.max_concurrency = max_concurrency
+        self.connect_timeout = connect_timeout
+        self._groups: Dict[str, SessionGroup] = {}
+        self._background: Set[asyncio.Task] = set()
+        self._maintenance_task: Optional[asyncio.Task] = None
+
+    async def start(self) -> None:
+        """启动后台维护任务（健康检查、空闲淘汰与进程回收）"""
+        if self._maintenance_task is None or self._maintenance_task.done():
+            self._maintenance_task = asyncio.create_task(self._maintenance_loop(), name="mcp-pool-maintenance")
+
+    async def close(self) -> None:
+        """关闭所有会话并停止维护任务"""
+        if self._maintenance_task:
+            self._maintenance_task.cancel()
+            try:
+                await self._maintenance_task
+            except (asyncio.CancelledError, Exception):
+                pass
+            self._maintenance_task = None
+        for task in list(self._background):
+            task.cancel()
+        sessions = [pooled for group in self._groups.values() for pooled in group.sessions]
+        self._groups.clear()
+        await asyncio.gather(*(session.close() for session in sessions), return_exceptions=True)
+        logger.info(f"MCP会话池已关闭，共释放 {len(sessions)} 个会话")
+
+    async def warm_up(self, servers: Dict[str, Dict[str, Any]]) -> Dict[str, bool]:
+        """
+        预先建立会话，使首个请求无需承担握手开销
+
+        stdio服务器会一次启动min_size个进程。
+
+        Args:
+            servers: mcpServers字典
+
+        Returns:
+            每个服务器是否预热成功
+        """
+        names = list(servers.keys())
+        results = await asyncio.gather(
+            *(self._fill_to_min(self._get_group(name, servers[name]), at_least=1) for name in names),
+            return_exceptions=True,
+        )
+        status = {}
+        for name, result in zip(names, results):
+            status[name] = not isinstance(result, BaseException)
+            if isinstance(result, BaseException):
+                logger.warning(f"预热MCP服务器 {name} 失败: {str(result)}")
+        logger.info(f"MCP会话池预热完成: {status}")
+        return status
+
+    @asynccontextmanager
+    async def session(self, server_name: str, server_config: Dict[str, Any]) -> AsyncIterator[Client]:
+        """
+        借出一个已初始化的客户端
+
+        Args:
+            server_name: 服务器名称
+            server_config: 服务器配置
+
+        Yields:
+            已连接的MCP客户端
+        """
+        group = self._get_group(server_name, server_config)
+        pooled = await self._acquire(group)
+        async with pooled.semaphore:
+            pooled.in_flight += 1
+            pooled.last_used = group.last_used = time.monotonic()
+            try:
+                yield pooled.client
+            except Exception:
+                # 调用失败时确认会话是否仍然可用，不可用则丢弃以便下次重连
+                if not await pooled.ping():
+                    await self._discard(group, pooled)
+                raise
+            finally:
+                pooled.in_flight -= 1
+                pooled.calls += 1
+                pooled.last_used = time.monotonic()
+                if group.policy.max_calls and pooled.calls >= group.policy.max_calls and not pooled.retiring:
+                    logger.info(f"MCP会话 {pooled.server_name} 已处理 {pooled.calls} 次调用，替换为新进程")
+                    self._retire(group, pooled)
+                if pooled.retiring and pooled.in_flight == 0:
+                    self._spawn_background(self._discard(group, pooled))
+
+    def _get_group(self, server_name: str, server_config: Dict[str, Any]) -> SessionGroup:
+        key = normalize_server_config(server_config)
+        group = self._groups.get(key)
+        if group is None:
+            group = self._groups[key] = SessionGroup(key, server_name, server_config, self.health_check_interval)
+        return group
+
+    async def _acquire(self, group: SessionGroup) -> PooledSession:
+        """选择负载最低的会话，全部繁忙且未达上限时在后台扩容"""
+        available = group.available()
+        if not available:
+            async with group.lock:
+                # 双重检查，避免并发请求重复建立连接
+                available = group.available()
+                if not available:
+                    return await self._connect(group)
+
+        pooled = min(available, key=lambda item: item.in_flight)
+        if pooled.in_flight > 0 and len(available) + group.spawning < group.policy.max_size:
+            # 不等待新进程启动，当前请求继续使用已有会话
+            self._spawn_background(self._grow(group))
+        return pooled
+
+    async def _connect(self, group: SessionGroup) -> PooledSession:
+        """为会话组建立一个新会话"""
+        group.spawning += 1
+        try:
+            transport = await self._transport_factory(group.server_name, group.server_config)
+            if transport is None:
+                raise ValueError(f"无法为服务器 {group.server_name} 创建传输对象")
+
+            start = time.perf_counter()
+            pooled = PooledSession(
+                group.key, group.server_name, transport, self.max_concurrency,
+                message_handler=self._make_message_handler(group.key, group.server_name),
+            )
+            marker = uuid.uuid4().hex
+            if tag_transport(transport, marker):
+                pooled.marker = marker
+            try:
+                with tracer.span("mcp.connect", server=group.server_name):
+                    await pooled.start(self.connect_timeout)
+            except Exception as e:
+                record_error("mcp_connect", e)
+                raise
+            MCP_CONNECT_SECONDS.observe(time.perf_counter() - start, server=group.server_name)
+            group.sessions.append(pooled)
+            logger.info(
+                f"已建立MCP会话: {group.server_name}，耗时 {(time.perf_counter() - start) * 1000:.1f}ms，"
+                f"当前会话数 {len(group.sessions)}"
+            )
+            return pooled
+        finally:
+            group.spawning -= 1
+
+    async def _grow(self, group: SessionGroup) -> None:
+        if len(group.available()) + group.spawning >= group.policy.max_size:
+            return
+        try:
+            await self._connect(group)
+        except Exception as e:
+            logger.warning(f"扩容MCP服务器 {group.server_name} 失败: {str(e)}")
+
+    async def _fill_to_min(self, group: SessionGroup, at_least: int = 0) -> None:
+        """
+        补齐会话组的最小会话数
+
+        维护任务补齐时遵循会话组的重启退避；预热（at_least>0）总是尝试连接，失败同样计入退避。
+        """
+        target = max(group.policy.min_size, at_least)
+        missing = target - len(group.available()) - group.spawning
+        if missing <= 0:
+            return
+        if not at_least and not group.respawn.allow():
+            return
+        try:
+            await asyncio.gather(*(self._connect(group) for _ in range(missing)))
+        except Exception:
+            group.respawn.record_failure()
+            raise
+        if at_least:
+            group.respawn.record_success()
+
+    def _retire(self, group: SessionGroup, pooled: PooledSession) -> None:
+        """使会话退役并在后台补充新会话"""
+        pooled.retiring = True
+        self._spawn_background(self._grow(group))
+
+    def _spawn_background(self, coro: Awaitable[None]) -> None:
+        task = asyncio.create_task(coro)
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+
+    def _make_message_handler(self, key: str, server_name: str) -> Optional[Callable[[Any], Awaitable[None]]]:
+        if self._notification_handler is None:
+            return None
+
+        async def handle_message(message: Any) -> None:
+            if isinstance(message, mcp.types.ServerNotification):
+                try:
+                    await self._notification_handler(key, server_name, message.root)
+                except Exception as e:
+                    logger.error(f"处理服务器 {server_name} 的通知时出错: {str(e)}", exc_info=True)
+
+        return handle_message
+
+    async def _discard(self, group: SessionGroup, pooled: PooledSession) -> None:
+        if pooled in group.sessions:
+            group.sessions.remove(pooled)
+        await pooled.close()
+        logger.info(f"已移除MCP会话: {pooled.server_name}，剩余会话数 {len(group.sessions)}")
+
+    async def _maintenance_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.health_check_interval)
+            try:
+                await self._run_maintenance()
+            except Exception as e:
+                logger.error(f"MCP会话池维护出错: {str(e)}", exc_info=True)
+
+    async def _run_maintenance(self) -> None:
+        loop = asyncio.get_running_loop()
+        for group in list(self._groups.values()):
+            group_idle_timeout = group.policy.idle_timeout or self.idle_timeout
+            if group.idle_for() > group_idle_timeout and all(p.in_flight == 0 for p in group.sessions):
+                logger.info(f"MCP服务器 {group.server_name} 空闲超过 {group_idle_timeout}s，释放全部会话")
+                for pooled in list(group.sessions):
+                    await self._discard(group, pooled)
+                del self._groups[group.key]
+                continue
+
+            for pooled in list(group.sessions):
+                if pooled.in_flight > 0:
+                    continue
+                if pooled.retiring:
+                    await self._discard(group, pooled)
+                elif not await pooled.ping():
+                    logger.warning(f"MCP会话 {pooled.server_name} 已失效，将重新启动")
+                    group.respawn.record_failure()
+                    await self._discard(group, pooled)
+                else:
+                    # 会话通过健康检查后才认为进程能稳定运行，解除重启退避
+                    group.respawn.record_success()
+                if not pooled.is_available:
+                    continue
+                if len(group.available()) > group.policy.min_size and pooled.idle_for() > self.idle_timeout:
+                    logger.info(f"MCP会话 {pooled.server_name} 空闲超过 {self.idle_timeout}s，回收")
+                    await self._discard(group, pooled)
+                elif pooled.marker and group.policy.max_memory_mb:
+                    # 读取/proc属于同步I/O，放到线程池中执行
+                    rss_mb = await loop.run_in_executor(None, find_marked_rss_mb, pooled.marker)
+                    if rss_mb is not None and rss_mb > group.policy.max_memory_mb:
+                        logger.info(f"MCP会话 {pooled.server_name} 内存占用 {rss_mb:.0f}MB 超过上限，替换为新进程")
+                        self._retire(group, pooled)
+                        await self._discard(group, pooled)
+
+            if not group.sessions and group.policy.min_size == 0:
+                del self._groups[group.key]
+                continue
+
+            # 崩溃或被回收的进程在这里补齐
+            try:
+                await self._fill_to_min(group)
+            except Exception as e:
+                logger.warning(f"补齐MCP服务器 {group.server_name} 的会话失败: {str(e)}")
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        返回连接池状态，便于排查
+
+        按会话组区分，同名的不同配置不会互相覆盖；键为配置的哈希（与工具缓存的config_hash一致，取前12位），
+        不输出配置本身，避免泄露headers、env中的密钥。
+        """
+        return {
+            hashlib.sha256(group.key.encode("utf-8")).hexdigest()[:12]: {
+                "server_name": group.server_name,
+                "respawn": group.respawn.snapshot(),
+                "sessions": [
+                    {
+                        "alive": pooled.is_alive,
+                        "retiring": pooled.retiring,
+                        "in_flight": pooled.in_flight,
+                        "calls": pooled.calls,
+                        "idle_seconds": round(pooled.idle_for(), 1),
+                    }
+                    for pooled in group.sessions
+                ],
+            }
+            for group in self._groups.values()
+        }
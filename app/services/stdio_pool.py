@@ -0,0 +1,99 @@
+from typing import Dict, Any, Optional
+import os
+import logging
+
+# 配置日志
+logger = logging.getLogger("app.services.mcp.stdio")
+
+# stdio服务器进程池参数，可通过环境变量或服务器配置中的pool字段调整
+STDIO_POOL_MIN_SIZE = int(os.environ.get("STDIO_POOL_MIN_SIZE", "1"))
+STDIO_POOL_MAX_SIZE = int(os.environ.get("STDIO_POOL_MAX_SIZE", "2"))
+STDIO_RECYCLE_AFTER_CALLS = int(os.environ.get("STDIO_RECYCLE_AFTER_CALLS", "1000"))
+STDIO_RECYCLE_MEMORY_MB = float(os.environ.get("STDIO_RECYCLE_MEMORY_MB", "1024"))
+STDIO_POOL_IDLE_TIMEOUT = float(os.environ.get("STDIO_POOL_IDLE_TIMEOUT", "3600"))
+
+# 注入到每个stdio进程中的环境变量，用于定位该进程（及其子进程）
+SLOT_MARKER_ENV = "MCP_POOL_SLOT"
+
+
+class PoolPolicy:
+    """
+    单个服务器的会话数量与回收策略
+
+    HTTP服务器只保持一个按需建立的会话；stdio服务器保持最少min_size个预启动的进程，
+    繁忙时最多扩展到max_size个，并在调用次数或内存占用超限后替换。
+    """
+
+    def __init__(
+        self,
+        min_size: int = 0,
+        max_size: int = 1,
+        max_calls: int = 0,
+        max_memory_mb: float = 0,
+        idle_timeout: Optional[float] = None,
+    ):
+        self.min_size = max(0, min_size)
+        self.max_size = max(1, max_size, self.min_size)
+        self.max_calls = max_calls
+        self.max_memory_mb = max_memory_mb
+        # 整组会话空闲多久后全部释放，None表示与单个会话的空闲超时相同
+        self.idle_timeout = idle_timeout
+
+    @classmethod
+    def for_server(cls, server_config: Dict[str, Any]) -> "PoolPolicy":
+        """根据服务器配置生成策略"""
+        if "command" not in server_config:
+            return cls()
+        overrides = server_config.get("pool", {})
+        return cls(
+            min_size=int(overrides.get("min", STDIO_POOL_MIN_SIZE)),
+            max_size=int(overrides.get("max", STDIO_POOL_MAX_SIZE)),
+            max_calls=int(overrides.get("max_calls", STDIO_RECYCLE_AFTER_CALLS)),
+            max_memory_mb=float(overrides.get("max_memory_mb", STDIO_RECYCLE_MEMORY_MB)),
+            idle_timeout=float(overrides.get("idle_timeout", STDIO_POOL_IDLE_TIMEOUT)),
+        )
+
+
+def tag_transport(transport: Any, marker: str) -> bool:
+    """
+    在stdio传输的环境变量中写入标记
+
+    Returns:
+        是否成功写入（非stdio传输返回False）
+    """
+    if not hasattr(transport, "command") or not hasattr(transport, "env"):
+        return False
+    env = dict(transport.env or os.environ)
+    env[SLOT_MARKER_ENV] = marker
+    transport.env = env
+    return True
+
+
+def find_marked_rss_mb(marker: str) -> Optional[float]:
+    """
+    统计带有指定标记的所有进程的常驻内存（MB）
+
+    通过/proc读取，仅在Linux上可用；无法读取时返回None。
+    uvx、npx等启动器会再派生子进程，标记会被继承，因此一并计入。
+    """
+    if not os.path.isdir("/proc"):
+        return None
+    needle = f"{SLOT_MARKER_ENV}={marker}".encode("utf-8")
+    total_kb = 0
+    found = False
+    for pid in os.listdir("/proc"):
+        if not pid.isdigit():
+            continue
+        try:
+            with open(f"/proc/{pid}/environ", "rb") as f:
+                if needle not in f.read().split(b"\0"):
+                    continue
+            with open(f"/proc/{pid}/status", "r") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        total_kb += int(line.split()[1])
+                        found = True
+                        break
+        except (OSError, ValueError):
+            continue
+    return total_kb / 1024 if found else None
@@ -0,0 +1,133 @@
+from typing import Dict, Any, List, Optional
+import json
+import logging
+
+# 配置日志
+logger = logging.getLogger("app.services.stream")
+
+
+class ToolCallBuffer:
+    """单个工具调用在流式响应中的增量数据"""
+
+    def __init__(self, index: int):
+        self.index = index
+        self.id: Optional[str] = None
+        self.name = ""
+        self._argument_parts: List[str] = []
+        # 参数已是完整的JSON对象，之后不会再有增量
+        self.complete = False
+
+    @property
+    def arguments(self) -> str:
+        return "".join(self._argument_parts)
+
+    def add_arguments(self, part: str) -> None:
+        self._argument_parts.append(part)
+
+    def check_complete(self) -> bool:
+        """
+        参数是否已构成完整有效的JSON对象
+
+        只有参数以 "}" 结尾时才尝试解析，避免每个数据块都解析一遍。
+        """
+        if self.complete or not self.id or not self.name or "}" not in self._argument_parts[-1]:
+            return self.complete
+        arguments = self.arguments.strip()
+        if not arguments.endswith("}"):
+            return False
+        try:
+            self.complete = isinstance(json.loads(arguments), dict)
+        except ValueError:
+            return False
+        return self.complete
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "index": self.index,
+            "id": self.id or f"call_{self.index}",
+            "name": self.name,
+            "arguments": self.arguments,
+        }
+
+
+class StreamAssembler:
+    """
+    流式响应的增量组装器
+
+    每收到一个数据块就立即合并内容和工具调用的增量，数据块本身不做保留，
+    转发给客户端后即可释放。
+    """
+
+    def __init__(self):
+        self._content_parts: List[str] = []
+        self._tool_calls: Dict[int, ToolCallBuffer] = {}
+        # 参数已完整、尚未被取走的工具调用索引
+        self._ready: List[int] = []
+        self.finish_reason: Optional[str] = None
+        self.usage: Optional[Any] = None
+        # 携带内容或工具调用增量的数据块数，模型未返回用量时用于估算输出令牌数
+        self.delta_chunks = 0
+
+    def feed(self, chunk: Any) -> None:
+        """
+        合并一个流式数据块
+
+        Args:
+            chunk: ChatCompletionChunk对象
+        """
+        # 开启 include_usage 时，最后一个数据块只携带用量信息
+        if getattr(chunk, "usage", None):
+            self.usage = chunk.usage
+        if not chunk.choices:
+            return
+        choice = chunk.choices[0]
+        if getattr(choice, "finish_reason", None):
+            self.finish_reason = choice.finish_reason
+
+        delta = choice.delta
+        if delta is None:
+            return
+
+        if getattr(delta, "content", None) or getattr(delta, "tool_calls", None):
+            self.delta_chunks += 1
+
+        # 处理内容
+        if getattr(delta, "content", None):
+            self._content_parts.append(delta.content)
+
+        # 处理工具调用
+        for tc in getattr(delta, "tool_calls", None) or []:
+            buffer = self._tool_calls.get(tc.index)
+            if buffer is None:
+                buffer = self._tool_calls[tc.index] = ToolCallBuffer(tc.index)
+            if tc.id:
+                buffer.id = tc.id
+            if tc.function is not None:
+                # 收集函数名称
+                if tc.function.name:
+                    buffer.name += tc.function.name
+                # 收集函数参数
+                if tc.function.arguments:
+                    buffer.add_arguments(tc.function.arguments)
+                    if not buffer.complete and buffer.check_complete():
+                        self._ready.append(tc.index)
+
+    @property
+    def content(self) -> str:
+        return "".join(self._content_parts)
+
+    @property
+    def has_tool_calls(self) -> bool:
+        return bool(self._tool_calls)
+
+    def pop_ready_tool_calls(self) -> List[Dict[str, Any]]:
+        """取出自上次调用以来参数已完整的工具调用，可在流结束前提前执行"""
+        if not self._ready:
+            return []
+        ready = [self._tool_calls[idx].to_dict() for idx in self._ready]
+        self._ready = []
+        return ready
+
+    def tool_calls(self) -> List[Dict[str, Any]]:
+        """按索引顺序返回组装好的工具调用"""
+        return [self._tool_calls[idx].to_dict() for idx in sorted(self._tool_calls)]
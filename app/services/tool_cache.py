@@ -0,0 +1,101 @@
+from typing import Dict, Any, List, Optional
+import hashlib
+import os
+import logging
+
+from app.services.session_pool import normalize_server_config
+from app.services.disk_cache import CacheEntry, DiskBackedLRU
+
+# 配置日志
+logger = logging.getLogger("app.services.mcp.cache")
+
+# 工具定义缓存参数，可通过环境变量调整
+TOOL_CACHE_TTL = float(os.environ.get("MCP_TOOL_CACHE_TTL", "300"))
+TOOL_CACHE_MAX_ENTRIES = int(os.environ.get("MCP_TOOL_CACHE_MAX_ENTRIES", "256"))
+# 设置后启用磁盘缓存，重启后仍可使用
+TOOL_CACHE_DIR = os.environ.get("MCP_TOOL_CACHE_DIR")
+
+
+def config_hash(server_config: Dict[str, Any]) -> str:
+    """计算服务器配置的稳定哈希"""
+    return hashlib.sha256(normalize_server_config(server_config).encode("utf-8")).hexdigest()
+
+
+class ToolSchemaCache:
+    """
+    按服务器配置哈希缓存转换后的OpenAI工具定义
+
+    内存层按LRU淘汰，记录超过TTL后视为过期；过期记录仍可作为服务器超时时的后备。
+    配置了缓存目录时，记录同时写入磁盘，应用重启后可直接复用。
+    """
+
+    def __init__(
+        self,
+        ttl: float = TOOL_CACHE_TTL,
+        max_entries: int = TOOL_CACHE_MAX_ENTRIES,
+        cache_dir: Optional[str] = TOOL_CACHE_DIR,
+    ):
+        self.ttl = ttl
+        self._store = DiskBackedLRU(max_entries, cache_dir)
+        self.hits = 0
+        self.misses = 0
+        self.stale_hits = 0
+
+    async def get(self, server_config: Dict[str, Any], allow_stale: bool = False) -> Optional[List[Dict[str, Any]]]:
+        """
+        读取缓存的工具定义
+
+        Args:
+            server_config: 服务器配置
+            allow_stale: 是否返回已过期的记录
+
+        Returns:
+            工具定义列表，未命中时返回None
+        """
+        entry = await self._store.get(config_hash(server_config))
+        if entry is None:
+            if not allow_stale:
+                self.misses += 1
+            return None
+
+        if entry.expired(self.ttl):
+            if allow_stale:
+                self.stale_hits += 1
+                return entry.value
+            self.misses += 1
+            return None
+
+        if not allow_stale:
+            self.hits += 1
+        return entry.value
+
+    async def put(self, server_config: Dict[str, Any], tools: List[Dict[str, Any]]) -> None:
+        """写入缓存"""
+        await self._store.put(config_hash(server_config), CacheEntry(tools))
+
+    async def invalidate(self, normalized_key: str) -> None:
+        """
+        使某个服务器的缓存过期
+
+        过期后的记录保留为后备，但下一次工具发现会重新获取工具列表。
+
+        Args:
+            normalized_key: normalize_server_config生成的配置键
+        """
+        key = hashlib.sha256(normalized_key.encode("utf-8")).hexdigest()
+        entry = self._store.peek(key)
+        if entry is not None:
+            entry.stored_at = 0
+        await self._store.remove_from_disk(key)
+
+    def stats(self) -> Dict[str, Any]:
+        """返回缓存命中统计"""
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._store),
+            "hits": self.hits,
+            "misses": self.misses,
+            "stale_hits": self.stale_hits,
+            "disk_hits": self._store.disk_hits,
+            "hit_rate": round(self.hits / total, 3) if total else 0.0,
+        }
@@ -0,0 +1,252 @@
+from typing import Dict, Any, List, Optional, Tuple
+import asyncio
+import json
+import os
+import time
+import logging
+
+from app.services.mcp_service import MCPService
+from app.services.metrics import record_error
+from app.services.tracing import tracer
+from app.services.logging_utils import Payload, SampledLogger
+from app.services.result_shaper import result_shaper
+
+# 配置日志
+logger = logging.getLogger("app.services.tools")
+# 每次工具调用都会执行的日志按采样率记录
+hot_logger = SampledLogger(logger)
+
+# 同一轮对话中工具调用的最大并发数与单次调用超时（秒）
+TOOL_MAX_PARALLEL = int(os.environ.get("TOOL_MAX_PARALLEL", "4"))
+TOOL_CALL_TIMEOUT = float(os.environ.get("TOOL_CALL_TIMEOUT", "60"))
+
+
+def parse_tool_arguments(arguments_str: Optional[str]) -> Dict[str, Any]:
+    """
+    安全解析模型给出的工具参数
+
+    Args:
+        arguments_str: 模型返回的参数字符串
+
+    Returns:
+        参数字典
+    """
+    arguments_str = (arguments_str or "").strip()
+    if not arguments_str:
+        return {}
+    try:
+        # 首先尝试作为JSON对象解析
+        if arguments_str.startswith("{") and arguments_str.endswith("}"):
+            return json.loads(arguments_str)
+        # 尝试作为单个数字或字符串参数
+        if arguments_str.isdigit():
+            # 对于天气查询，假设单个数字可能是城市ID
+            return {"city_id": int(arguments_str)}
+        # 对于天气查询，假设单个字符串可能是城市名
+        return {"city": arguments_str}
+    except json.JSONDecodeError as e:
+        logger.warning(f"JSON参数解析失败，尝试其他解析方式: {e}")
+        # 尝试将参数视为城市名
+        return {"city": arguments_str}
+
+
+class ToolCallResult:
+    """单个工具调用的执行结果"""
+
+    def __init__(self, call_id: str, name: str, arguments: Dict[str, Any]):
+        self.id = call_id
+        self.name = name
+        self.arguments = arguments
+        # content为发送给模型的（可能经过整理的）结果，full_content为工具返回的完整结果
+        self.content = ""
+        self.full_content = ""
+        self.error: Optional[str] = None
+        self.elapsed_ms = 0.0
+        # 实际开始和结束执行的时间（perf_counter），不含排队等待
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+    def to_tool_call(self) -> Dict[str, Any]:
+        """构建助手消息中的标准工具调用对象"""
+        return {
+            "id": self.id,
+            "type": "function",
+            "function": {
+                "name": self.name,
+                "arguments": json.dumps(self.arguments) if self.arguments else "{}",
+            },
+        }
+
+    def to_message(self) -> Dict[str, Any]:
+        """构建工具响应消息"""
+        return {
+            "role": "tool",
+            "name": self.name,
+            "content": self.content,
+            "tool_call_id": self.id,
+        }
+
+    def to_event(self) -> Dict[str, Any]:
+        """构建推送给前端的工具执行事件"""
+        if not self.ok:
+            return {"tool_execution_error": True, "tool_name": self.name, "error": self.error}
+        return {
+            "tool_execution_complete": True,
+            "tool_name": self.name,
+            "tool_arguments": self.arguments,
+            "tool_result": self.full_content or self.content,
+        }
+
+
+class ToolExecutor:
+    """
+    并发执行一轮对话中的全部工具调用
+
+    每个调用有独立的超时，单个调用失败不会影响其他调用，
+    结果按模型给出的顺序返回，便于拼接回消息历史。
+    """
+
+    def __init__(self, mcp_service: MCPService, max_parallel: int = TOOL_MAX_PARALLEL, timeout: float = TOOL_CALL_TIMEOUT):
+        self.mcp_service = mcp_service
+        self.max_parallel = max_parallel
+        self.timeout = timeout
+
+    async def execute_all(self, config: Optional[Dict[str, Any]], tool_calls: List[Dict[str, Any]]) -> List[ToolCallResult]:
+        """
+        执行工具调用列表
+
+        Args:
+            config: MCP配置信息
+            tool_calls: 工具调用列表，每项包含id、name和arguments（字符串）
+
+        Returns:
+            与tool_calls顺序一致的执行结果
+        """
+        semaphore = asyncio.Semaphore(max(1, self.max_parallel))
+        hot_logger.debug("并发执行 %d 个工具调用，最大并发数 %d", len(tool_calls), self.max_parallel)
+        return list(await asyncio.gather(*(self.execute_one(config, call, semaphore) for call in tool_calls)))
+
+    async def execute_one(self, config: Optional[Dict[str, Any]], call: Dict[str, Any], semaphore: asyncio.Semaphore) -> ToolCallResult:
+        """执行单个工具调用，并发数受semaphore限制；错误记录在返回结果中，不会抛出"""
+        result = ToolCallResult(call["id"], call.get("name") or "", parse_tool_arguments(call.get("arguments")))
+
+        # 检查工具名称是否存在
+        if not result.name:
+            result.error = "工具调用缺少名称"
+        elif not config:
+            result.error = "未提供MCP配置，无法执行工具"
+        if not result.ok:
+            logger.error(result.error)
+            result.content = result.error
+            return result
+
+        start = time.perf_counter()
+        async with semaphore:
+            result.started_at = time.perf_counter()
+            try:
+                hot_logger.debug("执行工具: %s 参数: %s", result.name, Payload(result.arguments))
+                with tracer.span("tool.call", tool=result.name, call_id=result.id) as span:
+                    result.full_content = await asyncio.wait_for(
+                        self.mcp_service.execute_tool(config, result.name, result.arguments),
+                        timeout=self.timeout,
+                    )
+                    # 控制再次发送给模型的结果大小，前端事件仍携带完整结果
+                    policy = self.mcp_service.tool_result_policy(config, result.name)
+                    result.content = result_shaper.shape(result.name, result.full_content, policy)
+                    if span is not None:
+                        span.set_attribute("result_chars", len(result.full_content))
+                        span.set_attribute("shaped_chars", len(result.content))
+            except asyncio.TimeoutError as e:
+                record_error("tool", e)
+                result.error = f"工具 {result.name} 执行超时 ({self.timeout}s)"
+            except Exception as e:
+                record_error("tool", e)
+                logger.error(f"执行工具 {result.name} 时出错: {str(e)}", exc_info=True)
+                result.error = f"执行工具时出错: {str(e)}"
+        result.finished_at = time.perf_counter()
+        result.elapsed_ms = (result.finished_at - start) * 1000
+
+        if not result.ok:
+            logger.error(result.error)
+            result.content = result.error
+        else:
+            hot_logger.info("工具 %s 执行完成，耗时 %.1fms", result.name, result.elapsed_ms)
+        return result
+
+
+class ToolDispatcher:
+    """
+    流式响应过程中提前执行工具调用
+
+    参数已完整的调用通过dispatch立即开始执行，与模型后续的输出重叠；流结束后collect
+    补充执行其余调用，并按模型给出的顺序返回全部结果。
+    """
+
+    def __init__(self, executor: ToolExecutor, config: Optional[Dict[str, Any]]):
+        self.executor = executor
+        self.config = config
+        self._semaphore = asyncio.Semaphore(max(1, executor.max_parallel))
+        # 调用ID -> (执行时的参数字符串, 执行任务)
+        self._tasks: Dict[str, Tuple[str, asyncio.Task]] = {}
+
+    @property
+    def dispatched(self) -> int:
+        return len(self._tasks)
+
+    def dispatch(self, call: Dict[str, Any]) -> None:
+        if call["id"] in self._tasks:
+            return
+        hot_logger.debug("提前执行工具调用 %s (%s)", call["id"], call.get("name"))
+        task = asyncio.ensure_future(self.executor.execute_one(self.config, call, self._semaphore))
+        self._tasks[call["id"]] = (call.get("arguments") or "", task)
+
+    async def collect(self, tool_calls: List[Dict[str, Any]]) -> Tuple[List[ToolCallResult], int]:
+        """
+        等待全部工具调用完成
+
+        Returns:
+            (与tool_calls顺序一致的执行结果, 提前执行且结果被采用的调用数)
+        """
+        early = 0
+        tasks = []
+        for call in tool_calls:
+            arguments, task = self._tasks.pop(call["id"], (None, None))
+            if task is not None and arguments == (call.get("arguments") or ""):
+                early += 1
+            else:
+                # 流结束后参数与提前执行时不一致，以完整的参数重新执行
+                if task is not None:
+                    task.cancel()
+                task = asyncio.ensure_future(self.executor.execute_one(self.config, call, self._semaphore))
+            tasks.append(task)
+        return list(await asyncio.gather(*tasks)), early
+
+    def cancel(self) -> None:
+        """取消尚未取走的提前执行任务（流异常中断或客户端断开时）"""
+        for _, task in self._tasks.values():
+            task.cancel()
+        self._tasks.clear()
+
+
+def build_tool_messages(content: Optional[str], results: List[ToolCallResult]) -> List[Dict[str, Any]]:
+    """
+    按顺序构建助手的工具调用消息及其对应的工具响应消息
+
+    Args:
+        content: 助手在工具调用前输出的内容
+        results: 工具执行结果
+
+    Returns:
+        需要追加到消息历史中的消息列表
+    """
+    messages = [{
+        "role": "assistant",
+        "content": content,
+        "tool_calls": [result.to_tool_call() for result in results],
+    }]
+    messages.extend(result.to_message() for result in results)
+    return messages
@@ -0,0 +1,74 @@
+from typing import Dict, Any, List, Optional, Iterable
+import os
+import time
+import logging
+
+from app.services.session_pool import normalize_server_config
+
+# 配置日志
+logger = logging.getLogger("app.services.mcp.router")
+
+# 路由索引的有效期（秒），过期后执行工具前会重新获取该服务器的工具列表
+TOOL_INDEX_TTL = float(os.environ.get("MCP_TOOL_INDEX_TTL", "300"))
+
+
+class _ServerEntry:
+    """单个服务器在索引中的记录"""
+
+    def __init__(self, server_name: str, tool_names: Iterable[str]):
+        self.server_name = server_name
+        self.tool_names = set(tool_names)
+        self.refreshed_at = time.monotonic()
+
+
+class ToolRouter:
+    """
+    工具名到所属服务器的路由索引
+
+    索引按规范化后的服务器配置存储，在工具发现时建立，
+    收到 tools/list_changed 通知或超过TTL后失效。
+    """
+
+    def __init__(self, ttl: float = TOOL_INDEX_TTL):
+        self.ttl = ttl
+        self._entries: Dict[str, _ServerEntry] = {}
+
+    def update(self, server_name: str, server_config: Dict[str, Any], tool_names: Iterable[str]) -> None:
+        """记录某个服务器当前提供的工具"""
+        self._entries[normalize_server_config(server_config)] = _ServerEntry(server_name, tool_names)
+
+    def invalidate(self, key: str) -> None:
+        """使某个服务器的索引失效"""
+        if self._entries.pop(key, None) is not None:
+            logger.info("工具路由索引已失效，下次调用时将重新获取工具列表")
+
+    def _fresh_entry(self, server_config: Dict[str, Any]) -> Optional[_ServerEntry]:
+        entry = self._entries.get(normalize_server_config(server_config))
+        if entry is None or time.monotonic() - entry.refreshed_at > self.ttl:
+            return None
+        return entry
+
+    def is_fresh(self, server_config: Dict[str, Any]) -> bool:
+        """判断某个服务器的索引是否存在且未过期"""
+        return self._fresh_entry(server_config) is not None
+
+    def resolve(self, servers: Dict[str, Dict[str, Any]], tool_name: str) -> Optional[str]:
+        """
+        查找提供指定工具的服务器
+
+        Args:
+            servers: mcpServers字典
+            tool_name: 工具名称
+
+        Returns:
+            按配置顺序第一个提供该工具的服务器名称，索引中没有时返回None
+        """
+        for server_name, server_config in servers.items():
+            entry = self._fresh_entry(server_config)
+            if entry and tool_name in entry.tool_names:
+                return server_name
+        return None
+
+    def stale_servers(self, servers: Dict[str, Dict[str, Any]]) -> List[str]:
+        """返回索引缺失或已过期的服务器名称"""
+        return [name for name, server_config in servers.items() if self._fresh_entry(server_config) is None]
@@ -0,0 +1,319 @@
+from typing import Dict, Any, List, Optional
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+import asyncio
+import atexit
+import json
+import os
+import queue
+import secrets
+import threading
+import time
+import logging
+
+import httpx
+
+# 配置日志
+logger = logging.getLogger("app.services.tracing")
+
+# 追踪导出方式：none（关闭）、memory（保存在进程内，可通过 /api/traces 查看）、file（JSON Lines文件）
+TRACE_EXPORTER = os.environ.get("TRACE_EXPORTER", "none").lower()
+TRACE_FILE = os.environ.get("TRACE_FILE", "traces.jsonl")
+TRACE_MEMORY_MAX_SPANS = int(os.environ.get("TRACE_MEMORY_MAX_SPANS", "10000"))
+
+# 传递给HTTP类型MCP服务器的W3C追踪上下文请求头
+TRACEPARENT_HEADER = "traceparent"
+
+
+class Span:
+    """一次操作的耗时记录"""
+
+    def __init__(self, name: str, trace_id: str, parent_id: Optional[str], attributes: Dict[str, Any]):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.attributes = attributes
+        self.status = "ok"
+        self.start_time = time.time()
+        self._start = time.perf_counter()
+        self.duration_ms: Optional[float] = None
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        self.attributes[key] = value
+
+    def record_error(self, error: BaseException) -> None:
+        self.status = "error"
+        self.attributes["error.type"] = type(error).__name__
+        self.attributes["error.message"] = str(error)[:500]
+
+    @property
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-01"
+
+    def end(self, error: Optional[BaseException] = None) -> None:
+        """结束span并交给导出器，重复调用无效"""
+        if self.duration_ms is not None:
+            return
+        if error is not None:
+            self.record_error(error)
+        self.duration_ms = (time.perf_counter() - self._start) * 1000
+        tracer.export(self)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "start_time": self.start_time,
+            "duration_ms": round(self.duration_ms, 3) if self.duration_ms is not None else None,
+            "status": self.status,
+            "attributes": self.attributes,
+        }
+
+
+class SpanExporter:
+    """span导出器接口"""
+
+    def export(self, span: Span) -> None:
+        raise NotImplementedError
+
+    def close(self) -> None:
+        pass
+
+
+class InMemoryExporter(SpanExporter):
+    """将最近的span保存在内存中，用于测试和本地查看"""
+
+    def __init__(self, max_spans: int = TRACE_MEMORY_MAX_SPANS):
+        self._spans: deque = deque(maxlen=max_spans)
+
+    def export(self, span: Span) -> None:
+        self._spans.append(span)
+
+    def spans(self) -> List[Span]:
+        return list(self._spans)
+
+    def clear(self) -> None:
+        self._spans.clear()
+
+    def traces(self, limit: int = 20) -> List[Dict[str, Any]]:
+        """
+        按追踪分组返回最近的追踪，span按开始时间排序并附带相对开始时间
+
+        Returns:
+            最新的追踪在前
+        """
+        grouped: Dict[str, List[Span]] = {}
+        for span in self._spans:
+            grouped.setdefault(span.trace_id, []).append(span)
+        result = []
+        for trace_id in list(grouped)[::-1][:limit]:
+            spans = sorted(grouped[trace_id], key=lambda item: item.start_time)
+            started = spans[0].start_time
+            result.append({
+                "trace_id": trace_id,
+                "spans": [
+                    {**span.to_dict(), "offset_ms": round((span.start_time - started) * 1000, 3)}
+                    for span in spans
+                ],
+            })
+        return result
+
+
+class FileExporter(SpanExporter):
+    """
+    以JSON Lines格式将span追加写入文件
+
+    导出时只把span的字典快照放入内存队列，序列化和文件写入由后台线程完成，
+    队列清空后才flush一次，文件I/O不会阻塞事件循环。
+    """
+
+    _STOP = object()
+
+    def __init__(self, path: str):
+        self.path = path
+        self._queue: queue.SimpleQueue = queue.SimpleQueue()
+        self._file = open(path, "a", encoding="utf-8")
+        self._thread: Optional[threading.Thread] = threading.Thread(
+            target=self._run, name="trace-file-exporter", daemon=True
+        )
+        self._thread.start()
+        atexit.register(self.close)
+
+    def export(self, span: Span) -> None:
+        self._queue.put(span.to_dict())
+
+    def _run(self) -> None:
+        while True:
+            item = self._queue.get()
+            while item is not self._STOP:
+                try:
+                    self._file.write(json.dumps(item, ensure_ascii=False, default=str) + "\n")
+                except Exception as e:
+                    logger.warning(f"写入追踪文件 {self.path} 失败: {str(e)}")
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+            try:
+                self._file.flush()
+            except Exception as e:
+                logger.warning(f"写入追踪文件 {self.path} 失败: {str(e)}")
+            if item is self._STOP:
+                return
+
+    def close(self) -> None:
+        """停止后台线程，写出队列中剩余的span；重复调用无效"""
+        thread, self._thread = self._thread, None
+        if thread is None:
+            return
+        self._queue.put(self._STOP)
+        thread.join()
+        self._file.close()
+        atexit.unregister(self.close)
+
+
+_current_span: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+
+
+def _reset(token) -> None:
+    # 跨越yield的span可能在其他上下文中结束（如异步生成器被回收），此时无法还原
+    try:
+        _current_span.reset(token)
+    except ValueError:
+        pass
+
+
+class Tracer:
+    """
+    轻量的追踪器
+
+    span通过contextvars嵌套，asyncio任务会继承创建时的当前span。
+    未设置导出器时不创建span，开销可以忽略。
+    """
+
+    def __init__(self, exporter: Optional[SpanExporter] = None):
+        self.exporter = exporter
+
+    @property
+    def enabled(self) -> bool:
+        return self.exporter is not None
+
+    def set_exporter(self, exporter: Optional[SpanExporter]) -> None:
+        """替换导出器，传入None关闭追踪"""
+        if self.exporter is not None and self.exporter is not exporter:
+            self.exporter.close()
+        self.exporter = exporter
+
+    def export(self, span: Span) -> None:
+        if self.exporter is None:
+            return
+        try:
+            self.exporter.export(span)
+        except Exception as e:
+            logger.warning(f"导出span {span.name} 失败: {str(e)}")
+
+    def current_span(self) -> Optional[Span]:
+        return _current_span.get()
+
+    def start_span(self, name: str, parent: Optional[Span] = None, **attributes: Any) -> Optional[Span]:
+        """
+        创建span但不设为当前span，需手动调用end()
+
+        Returns:
+            追踪关闭时返回None
+        """
+        if not self.enabled:
+            return None
+        parent = parent or _current_span.get()
+        trace_id = parent.trace_id if parent else secrets.token_hex(16)
+        return Span(name, trace_id, parent.span_id if parent else None, attributes)
+
+    @contextmanager
+    def activate(self, span: Optional[Span]):
+        """在代码块内将已有span设为当前span"""
+        if span is None:
+            yield None
+            return
+        token = _current_span.set(span)
+        try:
+            yield span
+        finally:
+            _reset(token)
+
+    @contextmanager
+    def span(self, name: str, **attributes: Any):
+        """创建当前span的子span，代码块结束时结束，异常会记录在span上"""
+        span = self.start_span(name, **attributes)
+        if span is None:
+            yield None
+            return
+        token = _current_span.set(span)
+        try:
+            yield span
+        except (GeneratorExit, asyncio.CancelledError):
+            # 客户端断开或任务被取消
+            span.status = "cancelled"
+            raise
+        except BaseException as e:
+            span.record_error(e)
+            raise
+        finally:
+            _reset(token)
+            span.end()
+
+
+def _create_exporter() -> Optional[SpanExporter]:
+    if TRACE_EXPORTER == "memory":
+        return InMemoryExporter()
+    if TRACE_EXPORTER == "file":
+        return FileExporter(TRACE_FILE)
+    if TRACE_EXPORTER not in ("", "none"):
+        logger.warning(f"未知的追踪导出方式 {TRACE_EXPORTER}，追踪已关闭")
+    return None
+
+
+tracer = Tracer(_create_exporter())
+
+
+def trace_meta() -> Optional[Dict[str, str]]:
+    """当前span的追踪上下文，用于写入MCP请求的_meta字段"""
+    span = _current_span.get()
+    return {TRACEPARENT_HEADER: span.traceparent} if span is not None else None
+
+
+async def _inject_traceparent(request: httpx.Request) -> None:
+    """
+    将MCP请求_meta中的追踪上下文提升为HTTP请求头
+
+    MCP客户端由独立的后台任务发送请求，无法读取调用方的contextvars，
+    因此追踪上下文随JSON-RPC消息的_meta字段传递，在这里转为请求头。
+    """
+    body = request.content
+    if not body or b'"traceparent"' not in body:
+        return
+    try:
+        message = json.loads(body)
+        traceparent = ((message.get("params") or {}).get("_meta") or {}).get(TRACEPARENT_HEADER)
+    except (ValueError, AttributeError):
+        return
+    if traceparent:
+        request.headers[TRACEPARENT_HEADER] = traceparent
+
+
+def traced_http_client_factory(
+    headers: Optional[Dict[str, str]] = None,
+    timeout: Optional[httpx.Timeout] = None,
+    auth: Optional[httpx.Auth] = None,
+) -> httpx.AsyncClient:
+    """HTTP类型MCP传输使用的httpx客户端工厂，发送请求时附带追踪上下文请求头"""
+    return httpx.AsyncClient(
+        headers=headers,
+        timeout=timeout or httpx.Timeout(30.0),
+        auth=auth,
+        follow_redirects=True,
+        event_hooks={"request": [_inject_traceparent]},
+    )
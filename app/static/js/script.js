@@ -156,8 +156,15 @@ document.addEventListener('DOMContentLoaded', () => {
         });
     });
 
-    // 保存聊天历史记录
+    // 保存聊天历史记录，仅在服务端没有该会话时（如过期或重启）补发
     let messageHistory = [];
+    // 是否已与服务端完成过对话
+    let conversationStarted = false;
+
+    // 会话ID：聊天历史保存在服务端，每次只发送新消息；刷新页面即开始新会话
+    const conversationId = (window.crypto && crypto.randomUUID)
+        ? crypto.randomUUID()
+        : `${Date.now()}-${Math.random().toString(16).slice(2)}`;
 
     // 获取当前页面的基础URL
     const baseUrl = window.location.origin;
@@ -411,7 +418,7 @@ document.addEventListener('DOMContentLoaded', () => {
                 toolStatusElement = null;
             }
 
-            // 将完整内容添加到历史记录
+            // 显示最终内容并添加到历史记录
             if (streamContent && messageElement) {
                 // 移除"正在使用工具..."提示，不显示在最终消息中
                 streamContent = streamContent.replace(/\n\n\*正在使用工具\.\.\.\*$/g, '');
@@ -439,7 +446,7 @@ document.addEventListener('DOMContentLoaded', () => {
     }
 
     // 发送消息到API
-    async function sendMessage(message) {
+    async function sendMessage(message, resendHistory = false) {
         try {
             // 获取MCP配置
             let mcpConfig = null;
@@ -462,12 +469,11 @@ document.addEventListener('DOMContentLoaded', () => {
             // 获取当前选择的模型
             const selectedModel = modelSelect.value;
 
-            // 准备请求数据 - 复制一份消息历史用于请求
-            // 注意: 流式响应中工具调用的历史记录将由后端管理，但我们需要更新本地历史以便进行后续对话
-            const requestHistory = JSON.parse(JSON.stringify(messageHistory));
-
+            // 准备请求数据 - 只发送本轮的新消息，历史记录由服务端按会话ID保存
             const requestData = {
-                messages: requestHistory,
+                messages: [{ role: 'user', content: message }],
+                conversation_id: conversationId,
+                continued: conversationStarted,
                 model: selectedModel,
                 stream: true  // 启用流式响应
             };
@@ -476,6 +482,11 @@ document.addEventListener('DOMContentLoaded', () => {
                 requestData.mcp_config = mcpConfig;
             }
 
+            // 服务端没有该会话的记录时补发本地历史（不含本轮消息）
+            if (resendHistory) {
+                requestData.history = messageHistory.slice(0, -1);
+            }
+
             // 显示加载状态
             const loadingElement = document.createElement('div');
             loadingElement.className = 'message bot-message loading';
@@ -494,6 +505,11 @@ document.addEventListener('DOMContentLoaded', () => {
             // 移除加载状态
             chatMessages.removeChild(loadingElement);
 
+            // 服务端没有该会话的记录，附带本地历史重试一次
+            if (response.status === 409 && !resendHistory) {
+                return await sendMessage(message, true);
+            }
+
             if (!response.ok) {
                 // 尝试解析错误响应
                 let errorDetail = '';
@@ -513,6 +529,8 @@ document.addEventListener('DOMContentLoaded', () => {
                 throw new Error(`API错误: ${response.status} - ${errorDetail}`);
             }
 
+            conversationStarted = true;
+
             // 检查返回的Content-Type
             const contentType = response.headers.get('Content-Type');
 
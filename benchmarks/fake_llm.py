@@ -0,0 +1,148 @@
+#!/usr/bin/env python
+"""
+兼容OpenAI接口的本地假模型服务
+用于基准测试，不消耗真实模型的配额，延迟可控
+
+请求中带有工具且工具调用轮数未达到 --tool-rounds 时，返回对 --tool-name 工具的调用
+（每轮 --tool-calls 个）；否则返回由 --tokens 个词组成的文本回复。
+流式响应先等待 --ttft 秒，再每隔 --token-delay 秒输出一个数据块。
+--error-rate 大于0时按该概率返回503，用于测试多提供方路由的故障切换。
+
+用法:
+    python benchmarks/fake_llm.py --port 8901 --ttft 0.2 --token-delay 0.01
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import time
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+app = FastAPI()
+
+# 运行参数，由命令行设置
+settings = {
+    "ttft": 0.1,
+    "token_delay": 0.005,
+    "tokens": 50,
+    "tool_rounds": 1,
+    "tool_calls": 2,
+    "tool_name": "echo",
+    "error_rate": 0.0,
+}
+
+
+def _chunk(delta: dict, finish_reason=None, usage=None) -> str:
+    data = {
+        "id": "bench",
+        "object": "chat.completion.chunk",
+        "created": int(time.time()),
+        "model": "fake",
+        "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}] if usage is None else [],
+    }
+    if usage is not None:
+        data["usage"] = usage
+    return f"data: {json.dumps(data)}\n\n"
+
+
+def _plan(body: dict):
+    """根据请求决定本次返回工具调用还是文本"""
+    messages = body.get("messages", [])
+    rounds = sum(1 for message in messages if message.get("role") == "assistant" and message.get("tool_calls"))
+    tool_names = [tool["function"]["name"] for tool in body.get("tools") or []]
+    if tool_names and rounds < settings["tool_rounds"]:
+        name = settings["tool_name"] if settings["tool_name"] in tool_names else tool_names[0]
+        return [
+            {"id": f"call_{rounds}_{idx}", "name": name, "arguments": json.dumps({"text": f"bench-{rounds}-{idx}"})}
+            for idx in range(settings["tool_calls"])
+        ], None
+    words = [f"token{idx}" for idx in range(settings["tokens"])]
+    return None, words
+
+
+def _usage(completion_tokens: int) -> dict:
+    return {"prompt_tokens": 100, "completion_tokens": completion_tokens, "total_tokens": 100 + completion_tokens}
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    if random.random() < settings["error_rate"]:
+        return JSONResponse({"error": {"message": "fake upstream error", "type": "server_error"}}, status_code=503)
+    calls, words = _plan(body)
+
+    if body.get("stream"):
+        include_usage = (body.get("stream_options") or {}).get("include_usage")
+
+        async def generate():
+            await asyncio.sleep(settings["ttft"])
+            yield _chunk({"role": "assistant", "content": ""})
+            if calls:
+                for idx, call in enumerate(calls):
+                    yield _chunk({"tool_calls": [{"index": idx, "id": call["id"], "type": "function",
+                                                  "function": {"name": call["name"], "arguments": ""}}]})
+                    arguments = call["arguments"]
+                    for start in range(0, len(arguments), 8):
+                        await asyncio.sleep(settings["token_delay"])
+                        yield _chunk({"tool_calls": [{"index": idx, "function": {"arguments": arguments[start:start + 8]}}]})
+                yield _chunk({}, "tool_calls")
+                produced = len(calls) * 10
+            else:
+                for word in words:
+                    await asyncio.sleep(settings["token_delay"])
+                    yield _chunk({"content": word + " "})
+                yield _chunk({}, "stop")
+                produced = len(words)
+            if include_usage:
+                yield _chunk({}, usage=_usage(produced))
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(generate(), media_type="text/event-stream")
+
+    # 非流式响应的耗时等于流式响应的总耗时
+    produced = len(calls) * 10 if calls else len(words)
+    await asyncio.sleep(settings["ttft"] + settings["token_delay"] * produced)
+    message = {"role": "assistant", "content": None if calls else " ".join(words)}
+    if calls:
+        message["tool_calls"] = [
+            {"id": call["id"], "type": "function", "function": {"name": call["name"], "arguments": call["arguments"]}}
+            for call in calls
+        ]
+    return {
+        "id": "bench",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": "fake",
+        "choices": [{"index": 0, "message": message, "finish_reason": "tool_calls" if calls else "stop"}],
+        "usage": _usage(produced),
+    }
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="兼容OpenAI接口的本地假模型服务")
+    parser.add_argument("--host", default="127.0.0.1", help="监听地址")
+    parser.add_argument("--port", type=int, default=8901, help="监听端口")
+    parser.add_argument("--ttft", type=float, default=0.1, help="首个数据块前的延迟（秒）")
+    parser.add_argument("--token-delay", type=float, default=0.005, help="数据块之间的间隔（秒）")
+    parser.add_argument("--tokens", type=int, default=50, help="文本回复的词数")
+    parser.add_argument("--tool-rounds", type=int, default=1, help="每轮对话中请求工具调用的轮数")
+    parser.add_argument("--tool-calls", type=int, default=2, help="每轮请求的工具调用数")
+    parser.add_argument("--tool-name", default="echo", help="请求调用的工具名，请求中没有该工具时使用第一个工具")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="返回503错误的概率")
+    args = parser.parse_args()
+
+    settings.update(
+        ttft=args.ttft,
+        token_delay=args.token_delay,
+        tokens=args.tokens,
+        tool_rounds=args.tool_rounds,
+        tool_calls=args.tool_calls,
+        tool_name=args.tool_name,
+        error_rate=args.error_rate,
+    )
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
@@ -0,0 +1,51 @@
+#!/usr/bin/env python
+"""
+基准测试用的假MCP服务器
+支持SSE、Streamable HTTP和stdio三种传输，工具调用延迟可配置
+
+用法:
+    python benchmarks/fake_mcp_server.py --transport sse --port 8911 --latency 0.02
+    python benchmarks/fake_mcp_server.py --transport streamable-http --port 8912
+    python benchmarks/fake_mcp_server.py --transport stdio
+"""
+
+import argparse
+import asyncio
+
+from fastmcp import FastMCP
+
+mcp = FastMCP("bench")
+
+# 运行参数，由命令行设置
+settings = {"latency": 0.0, "payload": 64}
+
+
+@mcp.tool()
+async def echo(text: str) -> str:
+    """Echo the given text back after the configured latency."""
+    if settings["latency"]:
+        await asyncio.sleep(settings["latency"])
+    return f"echo:{text}" + "." * settings["payload"]
+
+
+@mcp.tool()
+async def sleep(seconds: float) -> str:
+    """Sleep for the given number of seconds."""
+    await asyncio.sleep(seconds)
+    return f"slept {seconds}"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="基准测试用的假MCP服务器")
+    parser.add_argument("--transport", choices=["sse", "streamable-http", "stdio"], default="sse", help="传输类型")
+    parser.add_argument("--host", default="127.0.0.1", help="监听地址（HTTP传输）")
+    parser.add_argument("--port", type=int, default=8911, help="监听端口（HTTP传输）")
+    parser.add_argument("--latency", type=float, default=0.0, help="echo工具的模拟延迟（秒）")
+    parser.add_argument("--payload", type=int, default=64, help="echo工具结果附加的字节数")
+    args = parser.parse_args()
+
+    settings.update(latency=args.latency, payload=args.payload)
+    if args.transport == "stdio":
+        mcp.run()
+    else:
+        mcp.run(transport=args.transport, host=args.host, port=args.port, log_level="warning")
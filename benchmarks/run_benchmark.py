@@ -0,0 +1,293 @@
+#!/usr/bin/env python
+"""
+/api/chat 基准测试
+
+启动假模型服务、假MCP服务器（SSE、Streamable HTTP、stdio）和被测应用，
+按指定并发数压测流式与非流式对话，输出各场景的延迟分位数、首个数据块时间和吞吐量。
+结果可保存为JSON（附带当前提交），并与之前的结果对比，用于发现性能回退。
+
+用法:
+    python benchmarks/run_benchmark.py --requests 200 --concurrency 20
+    python benchmarks/run_benchmark.py --transports sse stdio --modes stream --output after.json --compare before.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+from typing import Dict, Any, List, Optional
+
+import httpx
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCH_DIR)
+
+TRANSPORTS = ["sse", "streamable-http", "stdio"]
+MODES = ["stream", "non-stream"]
+
+
+def percentile(values: List[float], pct: float) -> Optional[float]:
+    """最近秩法计算分位数"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, int(round(pct / 100 * len(ordered) + 0.5)))
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+def summarize(values: List[float]) -> Dict[str, Optional[float]]:
+    def ms(value):
+        return round(value * 1000, 2) if value is not None else None
+    return {
+        "p50_ms": ms(percentile(values, 50)),
+        "p95_ms": ms(percentile(values, 95)),
+        "p99_ms": ms(percentile(values, 99)),
+        "mean_ms": ms(sum(values) / len(values)) if values else None,
+    }
+
+
+class Processes:
+    """管理基准测试启动的子进程"""
+
+    def __init__(self):
+        self._procs: List[subprocess.Popen] = []
+
+    def start(self, args: List[str], env: Optional[Dict[str, str]] = None) -> subprocess.Popen:
+        proc = subprocess.Popen(
+            args, cwd=ROOT_DIR, env={**os.environ, **(env or {})},
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+        self._procs.append(proc)
+        return proc
+
+    def stop(self) -> None:
+        for proc in self._procs:
+            proc.terminate()
+        for proc in self._procs:
+            try:
+                proc.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+
+
+async def wait_ready(url: str, timeout: float = 30) -> None:
+    """等待HTTP服务开始监听"""
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while time.monotonic() < deadline:
+            try:
+                await client.get(url, timeout=1)
+                return
+            except httpx.HTTPError:
+                await asyncio.sleep(0.2)
+    raise RuntimeError(f"服务未能在 {timeout}s 内启动: {url}")
+
+
+def server_config(transport: str, args) -> Dict[str, Any]:
+    if transport == "sse":
+        server = {"url": f"http://127.0.0.1:{args.mcp_port}/sse", "transport_type": "sse"}
+    elif transport == "streamable-http":
+        server = {"url": f"http://127.0.0.1:{args.mcp_port + 1}/mcp/", "transport_type": "streamable-http"}
+    else:
+        server = {
+            "command": sys.executable,
+            "args": [os.path.join(BENCH_DIR, "fake_mcp_server.py"), "--transport", "stdio", "--latency", str(args.tool_latency)],
+        }
+    return {"mcpServers": {"bench": server}}
+
+
+async def one_request(client: httpx.AsyncClient, url: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+    """发送一次对话请求，流式请求记录首个数据块时间"""
+    start = time.perf_counter()
+    ttft = None
+    try:
+        if payload["stream"]:
+            async with client.stream("POST", url, json=payload) as response:
+                response.raise_for_status()
+                async for line in response.aiter_lines():
+                    if ttft is None and line.startswith("data:") and '"choices"' in line:
+                        ttft = time.perf_counter() - start
+                    if '"error"' in line and line.startswith("data:") and "choices" not in line:
+                        raise RuntimeError(line[:200])
+        else:
+            response = await client.post(url, json=payload)
+            response.raise_for_status()
+        return {"ok": True, "latency": time.perf_counter() - start, "ttft": ttft}
+    except Exception as e:
+        return {"ok": False, "latency": time.perf_counter() - start, "ttft": None, "error": f"{type(e).__name__}: {e}"[:200]}
+
+
+async def run_scenario(args, transport: str, mode: str) -> Dict[str, Any]:
+    """以固定并发数执行一个场景的全部请求"""
+    url = f"http://127.0.0.1:{args.app_port}/api/chat"
+    payload = {
+        "messages": [{"role": "user", "content": "benchmark"}],
+        "mcp_config": server_config(transport, args),
+        "model": "fake",
+        "stream": mode == "stream",
+    }
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(limits=limits, timeout=args.timeout) as client:
+        # 预热：建立MCP会话、填充工具缓存
+        for _ in range(args.warmup):
+            await one_request(client, url, payload)
+
+        queue: asyncio.Queue = asyncio.Queue()
+        for _ in range(args.requests):
+            queue.put_nowait(None)
+        results: List[Dict[str, Any]] = []
+
+        async def worker():
+            while True:
+                try:
+                    queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                results.append(await one_request(client, url, payload))
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+        elapsed = time.perf_counter() - started
+
+    ok = [result for result in results if result["ok"]]
+    errors = [result["error"] for result in results if not result["ok"]]
+    report = {
+        "requests": len(results),
+        "errors": len(errors),
+        "throughput_rps": round(len(ok) / elapsed, 2) if elapsed else None,
+        "latency": summarize([result["latency"] for result in ok]),
+    }
+    if mode == "stream":
+        report["ttft"] = summarize([result["ttft"] for result in ok if result["ttft"] is not None])
+    if errors:
+        report["sample_error"] = errors[0]
+    return report
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT_DIR, text=True).strip()
+    except Exception:
+        return None
+
+
+def fmt(value: Optional[float]) -> str:
+    return f"{value:.1f}" if value is not None else "-"
+
+
+def print_report(results: Dict[str, Any], baseline: Optional[Dict[str, Any]]) -> None:
+    if baseline and baseline.get("params") != results["params"]:
+        changed = sorted(
+            key for key in set(results["params"]) | set(baseline.get("params", {}))
+            if results["params"].get(key) != baseline.get("params", {}).get(key)
+        )
+        print(f"注意: 与对比结果的参数不同 ({', '.join(changed)})，对比仅供参考")
+    header = f"{'scenario':<28}{'rps':>9}{'p50':>10}{'p95':>10}{'p99':>10}{'ttft p50':>10}{'ttft p95':>10}{'err':>6}"
+    print(header)
+    print("-" * len(header))
+    for name, report in results["scenarios"].items():
+        latency = report["latency"]
+        ttft = report.get("ttft") or {}
+        print(
+            f"{name:<28}{fmt(report['throughput_rps']):>9}{fmt(latency['p50_ms']):>10}"
+            f"{fmt(latency['p95_ms']):>10}{fmt(latency['p99_ms']):>10}"
+            f"{fmt(ttft.get('p50_ms')):>10}{fmt(ttft.get('p95_ms')):>10}{report['errors']:>6}"
+        )
+        old = (baseline or {}).get("scenarios", {}).get(name)
+        if old:
+            def delta(new_value, old_value):
+                if not new_value or not old_value:
+                    return "n/a"
+                return f"{(new_value - old_value) / old_value * 100:+.1f}%"
+            print(
+                f"{'  vs ' + str(baseline.get('commit')):<28}"
+                f"{delta(report['throughput_rps'], old['throughput_rps']):>9}"
+                f"{delta(latency['p50_ms'], old['latency']['p50_ms']):>10}"
+                f"{delta(latency['p95_ms'], old['latency']['p95_ms']):>10}"
+                f"{delta(latency['p99_ms'], old['latency']['p99_ms']):>10}"
+                f"{delta(ttft.get('p50_ms'), (old.get('ttft') or {}).get('p50_ms')):>10}"
+                f"{delta(ttft.get('p95_ms'), (old.get('ttft') or {}).get('p95_ms')):>10}"
+            )
+    for name, report in results["scenarios"].items():
+        if report.get("sample_error"):
+            print(f"{name} 错误示例: {report['sample_error']}")
+
+
+async def main(args) -> None:
+    processes = Processes()
+    python = sys.executable
+    try:
+        processes.start([
+            python, os.path.join(BENCH_DIR, "fake_llm.py"), "--port", str(args.llm_port),
+            "--ttft", str(args.llm_ttft), "--token-delay", str(args.llm_token_delay),
+            "--tokens", str(args.llm_tokens), "--tool-rounds", str(args.tool_rounds), "--tool-calls", str(args.tool_calls),
+        ])
+        if "sse" in args.transports:
+            processes.start([python, os.path.join(BENCH_DIR, "fake_mcp_server.py"), "--transport", "sse",
+                             "--port", str(args.mcp_port), "--latency", str(args.tool_latency)])
+        if "streamable-http" in args.transports:
+            processes.start([python, os.path.join(BENCH_DIR, "fake_mcp_server.py"), "--transport", "streamable-http",
+                             "--port", str(args.mcp_port + 1), "--latency", str(args.tool_latency)])
+
+        app_env = {
+            "ARK_API_KEY": "benchmark",
+            "LLM_BASE_URL": f"http://127.0.0.1:{args.llm_port}/v1",
+        }
+        processes.start([python, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1",
+                         "--port", str(args.app_port), "--log-level", "warning"], env=app_env)
+
+        await wait_ready(f"http://127.0.0.1:{args.llm_port}/docs")
+        await wait_ready(f"http://127.0.0.1:{args.app_port}/health")
+        if "sse" in args.transports:
+            await wait_ready(f"http://127.0.0.1:{args.mcp_port}/")
+        if "streamable-http" in args.transports:
+            await wait_ready(f"http://127.0.0.1:{args.mcp_port + 1}/")
+
+        results = {
+            "commit": git_commit(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "params": {key: value for key, value in vars(args).items() if key not in ("output", "compare")},
+            "scenarios": {},
+        }
+        for transport in args.transports:
+            for mode in args.modes:
+                name = f"{transport}/{mode}"
+                print(f"运行场景 {name} ...", file=sys.stderr)
+                results["scenarios"][name] = await run_scenario(args, transport, mode)
+    finally:
+        processes.stop()
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+    print_report(results, baseline)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"结果已保存到 {args.output}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="/api/chat 基准测试")
+    parser.add_argument("--requests", type=int, default=100, help="每个场景的请求数")
+    parser.add_argument("--concurrency", type=int, default=10, help="并发请求数")
+    parser.add_argument("--warmup", type=int, default=3, help="每个场景正式计时前的预热请求数")
+    parser.add_argument("--timeout", type=float, default=120, help="单个请求的超时（秒）")
+    parser.add_argument("--transports", nargs="+", choices=TRANSPORTS, default=TRANSPORTS, help="测试的MCP传输类型")
+    parser.add_argument("--modes", nargs="+", choices=MODES, default=MODES, help="测试流式或非流式响应")
+    parser.add_argument("--llm-ttft", type=float, default=0.1, help="假模型的首个数据块延迟（秒）")
+    parser.add_argument("--llm-token-delay", type=float, default=0.005, help="假模型的数据块间隔（秒）")
+    parser.add_argument("--llm-tokens", type=int, default=50, help="假模型文本回复的词数")
+    parser.add_argument("--tool-rounds", type=int, default=1, help="每次对话中工具调用的轮数")
+    parser.add_argument("--tool-calls", type=int, default=2, help="每轮工具调用数")
+    parser.add_argument("--tool-latency", type=float, default=0.02, help="假MCP工具的执行延迟（秒）")
+    parser.add_argument("--app-port", type=int, default=8920, help="被测应用端口")
+    parser.add_argument("--llm-port", type=int, default=8921, help="假模型服务端口")
+    parser.add_argument("--mcp-port", type=int, default=8922, help="假MCP服务器端口（SSE），Streamable HTTP使用下一个端口")
+    parser.add_argument("--output", help="保存结果的JSON文件")
+    parser.add_argument("--compare", help="用于对比的历史结果JSON文件")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,138 @@
+#!/usr/bin/env python
+"""
+本地NWS API替身服务器
+用于在不访问 api.weather.gov 的情况下调试和压测 weather_service.py
+
+返回结构与真实API一致的示例数据，并带有Cache-Control、ETag和Last-Modified头，
+支持If-None-Match/If-Modified-Since条件请求（返回304）。/_stats 返回各路径的请求计数。
+
+用法:
+    python mock_nws_server.py --port 8001 --latency 0.05
+    NWS_API_BASE=http://127.0.0.1:8001 python weather_service.py
+"""
+
+import argparse
+import asyncio
+import hashlib
+import json
+from collections import Counter
+from email.utils import formatdate
+
+import fastapi
+from fastapi import Request, Response
+
+app = fastapi.FastAPI()
+
+# 运行参数，由命令行设置
+settings = {"latency": 0.0, "max_age": 60, "points_max_age": 3600, "alerts": 3}
+# 请求计数：full为返回完整响应的次数，not_modified为返回304的次数
+stats = {"full": Counter(), "not_modified": Counter()}
+
+# 数据固定不变，Last-Modified取启动时间
+STARTED_AT = formatdate(usegmt=True)
+
+
+def _grid_for(latitude: float, longitude: float) -> tuple:
+    """按约2.5km的网格分辨率把经纬度映射到网格坐标"""
+    return int(round(latitude / 0.0225)) % 200, int(round(longitude / 0.0225)) % 200
+
+
+async def _respond(request: Request, key: str, body: dict, max_age: int) -> Response:
+    """按条件请求头返回完整响应或304"""
+    if settings["latency"]:
+        await asyncio.sleep(settings["latency"])
+
+    payload = json.dumps(body).encode("utf-8")
+    etag = '"' + hashlib.sha256(payload).hexdigest()[:16] + '"'
+    headers = {
+        "Cache-Control": f"public, max-age={max_age}",
+        "ETag": etag,
+        "Last-Modified": STARTED_AT,
+    }
+    if request.headers.get("if-none-match") == etag or (
+        "if-none-match" not in request.headers and request.headers.get("if-modified-since") == STARTED_AT
+    ):
+        stats["not_modified"][key] += 1
+        return Response(status_code=304, headers=headers)
+
+    stats["full"][key] += 1
+    return Response(content=payload, media_type="application/geo+json", headers=headers)
+
+
+@app.get("/points/{coordinates}")
+async def points(coordinates: str, request: Request):
+    latitude, longitude = (float(value) for value in coordinates.split(","))
+    x, y = _grid_for(latitude, longitude)
+    base = str(request.base_url).rstrip("/")
+    body = {
+        "properties": {
+            "gridId": "MOCK",
+            "gridX": x,
+            "gridY": y,
+            "forecast": f"{base}/gridpoints/MOCK/{x},{y}/forecast",
+        }
+    }
+    return await _respond(request, "points", body, settings["points_max_age"])
+
+
+@app.get("/gridpoints/{office}/{grid}/forecast")
+async def forecast(office: str, grid: str, request: Request):
+    periods = [
+        {
+            "name": name,
+            "temperature": 60 + idx,
+            "temperatureUnit": "F",
+            "windSpeed": f"{5 + idx} mph",
+            "windDirection": "NW",
+            "detailedForecast": f"Mock forecast for {office} {grid}, period {idx + 1}.",
+        }
+        for idx, name in enumerate(["Today", "Tonight", "Monday", "Monday Night", "Tuesday", "Tuesday Night"])
+    ]
+    return await _respond(request, "forecast", {"properties": {"periods": periods}}, settings["max_age"])
+
+
+@app.get("/alerts/active/area/{area}")
+async def alerts(area: str, request: Request):
+    # 预警按区县重复发布，与真实数据一样同一预警会出现在多个区县
+    kinds = [
+        ("Flood Warning", "Severe"),
+        ("Wind Advisory", "Moderate"),
+        ("Special Weather Statement", "Minor"),
+        ("Tornado Warning", "Extreme"),
+    ]
+    features = []
+    for idx in range(settings["alerts"]):
+        event, severity = kinds[idx % len(kinds)]
+        features.append({
+            "properties": {
+                "id": f"urn:oid:mock.{area}.{idx}",
+                "event": event,
+                "areaDesc": f"{area} County {idx}",
+                "severity": severity,
+                "headline": f"{event} issued for {area}",
+                "description": f"Mock {event.lower()} for {area}, issue {idx // (len(kinds) * 3)}. " * 20,
+                "instruction": "Monitor local news.",
+            }
+        })
+    return await _respond(request, "alerts", {"features": features}, settings["max_age"])
+
+
+@app.get("/_stats")
+async def get_stats():
+    return {name: dict(counter) for name, counter in stats.items()}
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="本地NWS API替身服务器")
+    parser.add_argument("--host", default="127.0.0.1", help="监听地址")
+    parser.add_argument("--port", type=int, default=8001, help="监听端口")
+    parser.add_argument("--latency", type=float, default=0.0, help="每个请求的模拟延迟（秒）")
+    parser.add_argument("--max-age", type=int, default=60, help="预报和预警响应的max-age（秒）")
+    parser.add_argument("--alerts", type=int, default=3, help="每个区域返回的预警数量")
+    parser.add_argument("--points-max-age", type=int, default=3600, help="/points响应的max-age（秒）")
+    args = parser.parse_args()
+
+    settings.update(latency=args.latency, max_age=args.max_age, points_max_age=args.points_max_age, alerts=args.alerts)
+    uvicorn.run(app, host=args.host, port=args.port)
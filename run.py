@@ -2,6 +2,7 @@
 import uvicorn
 import os
 import argparse
+import importlib.util
 import logging
 import sys
 
@@ -16,14 +17,42 @@ logging.basicConfig(
 
 logger = logging.getLogger("run")
 
+def _default_workers() -> int:
+    """默认工作进程数：WEB_CONCURRENCY环境变量，未设置时为1"""
+    return int(os.environ.get("WEB_CONCURRENCY") or 1)
+
+def _event_loop() -> str:
+    """已安装uvloop时使用uvloop，否则使用标准asyncio事件循环"""
+    return "uvloop" if importlib.util.find_spec("uvloop") else "asyncio"
+
+def _http_protocol() -> str:
+    """已安装httptools时使用httptools解析HTTP，否则使用h11"""
+    return "httptools" if importlib.util.find_spec("httptools") else "h11"
+
 def main():
     """主函数，启动FastAPI应用"""
     parser = argparse.ArgumentParser(description='启动外部MCP服务器大模型演示')
     parser.add_argument('--host', type=str, default='0.0.0.0', help='监听主机 (默认: 0.0.0.0)')
     parser.add_argument('--port', type=int, default=8080, help='监听端口 (默认: 8080)')
     parser.add_argument('--api-key', type=str, help='设置ARK API密钥')
+    parser.add_argument('--reload', action='store_true', help='开发模式：单进程运行，代码变化时自动重启')
+    parser.add_argument('--workers', type=int, default=_default_workers(),
+                        help='工作进程数，大于1时需设置CONVERSATION_DB_PATH (默认: WEB_CONCURRENCY环境变量或1)')
+    parser.add_argument('--keep-alive', type=int, default=int(os.environ.get('APP_KEEP_ALIVE', '5')),
+                        help='空闲keep-alive连接保持的秒数 (默认: 5)')
+    parser.add_argument('--backlog', type=int, default=int(os.environ.get('APP_BACKLOG', '2048')),
+                        help='等待接受的连接队列长度 (默认: 2048)')
+    parser.add_argument('--limit-concurrency', type=int, default=None,
+                        help='每个进程同时处理的最大连接数，超出时返回503 (默认: 不限制)')
+    parser.add_argument('--graceful-timeout', type=int, default=int(os.environ.get('APP_GRACEFUL_TIMEOUT', '30')),
+                        help='退出时等待进行中的请求（含SSE流）完成的秒数 (默认: 30)')
+    parser.add_argument('--warmup-config', type=str, help='MCP配置JSON文件，每个工作进程启动时预先连接其中的服务器')
     args = parser.parse_args()
-    
+
+    # 对话默认保存在进程内存中，多个工作进程之间必须通过SQLite文件共享，否则后续轮次可能落到没有历史的进程
+    if args.workers > 1 and not args.reload and not os.environ.get('CONVERSATION_DB_PATH'):
+        parser.error('--workers 大于1时需设置CONVERSATION_DB_PATH，使各工作进程共享对话历史')
+
     # 设置API密钥环境变量
     if args.api_key:
         os.environ['ARK_API_KEY'] = args.api_key
@@ -31,15 +60,39 @@ def main():
     else:
         if 'ARK_API_KEY' not in os.environ:
             logger.warning("未设置ARK_API_KEY环境变量，应用将以测试模式运行")
-    
-    # 启动服务器
-    logger.info(f"启动服务器 http://{args.host}:{args.port}")
+
+    # 工作进程在lifespan中读取该环境变量预热MCP会话
+    if args.warmup_config:
+        os.environ['MCP_WARMUP_CONFIG'] = os.path.abspath(args.warmup_config)
+
+    if args.reload:
+        logger.info(f"以开发模式启动服务器 http://{args.host}:{args.port}")
+        uvicorn.run(
+            "app.main:app",
+            host=args.host,
+            port=args.port,
+            reload=True
+        )
+        return
+
+    # 生产模式：关闭文件监视，可启动多个工作进程
+    loop, http = _event_loop(), _http_protocol()
+    logger.info(f"启动服务器 http://{args.host}:{args.port}，工作进程数 {args.workers}，事件循环 {loop}，HTTP解析 {http}")
+    if args.workers > 1:
+        logger.info("各工作进程的MCP会话池、缓存、/metrics 和 /api/traces 相互独立，对话历史通过CONVERSATION_DB_PATH共享")
     uvicorn.run(
         "app.main:app",
         host=args.host,
         port=args.port,
-        reload=True
+        workers=args.workers,
+        loop=loop,
+        http=http,
+        timeout_keep_alive=args.keep_alive,
+        backlog=args.backlog,
+        limit_concurrency=args.limit_concurrency,
+        timeout_graceful_shutdown=args.graceful_timeout,
+        access_log=False,
     )
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    main()
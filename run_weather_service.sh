@@ -7,4 +7,4 @@ pip install fastmcp uvicorn requests
 
 # 启动天气服务
 echo "启动天气MCP服务器..."
-python weather_service.py 
\ No newline at end of file
+python weather_service.py "$@"
\ No newline at end of file
@@ -0,0 +1,150 @@
+"""多提供方模型路由：故障切换、暂停、不可重试错误与对冲，使用本地替身端点"""
+
+import asyncio
+import time
+
+import httpx
+import openai
+import pytest
+from openai import AsyncOpenAI
+
+from app.services import llm_router
+from app.services.llm_router import LLMProvider, LLMRouter
+from benchmarks import fake_llm
+
+pytestmark = pytest.mark.anyio
+
+MESSAGES = [{"role": "user", "content": "hi"}]
+
+
+@pytest.fixture(autouse=True)
+def fast_fake_llm(monkeypatch):
+    monkeypatch.setitem(fake_llm.settings, "ttft", 0.0)
+    monkeypatch.setitem(fake_llm.settings, "token_delay", 0.0)
+    monkeypatch.setitem(fake_llm.settings, "tokens", 3)
+    monkeypatch.setitem(fake_llm.settings, "error_rate", 0.0)
+
+
+def make_provider(name: str, transport: httpx.AsyncBaseTransport) -> LLMProvider:
+    client = AsyncOpenAI(
+        api_key="test",
+        base_url=f"http://{name}/v1",
+        http_client=httpx.AsyncClient(transport=transport),
+        max_retries=0,
+    )
+    return LLMProvider(name, client, {"*": {}})
+
+
+def healthy(name: str) -> LLMProvider:
+    return make_provider(name, httpx.ASGITransport(app=fake_llm.app))
+
+
+def failing(name: str, status_code: int, calls: list) -> LLMProvider:
+    def handler(request: httpx.Request) -> httpx.Response:
+        calls.append(request)
+        return httpx.Response(status_code, json={"error": {"message": "stub error"}})
+
+    return make_provider(name, httpx.MockTransport(handler))
+
+
+async def test_failover_to_next_provider():
+    calls = []
+    broken, backup = failing("broken", 503, calls), healthy("backup")
+    router = LLMRouter([broken, backup], explore=0.0)
+
+    completion = await router.create(model="m", messages=MESSAGES)
+
+    assert completion.choices[0].message.content == "token0 token1 token2"
+    assert len(calls) == 1
+    assert broken.error_ewma > 0 and not broken.available()
+    assert backup.error_ewma == 0 and backup.available()
+    await router.close()
+
+
+async def test_repeated_5xx_doubles_cooldown_and_demotes_provider():
+    calls = []
+    broken, backup = failing("broken", 503, calls), healthy("backup")
+    router = LLMRouter([broken, backup], explore=0.0)
+
+    await router.create(model="m", messages=MESSAGES)
+    # 暂停中的提供方排在最后；只剩它一个时仍会尝试
+    assert [provider.name for provider, _ in router.candidates("m", False, False)] == ["backup", "broken"]
+    router.providers = [broken]
+    with pytest.raises(openai.InternalServerError):
+        await router.create(model="m", messages=MESSAGES)
+
+    assert broken.failures == 2
+    assert broken.cooldown_until - time.monotonic() > llm_router.LLM_PROVIDER_COOLDOWN * 1.5
+    await router.close()
+
+
+async def test_4xx_is_returned_without_failover_or_penalty():
+    calls = []
+    rejecting, backup = failing("rejecting", 400, calls), healthy("backup")
+    router = LLMRouter([rejecting, backup], explore=0.0)
+
+    with pytest.raises(openai.BadRequestError):
+        await router.create(model="m", messages=MESSAGES)
+
+    assert len(calls) == 1
+    assert backup.requests == 0
+    assert rejecting.error_ewma == 0 and rejecting.failures == 0 and rejecting.available()
+    await router.close()
+
+
+async def test_exploration_skips_providers_in_cooldown():
+    first, second, cooling = healthy("first"), healthy("second"), healthy("cooling")
+    cooling.cooldown_until = time.monotonic() + 60
+    router = LLMRouter([first, second, cooling], explore=1.0)
+
+    for _ in range(50):
+        order = [provider.name for provider, _ in router.candidates("m", False, False)]
+        assert order[0] == "second" and order[-1] == "cooling"
+    await router.close()
+
+
+class _TrackedStream(httpx.AsyncByteStream):
+    """SSE响应体，记录是否被关闭；gate设置后才输出数据"""
+
+    def __init__(self, gate: asyncio.Event):
+        self.gate = gate
+        self.closed = False
+
+    async def __aiter__(self):
+        await self.gate.wait()
+        yield fake_llm._chunk({"role": "assistant", "content": "hello"}).encode()
+        yield fake_llm._chunk({}, "stop").encode()
+        yield b"data: [DONE]\n\n"
+
+    async def aclose(self) -> None:
+        self.closed = True
+
+
+async def test_losing_hedged_stream_is_closed():
+    gate = asyncio.Event()
+    streams = {}
+
+    def streaming(name: str, opens_gate: bool) -> LLMProvider:
+        async def handler(request: httpx.Request) -> httpx.Response:
+            if opens_gate:
+                gate.set()
+            streams[name] = _TrackedStream(gate)
+            return httpx.Response(200, headers={"Content-Type": "text/event-stream"}, stream=streams[name])
+
+        return make_provider(name, httpx.MockTransport(handler))
+
+    # slow只在对冲请求发出后才返回首个数据块，两者几乎同时就绪
+    slow, fast = streaming("slow", False), streaming("fast", True)
+    router = LLMRouter([slow, fast], hedge_delay=0.05, explore=0.0)
+
+    stream = await router.create(model="m", messages=MESSAGES, stream=True)
+    chunks = [chunk async for chunk in stream]
+    await stream.close()
+    await asyncio.sleep(0.05)
+
+    assert [chunk.choices[0].delta.content for chunk in chunks if chunk.choices][0] == "hello"
+    assert streams.keys() == {"slow", "fast"}
+    loser = "fast" if stream.provider.name == "slow" else "slow"
+    assert streams[loser].closed
+    await router.close()
+
@@ -0,0 +1,107 @@
+"""追踪：一轮对话中span的嵌套关系，以及MCP请求_meta中的追踪上下文"""
+
+import sys
+from pathlib import Path
+
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+from fastmcp import Client, FastMCP
+from fastmcp.server.middleware import Middleware
+from mcp.server.lowlevel.server import request_ctx
+from openai import AsyncOpenAI
+
+from app.main import app
+from app.services.llm_client import get_llm_service
+from app.services.mcp_service import _call_tool, _list_tools
+from app.services.tracing import InMemoryExporter, tracer
+from benchmarks import fake_llm
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+@pytest.fixture
+def exporter(monkeypatch):
+    exporter = InMemoryExporter()
+    monkeypatch.setattr(tracer, "exporter", exporter)
+    return exporter
+
+
+def ancestors(span, by_id):
+    names = []
+    while span.parent_id is not None:
+        span = by_id[span.parent_id]
+        names.append(span.name)
+    return names
+
+
+def test_chat_spans_nest_from_llm_to_tool(exporter, monkeypatch):
+    monkeypatch.setenv("ARK_API_KEY", "test")
+    monkeypatch.setitem(fake_llm.settings, "ttft", 0.0)
+    monkeypatch.setitem(fake_llm.settings, "token_delay", 0.0)
+    monkeypatch.setitem(fake_llm.settings, "tool_rounds", 1)
+    monkeypatch.setitem(fake_llm.settings, "tool_calls", 1)
+    server = {"command": sys.executable, "args": [str(ROOT / "benchmarks" / "fake_mcp_server.py"), "--transport", "stdio"]}
+
+    with TestClient(app) as client:
+        llm_client = AsyncOpenAI(
+            api_key="test",
+            base_url="http://fake-llm/v1",
+            http_client=httpx.AsyncClient(transport=httpx.ASGITransport(app=fake_llm.app)),
+        )
+        monkeypatch.setattr(get_llm_service(), "_client", llm_client)
+        response = client.post("/api/chat", json={
+            "messages": [{"role": "user", "content": "echo something"}],
+            "mcp_config": {"mcpServers": {"bench": server}},
+        })
+
+    assert response.status_code == 200
+    spans = exporter.spans()
+    by_id = {span.span_id: span for span in spans}
+    (chat,) = [span for span in spans if span.name == "chat"]
+    assert {span.trace_id for span in spans} == {chat.trace_id}
+
+    llm_spans = [span for span in spans if span.name == "llm.completion"]
+    assert len(llm_spans) == 2
+    for span in llm_spans:
+        assert ancestors(span, by_id) == ["agent.step", "chat"]
+
+    (call,) = [span for span in spans if span.name == "mcp.call_tool"]
+    assert call.attributes["tool"] == "echo"
+    assert ancestors(call, by_id) == ["tool.call", "tools.execute", "agent.step", "chat"]
+
+
+class _RecordMeta(Middleware):
+    """记录每个请求_meta中的traceparent"""
+
+    def __init__(self):
+        self.seen = {}
+
+    async def on_request(self, context, call_next):
+        meta = request_ctx.get().meta
+        self.seen[context.method] = getattr(meta, "traceparent", None) if meta is not None else None
+        return await call_next(context)
+
+
+@pytest.mark.anyio
+async def test_traceparent_is_sent_in_request_meta(exporter):
+    server = FastMCP("traced")
+    recorder = _RecordMeta()
+    server.add_middleware(recorder)
+
+    @server.tool()
+    def echo(text: str) -> str:
+        return text
+
+    async with Client(server) as client:
+        await _list_tools(client)
+        await _call_tool(client, "echo", {"text": "untraced"})
+        assert recorder.seen == {"tools/list": None, "tools/call": None}
+
+        with tracer.span("mcp.call_tool") as span:
+            await _list_tools(client)
+            await _call_tool(client, "echo", {"text": "traced"})
+
+    expected = f"00-{span.trace_id}-{span.span_id}-01"
+    assert span.traceparent == expected
+    assert recorder.seen == {"tools/list": expected, "tools/call": expected}
@@ -0,0 +1,94 @@
+"""weather_service.py的NWS响应缓存与条件请求，使用进程内的mock_nws_server作为替身"""
+
+import httpx
+import pytest
+
+import mock_nws_server
+import weather_service
+
+pytestmark = pytest.mark.anyio
+
+MOCK_BASE = "http://mock-nws"
+
+
+@pytest.fixture(autouse=True)
+async def mock_nws(monkeypatch):
+    """把weather_service的共享客户端指向进程内的替身服务器，并清空两边的状态"""
+    monkeypatch.setattr(weather_service, "NWS_API_BASE", MOCK_BASE)
+    monkeypatch.setattr(weather_service, "shared_cache", None)
+    monkeypatch.setattr(weather_service, "grid_index", weather_service.GridIndex())
+    monkeypatch.setitem(mock_nws_server.settings, "max_age", 60)
+    monkeypatch.setitem(mock_nws_server.settings, "alerts", 3)
+    weather_service._response_cache.clear()
+    for counter in mock_nws_server.stats.values():
+        counter.clear()
+    client = httpx.AsyncClient(transport=httpx.ASGITransport(app=mock_nws_server.app), base_url=MOCK_BASE)
+    monkeypatch.setattr(weather_service, "_client", client)
+    yield
+    await client.aclose()
+    weather_service._response_cache.clear()
+
+
+async def request_counts() -> dict:
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=mock_nws_server.app), base_url=MOCK_BASE) as client:
+        return (await client.get("/_stats")).json()
+
+
+async def test_fresh_response_is_served_from_cache():
+    url = f"{MOCK_BASE}/gridpoints/MOCK/1,1/forecast"
+    first = await weather_service.make_nws_request(url)
+    second = await weather_service.make_nws_request(url)
+
+    assert first == second
+    assert await request_counts() == {"full": {"forecast": 1}, "not_modified": {}}
+
+
+async def test_stale_response_is_revalidated_with_etag(monkeypatch):
+    monkeypatch.setitem(mock_nws_server.settings, "max_age", 0)
+    url = f"{MOCK_BASE}/gridpoints/MOCK/1,1/forecast"
+    first = await weather_service.make_nws_request(url)
+    second = await weather_service.make_nws_request(url)
+    third = await weather_service.make_nws_request(url)
+
+    assert first == second == third
+    assert await request_counts() == {"full": {"forecast": 1}, "not_modified": {"forecast": 2}}
+
+
+async def test_stale_response_is_revalidated_with_last_modified(monkeypatch):
+    monkeypatch.setitem(mock_nws_server.settings, "max_age", 0)
+    url = f"{MOCK_BASE}/gridpoints/MOCK/1,1/forecast"
+    data = await weather_service.make_nws_request(url)
+    # 没有ETag时退回到If-Modified-Since
+    weather_service._response_cache[url].etag = None
+
+    assert await weather_service.make_nws_request(url) == data
+    assert await request_counts() == {"full": {"forecast": 1}, "not_modified": {"forecast": 1}}
+
+
+async def test_points_lookup_is_cached_beyond_max_age(monkeypatch):
+    monkeypatch.setitem(mock_nws_server.settings, "points_max_age", 0)
+    await weather_service.get_forecast(39.7456, -97.0892)
+    # 不同的坐标落在同一网格时不再查询/points，预报仍在max-age内
+    await weather_service.get_forecast(39.7458, -97.0891)
+    weather_service.grid_index = weather_service.GridIndex()
+    await weather_service.get_forecast(39.7456, -97.0892)
+
+    assert await request_counts() == {"full": {"points": 1, "forecast": 1}, "not_modified": {}}
+
+
+async def test_alert_features_are_revalidated(monkeypatch):
+    monkeypatch.setitem(mock_nws_server.settings, "max_age", 0)
+    first = await weather_service.get_alerts("KS")
+    second = await weather_service.get_alerts("KS")
+
+    assert first == second
+    assert first.startswith("Showing alerts 1-3 of 3.")
+    assert await request_counts() == {"full": {"alerts": 1}, "not_modified": {"alerts": 1}}
+
+
+async def test_alert_offset_past_the_end_reports_no_more_alerts():
+    last = await weather_service.get_alerts("KS", offset=2)
+    done = await weather_service.get_alerts("KS", offset=3)
+
+    assert last.startswith("Showing alerts 3-3 of 3.")
+    assert done == "No more alerts: all 3 matching alerts have been shown."
@@ -1,61 +1,555 @@
 from typing import Any
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from email.utils import parsedate_to_datetime
+import asyncio
+import argparse
+import json
+import os
+import sqlite3
+import tempfile
+import time
+import fastapi
 import httpx
+from pydantic import BaseModel
 from mcp.server.fastmcp import FastMCP
 from loguru import logger
 
+from app.services.disk_cache import atomic_write_json
+
 
-mcp = FastMCP("weather", log_level="ERROR")
+# Stateless streamable HTTP keeps no per-session state in the process, so
+# requests can be spread across workers and load-balanced freely.
+mcp = FastMCP("weather", log_level="ERROR", stateless_http=True)
 
-NWS_API_BASE="https://api.weather.gov"
+# NWS_API_BASE can point at a local stand-in server (see mock_nws_server.py)
+NWS_API_BASE = os.environ.get("NWS_API_BASE", "https://api.weather.gov")
 USER_AGENT = "weather-app/1.0"
 
-async def make_nws_request(url:str) ->dict[str, Any] | None:
+# Response cache tuning. /points lookups almost never change, so they are
+# kept for much longer than whatever the NWS headers advertise.
+NWS_CACHE_MAX_ENTRIES = int(os.environ.get("NWS_CACHE_MAX_ENTRIES", "1024"))
+NWS_POINTS_CACHE_TTL = float(os.environ.get("NWS_POINTS_CACHE_TTL", str(7 * 24 * 3600)))
+# SQLite file shared by all worker processes as a second cache tier
+NWS_SHARED_CACHE_PATH = os.environ.get("NWS_SHARED_CACHE_PATH")
+
+# Gridpoint index tuning. NWS forecast cells are ~2.5km wide, so coordinates
+# are rounded to 2 decimals (~1km) before lookup. Set NWS_GRID_INDEX_PATH to
+# keep the index across restarts.
+NWS_GRID_PRECISION = int(os.environ.get("NWS_GRID_PRECISION", "2"))
+NWS_GRID_INDEX_PATH = os.environ.get("NWS_GRID_INDEX_PATH")
+NWS_MAX_CONCURRENCY = int(os.environ.get("NWS_MAX_CONCURRENCY", "8"))
+NWS_BATCH_MAX_LOCATIONS = int(os.environ.get("NWS_BATCH_MAX_LOCATIONS", "50"))
+
+# Alert output bounds: alerts per page, characters kept from each
+# description/instruction, and the overall size of one tool result.
+NWS_ALERTS_PAGE_SIZE = int(os.environ.get("NWS_ALERTS_PAGE_SIZE", "10"))
+NWS_ALERT_TEXT_CHARS = int(os.environ.get("NWS_ALERT_TEXT_CHARS", "300"))
+NWS_ALERTS_MAX_CHARS = int(os.environ.get("NWS_ALERTS_MAX_CHARS", "4000"))
+
+SEVERITY_RANK = {"Extreme": 4, "Severe": 3, "Moderate": 2, "Minor": 1, "Unknown": 0}
+
+_client: httpx.AsyncClient | None = None
+
+
+def get_client() -> httpx.AsyncClient:
+    """
+    Return the module-wide HTTP client, creating it on first use.
+
+    Reusing one client keeps TCP+TLS connections to the NWS API alive
+    between requests instead of handshaking on every call.
+    """
+    global _client
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(
+            headers={
+                "User-Agent": USER_AGENT,
+                "Accept": "application/geo+json",
+            },
+            timeout=30,
+            limits=httpx.Limits(max_connections=100, max_keepalive_connections=20, keepalive_expiry=60),
+        )
+    return _client
+
+
+async def close_client() -> None:
+    """
+    Close the shared HTTP client.
+    """
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+class CachedResponse:
+    """
+    A cached NWS response together with its validators.
+    """
+
+    def __init__(self, data: Any, etag: str | None, last_modified: str | None, ttl: float):
+        self.data = data
+        self.etag = etag
+        self.last_modified = last_modified
+        # Wall-clock time so entries stay meaningful across processes
+        self.expires_at = time.time() + ttl
+
+    def is_fresh(self) -> bool:
+        return time.time() < self.expires_at
+
+
+class SharedCache:
+    """
+    SQLite-backed response cache shared by all worker processes.
+
+    Each worker keeps its own in-memory LRU in front of it; a miss there
+    checks this store before going to the NWS API. Entries stay after they
+    expire so their validators can still be used for revalidation, and
+    are pruned a day later.
+    """
+
+    PRUNE_EVERY = 500
+
+    def __init__(self, path: str):
+        self.path = path
+        self._writes = 0
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, data TEXT, etag TEXT, last_modified TEXT, expires_at REAL)"
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path, timeout=5)
+
+    async def get(self, key: str) -> CachedResponse | None:
+        try:
+            return await asyncio.to_thread(self._get, key)
+        except Exception as e:
+            logger.warning(f"Shared cache read failed: {e=}")
+            return None
+
+    async def put(self, key: str, entry: CachedResponse) -> None:
+        try:
+            await asyncio.to_thread(self._put, key, entry)
+        except Exception as e:
+            logger.warning(f"Shared cache write failed: {e=}")
+
+    def _get(self, key: str) -> CachedResponse | None:
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT data, etag, last_modified, expires_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+        if row is None:
+            return None
+        entry = CachedResponse(json.loads(row[0]), row[1], row[2], 0)
+        entry.expires_at = row[3]
+        return entry
+
+    def _put(self, key: str, entry: CachedResponse) -> None:
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)",
+                (key, json.dumps(entry.data), entry.etag, entry.last_modified, entry.expires_at),
+            )
+            self._writes += 1
+            if self._writes % self.PRUNE_EVERY == 0:
+                conn.execute("DELETE FROM responses WHERE expires_at < ?", (time.time() - 24 * 3600,))
+
+
+_response_cache: "OrderedDict[str, CachedResponse]" = OrderedDict()
+shared_cache = SharedCache(NWS_SHARED_CACHE_PATH) if NWS_SHARED_CACHE_PATH else None
+
+
+def freshness_lifetime(headers: httpx.Headers) -> float | None:
+    """
+    Work out how long a response may be served from cache.
+
+    Returns None when the response must not be stored at all, 0 when it
+    may be stored but has to be revalidated before every use.
+    """
+    directives = {}
+    for part in headers.get("Cache-Control", "").split(","):
+        name, _, value = part.strip().partition("=")
+        if name:
+            directives[name.lower()] = value.strip('"')
+    if "no-store" in directives:
+        return None
+    if "no-cache" in directives:
+        return 0.0
+    for name in ("s-maxage", "max-age"):
+        if name in directives:
+            try:
+                return max(0.0, float(directives[name]))
+            except ValueError:
+                pass
+    expires = headers.get("Expires")
+    if expires:
+        try:
+            expires_at = parsedate_to_datetime(expires)
+            date = parsedate_to_datetime(headers["Date"]) if "Date" in headers else None
+            now = date.timestamp() if date else time.time()
+            return max(0.0, expires_at.timestamp() - now)
+        except (TypeError, ValueError):
+            return 0.0
+    return 0.0
+
+
+def _conditional_headers(cached: CachedResponse | None) -> dict[str, str]:
+    headers = {}
+    if cached is not None:
+        if cached.etag:
+            headers["If-None-Match"] = cached.etag
+        if cached.last_modified:
+            headers["If-Modified-Since"] = cached.last_modified
+    return headers
+
+
+def _store(key: str, entry: CachedResponse) -> None:
+    _response_cache[key] = entry
+    _response_cache.move_to_end(key)
+    while len(_response_cache) > NWS_CACHE_MAX_ENTRIES:
+        _response_cache.popitem(last=False)
+
+
+async def _cache_get(key: str) -> CachedResponse | None:
+    """
+    Return the best cached entry for key, fresh or not.
+    """
+    cached = _response_cache.get(key)
+    if cached is not None and cached.is_fresh():
+        _response_cache.move_to_end(key)
+        return cached
+    if shared_cache is not None:
+        # Another worker may have refreshed it already
+        shared = await shared_cache.get(key)
+        if shared is not None and (cached is None or shared.expires_at > cached.expires_at):
+            _store(key, shared)
+            return shared
+    return cached
+
+
+async def _cache_put(key: str, entry: CachedResponse) -> None:
+    _store(key, entry)
+    if shared_cache is not None:
+        await shared_cache.put(key, entry)
+
+
+async def make_nws_request(url:str, min_ttl: float = 0) ->dict[str, Any] | None:
     """
     Make a request to the NWS API and return the response as a dictionary.
+
+    Responses are cached according to their Cache-Control/Expires headers,
+    or for at least min_ttl seconds. Stale entries are revalidated with
+    If-None-Match/If-Modified-Since, so an unchanged resource costs a 304.
+    """
+    cached = await _cache_get(url)
+    if cached is not None and cached.is_fresh():
+        return cached.data
+
+    try:
+        response = await get_client().get(url, headers=_conditional_headers(cached))
+        lifetime = freshness_lifetime(response.headers)
+
+        if response.status_code == 304 and cached is not None:
+            cached.expires_at = time.time() + max(lifetime or 0.0, min_ttl)
+            await _cache_put(url, cached)
+            return cached.data
+
+        response.raise_for_status()
+        data = response.json()
+        if lifetime is not None:
+            await _cache_put(url, CachedResponse(
+                data,
+                response.headers.get("ETag"),
+                response.headers.get("Last-Modified"),
+                max(lifetime, min_ttl),
+            ))
+        return data
+    except Exception as e:
+        logger.error(f"Error making request to NWS API: {e=}")
+        return None
+
+
+async def iter_json_array(chunks, key: str):
     """
-    headers = {
-        "User-Agent": USER_AGENT,
-        "Accept": "application/geo+json",
+    Incrementally yield the items of the top-level array stored under key.
+
+    Only the text of the item currently being decoded is kept in memory,
+    so a large FeatureCollection never has to be loaded as a whole.
+    """
+    decoder = json.JSONDecoder()
+    marker = f'"{key}"'
+    buffer = ""
+    in_array = False
+    async for chunk in chunks:
+        buffer += chunk
+        if not in_array:
+            start = buffer.find(marker)
+            if start < 0:
+                # Keep a tail in case the key is split across chunks
+                buffer = buffer[-len(marker):]
+                continue
+            bracket = buffer.find("[", start + len(marker))
+            if bracket < 0:
+                buffer = buffer[start:]
+                continue
+            buffer = buffer[bracket + 1:]
+            in_array = True
+        while True:
+            buffer = buffer.lstrip().lstrip(",").lstrip()
+            if not buffer:
+                break
+            if buffer[0] == "]":
+                return
+            try:
+                item, end = decoder.raw_decode(buffer)
+            except json.JSONDecodeError:
+                # Item is incomplete, wait for more data
+                break
+            yield item
+            buffer = buffer[end:]
+
+
+def compact_alert(feature: dict[str, Any]) -> dict[str, Any]:
+    """
+    Keep only the alert fields used for filtering and display.
+    """
+    props = feature.get("properties", {})
+
+    def clip(text: str | None) -> str | None:
+        if text and len(text) > NWS_ALERT_TEXT_CHARS:
+            return text[:NWS_ALERT_TEXT_CHARS].rstrip() + "..."
+        return text
+
+    return {
+        "event": props.get("event"),
+        "areaDesc": props.get("areaDesc"),
+        "severity": props.get("severity"),
+        "headline": props.get("headline"),
+        "description": clip(props.get("description")),
+        "instruction": clip(props.get("instruction")),
     }
-    async with httpx.AsyncClient() as client:
-        try:
-            response = await client.get(url, headers=headers, timeout=30)
+
+
+async def fetch_nws_features(url: str) -> list[dict[str, Any]] | None:
+    """
+    Stream a GeoJSON FeatureCollection and return its features compacted.
+
+    The compacted list is cached with the same Cache-Control and
+    revalidation rules as make_nws_request.
+    """
+    cache_key = f"features:{url}"
+    cached = await _cache_get(cache_key)
+    if cached is not None and cached.is_fresh():
+        return cached.data
+
+    try:
+        async with get_client().stream("GET", url, headers=_conditional_headers(cached)) as response:
+            lifetime = freshness_lifetime(response.headers)
+            if response.status_code == 304 and cached is not None:
+                cached.expires_at = time.time() + (lifetime or 0.0)
+                await _cache_put(cache_key, cached)
+                return cached.data
+
             response.raise_for_status()
-            return response.json()
-        except Exception as e:
-            logger.error(f"Error making request to NWS API: {e=}")
+            alerts = [compact_alert(feature) async for feature in iter_json_array(response.aiter_text(), "features")]
+            if lifetime is not None:
+                await _cache_put(cache_key, CachedResponse(
+                    alerts,
+                    response.headers.get("ETag"),
+                    response.headers.get("Last-Modified"),
+                    lifetime,
+                ))
+            return alerts
+    except Exception as e:
+        logger.error(f"Error making request to NWS API: {e=}")
+        return None
+
+
+class GridIndex:
+    """
+    Maps rounded latitude/longitude to NWS gridpoints and forecast URLs.
+
+    Lookups that miss go through /points once; concurrent misses for the
+    same rounded coordinate share one request. When a path is given the
+    index is loaded from and saved to a JSON file.
+    """
+
+    def __init__(self, path: str | None = None, precision: int = NWS_GRID_PRECISION):
+        self.path = path
+        self.precision = precision
+        self._entries: dict[str, dict[str, Any]] | None = None
+        self._pending: dict[str, asyncio.Future] = {}
+
+    def key(self, latitude: float, longitude: float) -> str:
+        return f"{round(latitude, self.precision):.{self.precision}f},{round(longitude, self.precision):.{self.precision}f}"
+
+    async def resolve(self, latitude: float, longitude: float) -> dict[str, Any] | None:
+        """
+        Return {"grid": "OFFICE/X,Y", "forecast": url} for a location, or None.
+        """
+        if self._entries is None:
+            self._entries = await asyncio.to_thread(self._load)
+        key = self.key(latitude, longitude)
+        entry = self._entries.get(key)
+        if entry is not None:
+            return entry
+
+        pending = self._pending.get(key)
+        if pending is not None:
+            return await asyncio.shield(pending)
+        future = asyncio.get_running_loop().create_future()
+        self._pending[key] = future
+        try:
+            entry = await self._lookup(key)
+            future.set_result(entry)
+        except BaseException as e:
+            future.set_exception(e)
+            future.exception()
+            raise
+        finally:
+            self._pending.pop(key, None)
+
+        if entry is not None:
+            self._entries[key] = entry
+            if self.path:
+                await asyncio.to_thread(self._save, dict(self._entries))
+        return entry
+
+    async def _lookup(self, key: str) -> dict[str, Any] | None:
+        points_data = await make_nws_request(f"{NWS_API_BASE}/points/{key}", min_ttl=NWS_POINTS_CACHE_TTL)
+        props = (points_data or {}).get("properties", {})
+        forecast_url = props.get("forecast")
+        if not forecast_url:
             return None
+        grid = f"{props.get('gridId')}/{props.get('gridX')},{props.get('gridY')}"
+        return {"grid": grid, "forecast": forecast_url}
 
+    def _load(self) -> dict[str, dict[str, Any]]:
+        if not self.path or not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except Exception as e:
+            logger.warning(f"Unable to load gridpoint index {self.path}: {e=}")
+            return {}
 
-async def format_alert(feature:dict)->str:
+    def _save(self, entries: dict[str, dict[str, Any]]) -> None:
+        # Merge with what other workers have written since we loaded
+        entries = {**self._load(), **entries}
+        try:
+            atomic_write_json(self.path, entries)
+        except Exception as e:
+            logger.warning(f"Unable to save gridpoint index {self.path}: {e=}")
+
+
+grid_index = GridIndex(NWS_GRID_INDEX_PATH)
+
+
+def format_periods(periods: list[dict[str, Any]]) -> str:
     """
-    Format a weather alert into a string.
+    Format forecast periods into a string.
+    """
+    forecasts = []
+    for period in periods:
+        forecast = f"""
+{period.get("name", "Unknown period")}:
+Temperature: {period.get("temperature", "Unknown temperature")} {period.get("temperatureUnit", "Unknown unit")}
+Wind: {period.get("windSpeed", "Unknown wind speed")} {period.get("windDirection", "Unknown wind direction")}
+Forecast: {period.get("detailedForecast", "No forecast available")}
+"""
+        forecasts.append(forecast)
+    return "\n---\n".join(forecasts)
+
+
+def format_alert(alert:dict)->str:
+    """
+    Format a compacted weather alert into a string.
     """
-    props = feature["properties"]
     return f"""
-Event: {props.get("event", "Unknown event")}
-Area: {props.get("areaDesc", "Unknown area")}
-Severity: {props.get("severity", "Unknown severity")}
-Description: {props.get("description", "No description available")}
-Instruction: {props.get("instruction", "No instruction available")}
+Event: {alert.get("event") or "Unknown event"}
+Area: {alert.get("areaDesc") or "Unknown area"}
+Severity: {alert.get("severity") or "Unknown severity"}
+Description: {alert.get("description") or "No description available"}
+Instruction: {alert.get("instruction") or "No instruction available"}
 """
 
+
+def dedupe_alerts(alerts: list[dict[str, Any]]) -> list[dict[str, Any]]:
+    """
+    Merge alerts that differ only by area, which NWS issues once per zone.
+    """
+    merged: dict[tuple, dict[str, Any]] = {}
+    for alert in alerts:
+        text = " ".join((alert.get("description") or alert.get("headline") or "").lower().split())
+        key = (alert.get("event"), alert.get("severity"), text[:200])
+        existing = merged.get(key)
+        if existing is None:
+            merged[key] = dict(alert)
+        elif alert.get("areaDesc") and alert["areaDesc"] not in (existing.get("areaDesc") or ""):
+            existing["areaDesc"] = "; ".join(filter(None, [existing.get("areaDesc"), alert["areaDesc"]]))
+    return list(merged.values())
+
+
 @mcp.tool()
-async def get_alerts(state:str) ->str:
+async def get_alerts(
+    state:str,
+    severity: str | None = None,
+    event: str | None = None,
+    area: str | None = None,
+    offset: int = 0,
+) ->str:
     """
     Get weather alerts for a given state.
+
+    Optional filters: minimum severity (Extreme, Severe, Moderate, Minor),
+    text contained in the event name, text contained in the area.
+    Results are ordered by severity and paginated; pass the offset given at
+    the top of the previous result to see more.
     """
     url = f"{NWS_API_BASE}/alerts/active/area/{state}"
-    data = await make_nws_request(url)
-    if not data or "features" not in data:
+    alerts = await fetch_nws_features(url)
+    if alerts is None:
         return "Unable to fetch alerts or no alerts found."
-    features = data.get("features", [])
-    if not features:
+    if not alerts:
         return "No active alerts for this state."
-    
-   
-    alerts = [await format_alert(feature) for feature in features]
-    return "\n---\n".join(alerts)
+
+    min_rank = SEVERITY_RANK.get((severity or "").capitalize(), 0)
+    matched = [
+        alert for alert in alerts
+        if SEVERITY_RANK.get(alert.get("severity") or "Unknown", 0) >= min_rank
+        and (not event or event.lower() in (alert.get("event") or "").lower())
+        and (not area or area.lower() in (alert.get("areaDesc") or "").lower())
+    ]
+    if not matched:
+        return "No active alerts match the given filters."
+
+    matched = dedupe_alerts(matched)
+    matched.sort(key=lambda alert: SEVERITY_RANK.get(alert.get("severity") or "Unknown", 0), reverse=True)
+
+    start = max(0, offset)
+    if start >= len(matched):
+        return f"No more alerts: all {len(matched)} matching alerts have been shown."
+
+    def render(sections: list[str]) -> str:
+        end = start + len(sections)
+        header = f"Showing alerts {start + 1}-{end} of {len(matched)}."
+        if end < len(matched):
+            header += f" Use offset={end} for more."
+        return header + "\n" + "\n---\n".join(sections)
+
+    # Stop adding alerts once the whole result, header included, would exceed
+    # the size budget; the next offset starts at the first alert not shown
+    sections = [format_alert(matched[start])]
+    for alert in matched[start + 1:start + max(1, NWS_ALERTS_PAGE_SIZE)]:
+        text = format_alert(alert)
+        if len(render(sections + [text])) > NWS_ALERTS_MAX_CHARS:
+            break
+        sections.append(text)
+    return render(sections)
 
 
 @mcp.tool()
@@ -63,34 +557,95 @@ async def get_forecast(latitude: float, longitude: float) -> str:
     """
     Get the weather forecast for a given latitude and longitude.
     """
-    points_url = f"{NWS_API_BASE}/points/{latitude},{longitude}"
-    points_data = await make_nws_request(points_url)
-    if not points_data:
+    gridpoint = await grid_index.resolve(latitude, longitude)
+    if not gridpoint:
         return "Unable to fetch forecast data for this location."
     
-    forecast_url = points_data.get("properties", {}).get("forecast")
-    forcast_data = await make_nws_request(forecast_url)
+    forcast_data = await make_nws_request(gridpoint["forecast"])
     if not forcast_data:
         return "Unable to fetch forecast data for this location."
     
     periods = forcast_data.get("properties", {}).get("periods", [])
-    forecasts = []
-    for period in periods[:5]:
-        forecast = f"""
-{period.get("name", "Unknown period")}:
-Temperature: {period.get("temperature", "Unknown temperature")} {period.get("temperatureUnit", "Unknown unit")}
-Wind: {period.get("windSpeed", "Unknown wind speed")} {period.get("windDirection", "Unknown wind direction")}
-Forecast: {period.get("detailedForecast", "No forecast available")}
-"""
-        forecasts.append(forecast)
-    return "\n---\n".join(forecasts)
+    return format_periods(periods[:5])
 
-import fastapi
 
-app = fastapi.FastAPI()
+class Location(BaseModel):
+    latitude: float
+    longitude: float
+    name: str | None = None
+
+
+@mcp.tool()
+async def get_forecasts(locations: list[Location], periods: int = 2) -> str:
+    """
+    Get weather forecasts for many locations in one call.
+
+    Use this instead of calling get_forecast repeatedly, e.g. to compare
+    the weather in several cities. Locations that fall in the same NWS
+    grid cell share a single forecast request.
+    """
+    locations = locations[:NWS_BATCH_MAX_LOCATIONS]
+    semaphore = asyncio.Semaphore(max(1, NWS_MAX_CONCURRENCY))
+
+    async def bounded(coro):
+        async with semaphore:
+            return await coro
+
+    gridpoints = await asyncio.gather(*(
+        bounded(grid_index.resolve(location.latitude, location.longitude)) for location in locations
+    ), return_exceptions=True)
 
+    # Fetch each distinct gridpoint forecast once
+    forecast_urls = sorted({gp["forecast"] for gp in gridpoints if isinstance(gp, dict)})
+    responses = await asyncio.gather(*(bounded(make_nws_request(url)) for url in forecast_urls))
+    forecasts = dict(zip(forecast_urls, responses))
+
+    sections = []
+    for location, gridpoint in zip(locations, gridpoints):
+        title = location.name or f"{location.latitude}, {location.longitude}"
+        data = forecasts.get(gridpoint["forecast"]) if isinstance(gridpoint, dict) else None
+        if not data:
+            sections.append(f"## {title}\nUnable to fetch forecast data for this location.")
+            continue
+        location_periods = data.get("properties", {}).get("periods", [])[:max(1, periods)]
+        sections.append(f"## {title}\n{format_periods(location_periods)}")
+    return "\n\n".join(sections)
+
+
+@asynccontextmanager
+async def lifespan(app: fastapi.FastAPI):
+    async with mcp.session_manager.run():
+        yield
+    await close_client()
+
+
+app = fastapi.FastAPI(lifespan=lifespan)
+
+# Streamable HTTP at /mcp, SSE (/sse, /messages/) for existing clients
+app.router.routes.extend(mcp.streamable_http_app().routes)
 app.mount("/", mcp.sse_app())
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="127.0.0.1", port=8000)
\ No newline at end of file
+
+    parser = argparse.ArgumentParser(description="Weather MCP server")
+    parser.add_argument("--host", default="127.0.0.1", help="Host to bind")
+    parser.add_argument("--port", type=int, default=8000, help="Port to bind")
+    parser.add_argument("--workers", type=int, default=1, help="Number of worker processes")
+    parser.add_argument("--cache-path", default=NWS_SHARED_CACHE_PATH, help="SQLite file for the cache shared by workers")
+    args = parser.parse_args()
+
+    # Workers re-import this module, so pass settings through the environment
+    cache_path = args.cache_path
+    if args.workers > 1 and not cache_path:
+        cache_path = os.path.join(tempfile.gettempdir(), "weather_service_cache.sqlite")
+    if cache_path:
+        os.environ["NWS_SHARED_CACHE_PATH"] = cache_path
+
+    if args.workers > 1:
+        logger.warning("SSE sessions are bound to one worker; use /mcp (streamable HTTP) or sticky sessions behind a load balancer")
+        uvicorn.run("weather_service:app", host=args.host, port=args.port, workers=args.workers)
+    else:
+        if cache_path and shared_cache is None:
+            shared_cache = SharedCache(cache_path)
+        uvicorn.run(app, host=args.host, port=args.port)